@@ -0,0 +1,12 @@
+import os
+import sys
+
+# 添加当前目录到系统路径最前面，确保使用本目录中的模块(仓库根目录下有同名的旧版 terrain_app.py)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if sys.path[:1] != [current_dir]:
+    sys.path.insert(0, current_dir)
+
+from cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+import io
+import os
+import sys
+import time
+import shutil
+import platform
+import tempfile
+import statistics
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 添加当前目录到系统路径最前面，确保使用本目录中的模块(仓库根目录下有同名的旧版 terrain_app.py)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if sys.path[:1] != [current_dir]:
+    sys.path.insert(0, current_dir)
+
+from utils.raster_io import RasterSource, get_gdal, to_uint8
+
+# 合成图像支持的数据类型
+BENCH_DTYPES = ('uint8', 'uint16', 'int16', 'float32')
+
+# 合成标注的标签和颜色
+BENCH_LABELS = {"水体": "#0000FF", "植被": "#00FF00", "建筑": "#FF0000", "道路": "#FFFF00", "裸地": "#A0522D"}
+
+# 各阶段的执行顺序
+STAGES = ('open', 'read', 'normalize', 'colormap', 'render', 'qimage', 'load', 'zoom', 'annotation_redraw',
+          'crop_save')
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def memory_usage():
+    """
+    当前进程的内存占用
+
+    返回:
+        (当前RSS, 峰值RSS)，单位MB，无法获取时为None
+    """
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位为KB，macOS 上为字节
+        peak = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    current = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    return current, peak
+
+
+def synthetic_bands(width, height, bands, dtype, seed=0):
+    """
+    生成带梯度、周期纹理和噪声的合成波段
+
+    返回:
+        (height, width, bands) 数组
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    data = np.empty((height, width, bands), dtype=dtype)
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        info = np.iinfo(dtype)
+        # 有符号整数模拟高程，只使用一部分取值范围，拉伸才有意义
+        low, high = (0, info.max) if info.min == 0 else (-500, 4000)
+    else:
+        low, high = -1.0, 1.0
+    for band in range(bands):
+        value = (np.sin(xx / (37 + 11 * band)) * np.cos(yy / (53 + 7 * band)) + 1) / 2
+        value = 0.6 * value + 0.3 * (xx + yy * (band + 1)) / (width + height * (band + 1))
+        value += 0.1 * rng.random((height, width), dtype=np.float32)
+        data[:, :, band] = (low + value * (high - low)).astype(dtype)
+    return data
+
+
+def jet_palette():
+    """256色的jet调色板，(256, 3) uint8"""
+    from utils.render import apply_colormap_jet
+    return apply_colormap_jet(np.arange(256, dtype=np.uint8)[None, :])[0]
+
+
+def write_synthetic_raster(path, width, height, bands=3, dtype='uint8', palette=False, seed=0):
+    """
+    生成合成测试图像
+
+    GeoTIFF 使用GDAL写入(分块、带地理参考，调色板图像带颜色表)；GDAL不可用时以及PNG使用PIL，
+    PIL只能写入 uint8 的1、3、4波段以及单波段的 uint16/int16/float32 图像。
+
+    参数:
+        path: 输出路径(.tif/.tiff/.png)
+        width, height: 图像大小
+        bands: 波段数
+        dtype: 数据类型，见 BENCH_DTYPES
+        palette: 是否写为带调色板的单波段图像(要求 uint8、单波段)
+        seed: 噪声的随机种子
+
+    返回:
+        输出路径
+    """
+    if dtype not in BENCH_DTYPES:
+        raise ValueError(f"不支持的数据类型: {dtype}")
+    if palette and (bands != 1 or dtype != 'uint8'):
+        raise ValueError("调色板图像必须是 uint8 单波段")
+    data = synthetic_bands(width, height, bands, dtype, seed)
+    gdal = get_gdal()
+    if gdal is not None and path.lower().endswith(('.tif', '.tiff')):
+        from osgeo import gdal_array, osr
+        driver = gdal.GetDriverByName('GTiff')
+        type_code = gdal_array.NumericTypeCodeToGDALTypeCode(np.dtype(dtype))
+        dataset = driver.Create(path, width, height, bands, type_code, options=['TILED=YES', 'BIGTIFF=IF_SAFER'])
+        dataset.SetGeoTransform((500000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0))
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32650)
+        dataset.SetProjection(srs.ExportToWkt())
+        for band in range(bands):
+            dataset.GetRasterBand(band + 1).WriteArray(data[:, :, band])
+        if palette:
+            table = gdal.ColorTable()
+            for index, color in enumerate(jet_palette().tolist()):
+                table.SetColorEntry(index, tuple(color) + (255,))
+            dataset.GetRasterBand(1).SetRasterColorTable(table)
+            dataset.GetRasterBand(1).SetRasterColorInterpretation(gdal.GCI_PaletteIndex)
+        elif bands >= 3:
+            for band, interpretation in enumerate([gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]):
+                dataset.GetRasterBand(band + 1).SetRasterColorInterpretation(interpretation)
+        dataset.FlushCache()
+        dataset = None
+        return path
+
+    from PIL import Image
+    if palette:
+        image = Image.fromarray(data[:, :, 0], 'P')
+        image.putpalette(jet_palette().ravel().tolist())
+    elif dtype == 'uint8' and bands in (1, 3, 4):
+        image = Image.fromarray(data if bands > 1 else data[:, :, 0], {1: 'L', 3: 'RGB', 4: 'RGBA'}[bands])
+    elif bands == 1 and dtype == 'uint16':
+        image = Image.fromarray(data[:, :, 0])
+    elif bands == 1 and dtype in ('int16', 'float32'):
+        # PIL 没有可写入TIFF的有符号16位模式，以32位整数写入
+        image = Image.fromarray(data[:, :, 0].astype(np.int32) if dtype == 'int16' else data[:, :, 0])
+    else:
+        raise ValueError(f"没有GDAL时无法生成 {bands} 波段 {dtype} 的图像")
+    image.save(path)
+    return path
+
+
+class StageTimer:
+    """记录各阶段每次运行的耗时和运行后的内存占用"""
+
+    def __init__(self):
+        self.runs = {}  # {阶段: [秒, ...]}
+        self.memory = {}  # {阶段: (当前RSS, 峰值RSS)}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """计时一个阶段，阶段内的标准输出被丢弃(加载函数会打印调试信息)"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        self.runs.setdefault(name, []).append(elapsed)
+        self.memory[name] = memory_usage()
+
+    def summary(self):
+        """各阶段的统计结果"""
+        stages = {}
+        for name, runs in self.runs.items():
+            current, peak = self.memory[name]
+            stages[name] = {
+                'runs': [round(value, 6) for value in runs],
+                'min': round(min(runs), 6),
+                'median': round(statistics.median(runs), 6),
+                'mean': round(statistics.fmean(runs), 6),
+                'rss_mb': None if current is None else round(current, 1),
+                'peak_rss_mb': None if peak is None else round(peak, 1),
+            }
+        return stages
+
+
+def synthetic_polygons(width, height, count, seed=0):
+    """
+    生成随机的星形多边形
+
+    返回:
+        [(points, label, color), ...]
+    """
+    rng = np.random.default_rng(seed)
+    labels = list(BENCH_LABELS.items())
+    polygons = []
+    for index in range(count):
+        vertices = int(rng.integers(6, 40))
+        radius = float(rng.uniform(4, max(8, min(width, height) / 20)))
+        cx, cy = rng.uniform(radius, width - radius), rng.uniform(radius, height - radius)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radii = radius * rng.uniform(0.5, 1.0, vertices)
+        points = np.stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)], axis=1)
+        label, color = labels[index % len(labels)]
+        polygons.append((points, label, color))
+    return polygons
+
+
+def run_pipeline_stages(timer, path, app, zooms, polygons, crop_dir):
+    """
+    按界面中的顺序运行一次完整流程的各阶段
+
+    参数:
+        timer: StageTimer
+        path: 测试图像路径
+        app: TerrainApp
+        zooms: 缩放阶段依次应用的缩放比例
+        polygons: annotation_redraw 阶段使用的多边形
+        crop_dir: crop_save 阶段的输出目录
+    """
+    from PyQt5.QtCore import QRect
+    from PyQt5.QtGui import QPixmap
+    from modules.image_import import apply_colormap_jet_vectorized
+    from utils.band_cache import display_band_cache
+    from utils.image_processing import array_to_qimage
+    from utils.render import display_bands, render_display_array
+
+    with timer.stage('open'):
+        source = RasterSource(path)
+    try:
+        bands = display_bands(source)
+        with timer.stage('read'):
+            raw = [source.read_band(band) for band in bands]
+        with timer.stage('normalize'):
+            ranges = [source.band_range(band) for band in bands]
+            gray = [to_uint8(array, low, high) for array, (low, high) in zip(raw, ranges)]
+    finally:
+        source.close()
+    with timer.stage('colormap'):
+        apply_colormap_jet_vectorized(gray[0])
+    del raw, gray
+
+    # 每次运行前清空显示波段缓存，测量的是第一次打开图像的耗时
+    display_band_cache.clear()
+    with timer.stage('render'):
+        rgb = render_display_array(path)
+    with timer.stage('qimage'):
+        QPixmap.fromImage(array_to_qimage(rgb))
+    del rgb
+
+    display_band_cache.clear()
+    with timer.stage('load'):
+        app.file_operations.load_image(path)
+
+    with timer.stage('zoom'):
+        for zoom in zooms:
+            app.zoom_controller.zoom_factor = zoom
+            app.zoom_controller.apply_zoom()
+    app.zoom_controller.zoom_factor = 1.0
+
+    handler = app.annotation_handler
+    handler.polygons.clear()
+    handler.polygons.extend(polygons)
+    with timer.stage('annotation_redraw'):
+        handler.draw_annotations()
+
+    image = app.image_handler.backup_image
+    image_handler = app.image_handler
+    image_handler.crop_rect = QRect(image.width() // 4, image.height() // 4,
+                                    max(1, image.width() // 2), max(1, image.height() // 2))
+    with timer.stage('crop_save'):
+        image_handler.confirm_crop()
+    for name in os.listdir(crop_dir):
+        file_path = os.path.join(crop_dir, name)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+def _generate(path, width, height, bands, dtype, palette):
+    """在子进程中生成测试图像，生成时的内存占用不计入基准进程的峰值RSS"""
+    write_synthetic_raster(path, width, height, bands, dtype, palette)
+    return os.path.getsize(path)
+
+
+def run_benchmark(width=4096, height=4096, bands=3, dtype='uint8', palette=False, image_format='tif',
+                  repeat=3, polygons=2000, zooms=(0.25, 0.5, 1.0, 2.0), work_dir=None):
+    """
+    生成合成图像并测量图像处理流程各阶段的耗时
+
+    参数:
+        width, height, bands, dtype, palette: 合成图像参数
+        image_format: 'tif' 或 'png'
+        repeat: 每个阶段的运行次数
+        polygons: 标注重绘阶段的多边形数量
+        zooms: 缩放阶段依次应用的缩放比例
+        work_dir: 工作目录，None表示使用临时目录并在结束后删除
+
+    返回:
+        结果字典(可直接写为JSON)
+    """
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix="terrain_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, f"bench_{width}x{height}_{bands}b_{dtype}{'_palette' if palette else ''}.{image_format}")
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            file_size = pool.submit(_generate, path, width, height, bands, dtype, palette).result()
+
+        # 没有显示器时使用离屏平台
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5 import QtCore
+        from PyQt5.QtWidgets import QApplication
+        qt_app = QApplication.instance() or QApplication([])
+        with contextlib.redirect_stdout(io.StringIO()):
+            from terrain_app import TerrainApp
+            app = TerrainApp()
+        # 裁剪结果和标注写入工作目录，不影响界面使用的目录
+        crop_dir = os.path.join(work_dir, "cropped")
+        os.makedirs(crop_dir, exist_ok=True)
+        app.cropped_dir = app.file_operations.cropped_dir = crop_dir
+        app.annotation_handler.annotations_dir = os.path.join(work_dir, "annotations")
+
+        polygon_list = synthetic_polygons(width, height, polygons)
+        baseline_rss = memory_usage()
+        timer = StageTimer()
+        for _ in range(repeat):
+            run_pipeline_stages(timer, path, app, zooms, polygon_list, crop_dir)
+            qt_app.processEvents()
+        app.close()
+
+        current, peak = memory_usage()
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'config': {
+                'width': width, 'height': height, 'bands': bands, 'dtype': dtype, 'palette': palette,
+                'format': image_format, 'file_size_mb': round(file_size / 1024 / 1024, 2),
+                'repeat': repeat, 'polygons': polygons, 'zooms': list(zooms),
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': np.__version__,
+                'qt': QtCore.QT_VERSION_STR,
+                'gdal': get_gdal() is not None,
+                'qt_platform': os.environ.get("QT_QPA_PLATFORM"),
+                'cpu_count': os.cpu_count(),
+            },
+            'stages': timer.summary(),
+            'baseline_rss_mb': None if baseline_rss[0] is None else round(baseline_rss[0], 1),
+            'rss_mb': None if current is None else round(current, 1),
+            'peak_rss_mb': None if peak is None else round(peak, 1),
+        }
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def compare_results(baseline, result):
+    """
+    比较两次运行的各阶段中位耗时
+
+    返回:
+        [(阶段, 基准秒数, 当前秒数, 当前/基准), ...]，只包含两次都有的阶段
+    """
+    rows = []
+    for name in STAGES:
+        old = baseline.get('stages', {}).get(name)
+        new = result.get('stages', {}).get(name)
+        if old is None or new is None:
+            continue
+        ratio = new['median'] / old['median'] if old['median'] > 0 else float('inf')
+        rows.append((name, old['median'], new['median'], ratio))
+    return rows
+
+
+def format_summary(result, baseline=None):
+    """生成便于阅读的结果表格"""
+    config = result['config']
+    lines = [f"{config['width']}x{config['height']} {config['bands']}波段 {config['dtype']}"
+             f"{' 调色板' if config['palette'] else ''} .{config['format']}，运行 {config['repeat']} 次"]
+    comparison = {name: ratio for name, _, _, ratio in compare_results(baseline, result)} if baseline else {}
+    lines.append(f"{'阶段':<18}{'中位(ms)':>12}{'最小(ms)':>12}{'峰值RSS(MB)':>14}" + ("    对比基准" if baseline else ""))
+    for name in STAGES:
+        stage = result['stages'].get(name)
+        if stage is None:
+            continue
+        line = f"{name:<18}{stage['median'] * 1000:>12.1f}{stage['min'] * 1000:>12.1f}{stage['peak_rss_mb'] or 0:>14.1f}"
+        if name in comparison:
+            line += f"    x{comparison[name]:.2f}"
+        lines.append(line)
+    lines.append(f"峰值RSS: {result['peak_rss_mb']} MB")
+    return "\n".join(lines)
@@ -0,0 +1,273 @@
+import os
+import sys
+import argparse
+
+# 添加当前目录到系统路径最前面，确保使用本目录中的模块(仓库根目录下有同名的旧版 terrain_app.py)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if sys.path[:1] != [current_dir]:
+    sys.path.insert(0, current_dir)
+
+# 启动计时从这里开始，需要在其他模块之前导入
+from utils.startup import startup
+from utils.batch import list_rasters, load_class_names, run_batch
+
+# 默认的标注目录(与界面共用)
+DEFAULT_ANNOTATIONS_DIR = os.path.join(current_dir, "annotations")
+
+# 默认的裁剪图像目录(与界面共用)
+DEFAULT_CROPPED_DIR = os.path.join(current_dir, "cropped")
+
+# 默认的分块缓存和缩略图目录(与界面共用)
+DEFAULT_CACHE_DIR = os.path.join(current_dir, "cache", "tiles")
+DEFAULT_THUMBNAIL_DIR = os.path.join(current_dir, "cache", "thumbnails")
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="python -m terrain_recognition_app",
+                                     description="地形识别工具；不带子命令时启动图形界面")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="启动图形界面，输出从启动到首次绘制和后台加载完成的各阶段耗时后退出")
+    commands = parser.add_subparsers(dest="command")
+
+    batch = commands.add_parser("batch", help="不启动界面，用进程池批量处理GeoTIFF目录")
+    operations = batch.add_subparsers(dest="operation", required=True)
+
+    def add_operation(name, help_text):
+        sub = operations.add_parser(name, help=help_text)
+        sub.add_argument("input", help="输入目录或单个文件")
+        sub.add_argument("output", help="输出目录")
+        sub.add_argument("--workers", type=int, default=None, help="工作进程数，默认为CPU核数")
+        sub.add_argument("--ext", nargs="+", default=[".tif", ".tiff"], help="输入目录中要处理的扩展名")
+        return sub
+
+    convert = add_operation("convert", "转换为显示用的PNG(与界面导入的拉伸方式一致)")
+    convert.add_argument("--colormap", action="store_true", help="单波段图像使用jet伪彩色")
+
+    chip = add_operation("chip", "按网格切分为PNG小图，并裁剪对应的标注")
+    chip.add_argument("--size", type=int, default=512, help="小图大小(像素)")
+    chip.add_argument("--overlap", type=int, default=0, help="相邻小图的重叠像素数")
+    chip.add_argument("--annotations", default=DEFAULT_ANNOTATIONS_DIR, help="标注目录")
+    chip.add_argument("--no-annotations", action="store_true", help="不处理标注")
+
+    rasterize = add_operation("rasterize", "将标注多边形栅格化为类别栅格")
+    rasterize.add_argument("--annotations", default=DEFAULT_ANNOTATIONS_DIR, help="标注目录")
+
+    add_operation("stats", "统计各波段的最小值、最大值、均值和标准差，写入 stats.csv")
+
+    ingest = commands.add_parser("ingest", help="监视目录，预先为新到达的图像生成金字塔、统计量、显示分块和缩略图")
+    ingest.add_argument("directory", help="监视的目录")
+    ingest.add_argument("--workers", type=int, default=2, help="工作进程数")
+    ingest.add_argument("--settle", type=float, default=5.0, help="文件保持不变多少秒后认为写入完成")
+    ingest.add_argument("--interval", type=float, default=2.0, help="扫描间隔(秒)")
+    ingest.add_argument("--once", action="store_true", help="处理完目录中已有的文件后退出")
+    ingest.add_argument("--ext", nargs="+", default=[".tif", ".tiff"], help="要处理的扩展名")
+    ingest.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="分块缓存目录")
+    ingest.add_argument("--thumbnails", default=DEFAULT_THUMBNAIL_DIR, help="缩略图目录")
+
+    serve = commands.add_parser("serve", help="启动本地XYZ瓦片服务，在浏览器或QGIS中查看图像和标注")
+    serve.add_argument("paths", nargs="*", default=[DEFAULT_CROPPED_DIR], help="图像文件或目录，默认为裁剪目录")
+    serve.add_argument("--host", default="127.0.0.1", help="监听地址")
+    serve.add_argument("--port", type=int, default=8765, help="监听端口")
+    serve.add_argument("--annotations", default=DEFAULT_ANNOTATIONS_DIR, help="标注目录")
+    serve.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="磁盘瓦片缓存目录")
+    serve.add_argument("--no-disk-cache", action="store_true", help="只使用内存缓存")
+    serve.add_argument("--memory", type=int, default=256, help="内存瓦片缓存大小(MB)")
+    serve.add_argument("--verbose", action="store_true", help="记录每个请求")
+
+    bench = commands.add_parser("bench", help="用合成图像测量图像处理流程各阶段的耗时和峰值内存")
+    bench.add_argument("--width", type=int, default=4096, help="合成图像宽度")
+    bench.add_argument("--height", type=int, default=4096, help="合成图像高度")
+    bench.add_argument("--bands", type=int, default=3, help="波段数")
+    bench.add_argument("--dtype", choices=["uint8", "uint16", "int16", "float32"], default="uint8", help="数据类型")
+    bench.add_argument("--palette", action="store_true", help="生成带调色板的单波段图像")
+    bench.add_argument("--format", choices=["tif", "png"], default="tif", help="图像格式")
+    bench.add_argument("--repeat", type=int, default=3, help="每个阶段的运行次数")
+    bench.add_argument("--polygons", type=int, default=2000, help="标注重绘阶段的多边形数量")
+    bench.add_argument("--zooms", type=float, nargs="+", default=[0.25, 0.5, 1.0, 2.0], help="缩放阶段的缩放比例")
+    bench.add_argument("--output", help="结果JSON文件，默认输出到标准输出")
+    bench.add_argument("--compare", help="与之前的结果JSON比较各阶段的中位耗时")
+    bench.add_argument("--work-dir", help="保留合成图像的工作目录，默认使用临时目录")
+    return parser
+
+
+def operation_kwargs(args):
+    """根据命令行参数生成批处理操作的参数"""
+    if args.operation == "convert":
+        return {'output_dir': args.output, 'colormap': args.colormap}
+    if args.operation == "chip":
+        return {'output_dir': args.output, 'chip_size': args.size, 'overlap': args.overlap,
+                'annotations_dir': None if args.no_annotations else args.annotations}
+    if args.operation == "rasterize":
+        class_names = load_class_names(args.annotations)
+        if not class_names:
+            raise ValueError(f"标注目录中没有标签文件 labels.json: {args.annotations}")
+        return {'output_dir': args.output, 'annotations_dir': args.annotations, 'class_names': class_names}
+    return {}
+
+
+def write_stats(results, output_dir):
+    """将统计结果写入 stats.csv"""
+    import csv
+    path = os.path.join(output_dir, "stats.csv")
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "width", "height", "band", "min", "max", "mean", "std", "valid"])
+        for file_path, result, error in results:
+            if error:
+                continue
+            for band in result['bands']:
+                writer.writerow([os.path.basename(file_path), result['width'], result['height'], band['band'],
+                                 band['min'], band['max'], band['mean'], band['std'], band['valid']])
+    return path
+
+
+def run_batch_command(args):
+    """
+    执行 batch 子命令
+
+    返回:
+        进程退出码：全部成功为0，有文件出错为1
+    """
+    paths = list_rasters(args.input, tuple(ext.lower() for ext in args.ext))
+    if not paths:
+        print(f"没有找到要处理的文件: {args.input}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    kwargs = operation_kwargs(args)
+
+    def report(done, total, path, result, error):
+        name = os.path.basename(path)
+        if error:
+            print(f"[{done}/{total}] 失败 {name}: {error}", file=sys.stderr, flush=True)
+        else:
+            print(f"[{done}/{total}] 完成 {name}", flush=True)
+
+    results = run_batch(args.operation, paths, workers=args.workers, progress=report, **kwargs)
+    if args.operation == "stats":
+        print(f"统计结果已写入 {write_stats(results, args.output)}")
+
+    errors = [(path, error) for path, _, error in results if error]
+    print(f"{args.operation}: 成功 {len(results) - len(errors)} 个，失败 {len(errors)} 个")
+    for path, error in errors:
+        print(f"  {path}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def run_ingest_command(args):
+    """
+    执行 ingest 子命令
+
+    返回:
+        进程退出码：没有失败为0，有文件出错为1
+    """
+    from utils.ingest import run_ingest
+
+    if not os.path.isdir(args.directory):
+        print(f"目录不存在: {args.directory}", file=sys.stderr)
+        return 2
+
+    def log(message):
+        print(message, flush=True)
+
+    succeeded, failed = run_ingest(args.directory, args.cache, args.thumbnails, workers=args.workers,
+                                   settle=args.settle, interval=args.interval, once=args.once,
+                                   extensions=tuple(args.ext), log=log)
+    print(f"ingest: 成功 {succeeded} 个，失败 {failed} 个")
+    return 1 if failed else 0
+
+
+def run_serve_command(args):
+    """
+    执行 serve 子命令，按 Ctrl+C 停止
+
+    返回:
+        进程退出码
+    """
+    from utils.tile_server import TileRenderer, TileServer
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"路径不存在: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    renderer = TileRenderer(args.paths, annotations_dir=args.annotations,
+                            cache_root=None if args.no_disk_cache else args.cache,
+                            memory_bytes=args.memory * 1024 * 1024)
+    server = TileServer((args.host, args.port), renderer, verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"瓦片服务已启动: http://{host}:{port}/ ({len(renderer.rescan())} 个场景)", flush=True)
+    print(f"影像瓦片: http://{host}:{port}/{{场景}}/{{z}}/{{x}}/{{y}}.png", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("瓦片服务已停止")
+    finally:
+        server.server_close()
+    return 0
+
+
+def run_bench_command(args):
+    """
+    执行 bench 子命令：结果JSON写入 --output 或标准输出，表格输出到标准错误
+
+    返回:
+        进程退出码
+    """
+    import json
+    from benchmark import format_summary, run_benchmark
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    result = run_benchmark(args.width, args.height, args.bands, args.dtype, args.palette, args.format,
+                           repeat=args.repeat, polygons=args.polygons, zooms=args.zooms, work_dir=args.work_dir)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    print(format_summary(result, baseline), file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+    if args.command == "batch":
+        try:
+            return run_batch_command(args)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+    if args.command == "ingest":
+        return run_ingest_command(args)
+    if args.command == "serve":
+        return run_serve_command(args)
+    if args.command == "bench":
+        try:
+            return run_bench_command(args)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+
+    # 没有子命令时启动图形界面
+    import warnings
+    from PyQt5.QtWidgets import QApplication
+    from terrain_app import TerrainApp
+
+    warnings.filterwarnings("ignore", message=".*Unknown field with tag.*")
+    startup.mark("导入模块")
+    app = QApplication(sys.argv[:1])
+    window = TerrainApp()
+    startup.mark("创建窗口")
+    window.showMaximized()
+    startup.mark("显示窗口")
+    if args.startup_timing:
+        def report(timer):
+            print(timer.report(), file=sys.stderr, flush=True)
+            app.quit()
+        startup.listeners.append(report)
+    return app.exec_()
+
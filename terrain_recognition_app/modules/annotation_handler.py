@@ -1,9 +1,20 @@
 import os
 import json
+import math
+import numpy as np
 from PyQt5.QtCore import Qt, QPointF, QEvent  # 添加QEvent导入
 from PyQt5.QtGui import QPainter, QPen, QColor, QBrush, QPolygonF
 from PyQt5.QtWidgets import QListWidgetItem, QInputDialog, QMessageBox
 
+from utils.annotation_io import annotation_path, write_annotation, crop_annotation
+from utils.label_index import LabelIndex, load_label_index
+from modules.background_task import BackgroundTask
+from utils.image_processing import qimage_to_array
+from utils.region_grow import magic_wand, trace_outline
+from utils.live_wire import CostMap, LiveWire
+from modules.polygon_store import PolygonStore
+from utils.trace import tracer
+
 class AnnotationHandler:
     """处理图像标注相关操作的类"""
     
@@ -16,17 +27,81 @@ class AnnotationHandler:
         self.app = app
         self.annotating = False
         self.current_polygon = []
-        self.polygons = []  # 多边形列表，每个元素为 (points, label, color)
+        self.polygons = PolygonStore()  # 多边形存储，迭代时返回 (points, label, color)
+        self.image_path = None  # 当前多边形所属的图像路径
+        self.simplify_tolerance = 0.0  # 提交多边形时的Douglas-Peucker简化容差(像素)，0表示不简化
         self.labels = {}  # 标签字典 {label_name: color}
         self.current_label = None
+        self.magic_wand = False  # 魔棒模式：单击按颜色容差生长区域并生成多边形
+        self.wand_tolerance = 24  # 魔棒的颜色容差(RGB欧氏距离)
+        self.live_wire = False  # 智能剪刀模式：上一个顶点到鼠标之间的线段沿图像边缘吸附
+        self.live_wire_budget = 20000  # 鼠标移动时每次最多扩展的像素数，保证交互流畅
+        self.wire = None  # 从最后一个顶点出发的 LiveWire
+        self.pixels = None  # 底图像素缓存 (pixmap cacheKey, RGB数组, CostMap)
+        
+        # 细节级别(LOD)渲染参数，单位均为屏幕像素
+        self.lod_max_level = 5  # 最粗的细节级别
+        self.lod_point_px = 3  # 小于该尺寸的多边形合并为一个点
+        self.lod_min_text_px = 8  # 文字高度小于该值时隐藏标签文字
+        self.lod_min_label_extent = 40  # 多边形尺寸小于该值时隐藏标签文字
+        self.lod_marker_spacing = 6  # 顶点平均间距小于该值时隐藏顶点标记
+        self.rendered_level = None  # 当前显示的标注所使用的细节级别
+        self.annotated_pixmap = None  # 最近一次绘制出的标注图像
         
         # 创建标注数据目录
         self.annotations_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "annotations")
         if not os.path.exists(self.annotations_dir):
             os.makedirs(self.annotations_dir)
         
-        # 加载已有标签
-        self.load_labels()
+        # 标签倒排索引，窗口显示后在后台刷新(只重新解析发生变化的标注文件)
+        self.label_index = LabelIndex(self.annotations_dir, self.app.cropped_dir)
+        self.index_task = None
+        self.pending_index_updates = None  # 后台刷新期间保存的标注 {标注文件路径: 标注数据}，不在刷新时为None
+    
+    def refresh_label_index_async(self, on_finished=None):
+        """
+        在后台加载并刷新标签索引，完成后替换当前索引
+        
+        参数:
+            on_finished: 刷新结束(成功或失败)后在界面线程中调用
+        """
+        self.pending_index_updates = {}
+        self.index_task = BackgroundTask(
+            load_label_index, self.annotations_dir, self.app.cropped_dir, parent=self.app
+        )
+        self.index_task.succeeded.connect(self.set_label_index)
+        self.index_task.failed.connect(lambda message: self.set_label_index(self.label_index))
+        if on_finished:
+            self.index_task.finished.connect(on_finished)
+        self.index_task.start()
+    
+    def set_label_index(self, index):
+        """替换标签索引，并把刷新期间保存的标注补到新索引中"""
+        pending = self.pending_index_updates or {}
+        self.pending_index_updates = None
+        for anno_path, data in pending.items():
+            try:
+                index.update_file(anno_path, data)
+            except OSError:
+                pass  # 标注文件已被删除，下次刷新时从索引中移除
+        self.label_index = index
+    
+    def index_refreshing(self):
+        """标签索引是否正在后台刷新"""
+        return self.pending_index_updates is not None
+    
+    def update_label_index(self, anno_path, data):
+        """
+        更新单个标注文件的索引，后台刷新期间先记录下来，刷新完成后补到新索引中
+        
+        参数:
+            anno_path: 标注文件路径
+            data: 标注数据
+        """
+        if self.pending_index_updates is not None:
+            self.pending_index_updates[anno_path] = data
+        else:
+            self.label_index.update_file(anno_path, data)
     
     def start_annotation(self):
         """开始标注模式"""
@@ -59,6 +134,7 @@ class AnnotationHandler:
                 self.current_label = label_name
                 self.annotating = True
                 self.current_polygon = []
+                self.wire = None
                 
                 # 替换鼠标事件处理器
                 self.original_press_event = self.app.image_display.mousePressEvent
@@ -88,6 +164,9 @@ class AnnotationHandler:
             self.app.image_display.mouseMoveEvent = self.original_move_event
             self.app.image_display.mouseReleaseEvent = self.original_release_event
         
+        # 未提交的超像素选区生成多边形
+        self.app.superpixel_handler.commit()
+        
         # 保存标注
         if self.app.current_file_path:
             self.save_annotations(self.app.current_file_path)
@@ -105,51 +184,201 @@ class AnnotationHandler:
             return
             
         pos = self.app.image_handler.get_image_position(event.pos())
-        if pos:
+        superpixels = self.app.superpixel_handler
+        if pos and superpixels.enabled:
+            # 超像素模式：单击选择超像素，双击将选区生成多边形
+            if event.type() == QEvent.MouseButtonDblClick:
+                count = superpixels.commit()
+                if count:
+                    self.draw_annotations()
+                    self.app.statusBar.showMessage(f"已从超像素选区添加 {count} 个多边形，可以继续标注或点击'完成标注'")
+            else:
+                superpixels.paint_at(pos.x(), pos.y(), self.is_erase_event(event))
+        elif pos:
             # 双击完成多边形
             if event.type() == QEvent.MouseButtonDblClick:  # 修改这里，使用QEvent.MouseButtonDblClick
                 if len(self.current_polygon) >= 3:  # 至少需要3个点
-                    # 添加到多边形列表
-                    self.polygons.append((
-                        self.current_polygon.copy(), 
+                    # 添加到多边形存储
+                    self.polygons.append(
+                        self.current_polygon,
                         self.current_label,
-                        self.labels[self.current_label]
-                    ))
+                        self.labels[self.current_label],
+                        self.simplify_tolerance
+                    )
                     self.current_polygon = []
+                    self.wire = None
                     self.draw_annotations()
                     self.app.statusBar.showMessage(f"多边形已添加，可以继续标注或点击'完成标注'")
+            elif self.magic_wand:
+                self.add_wand_polygon(pos.x(), pos.y())
+            elif self.live_wire:
+                self.add_wire_point(pos.x(), pos.y())
             else:
                 # 添加点
                 self.current_polygon.append((pos.x(), pos.y()))
                 self.draw_annotations()
     
+    def base_pixels(self):
+        """获取底图的RGB像素数组和边缘代价图，底图不变时复用
+        
+        返回:
+            (RGB数组, CostMap)，没有底图时返回 (None, None)
+        """
+        pixmap = self.app.image_handler.backup_image
+        if pixmap is None:
+            return None, None
+        if self.pixels is None or self.pixels[0] != pixmap.cacheKey():
+            array = qimage_to_array(pixmap)
+            # 代价图按分块在使用时才计算
+            self.pixels = (pixmap.cacheKey(), array, CostMap(array))
+        return self.pixels[1], self.pixels[2]
+    
+    def add_wire_point(self, x, y):
+        """智能剪刀模式下添加顶点：沿最小代价路径连接上一个顶点，并从新顶点开始新的搜索
+        
+        参数:
+            x, y: 点击位置的图像坐标
+        """
+        _, cost_map = self.base_pixels()
+        if cost_map is None:
+            return
+        path = None
+        if self.current_polygon and self.wire is not None:
+            # 与鼠标移动相同的扩展上限，离种子太远、本次未扩展到目标时用直线连接，不在界面线程中跑完整搜索
+            path = self.wire.path_to(x, y, budget=self.live_wire_budget)
+        if path:
+            self.current_polygon.extend(path[1:])
+        else:
+            self.current_polygon.append((x, y))
+        self.wire = LiveWire(cost_map, (x, y))
+        self.draw_annotations()
+    
+    def add_wand_polygon(self, x, y):
+        """从点击位置按颜色容差生长区域，将其轮廓作为多边形添加到当前标签
+        
+        参数:
+            x, y: 点击位置的图像坐标
+        """
+        pixels, _ = self.base_pixels()
+        if pixels is None:
+            return
+        mask, origin = magic_wand(pixels, (x, y), self.wand_tolerance)
+        outline = trace_outline(mask, origin)
+        if len(outline) < 3:
+            self.app.statusBar.showMessage("魔棒未找到颜色相近的区域，可以调大颜色容差")
+            return
+        
+        # 像素轮廓是阶梯状的，至少按1像素简化
+        self.polygons.append(
+            outline,
+            self.current_label,
+            self.labels[self.current_label],
+            max(self.simplify_tolerance, 1.0)
+        )
+        self.draw_annotations()
+        self.app.statusBar.showMessage(f"魔棒区域已添加({int(mask.sum())}像素)，可以继续标注或点击'完成标注'")
+    
+    def is_erase_event(self, event):
+        """按住Ctrl或使用右键时为取消选择"""
+        return bool(event.modifiers() & Qt.ControlModifier) or bool(event.buttons() & Qt.RightButton)
+    
     def annotation_mouse_move(self, event):
         """标注模式下的鼠标移动事件"""
-        if self.annotating and self.current_polygon:
+        superpixels = self.app.superpixel_handler
+        if self.annotating and superpixels.enabled:
+            # 按住鼠标拖动时连续选择经过的超像素
+            if event.buttons() & (Qt.LeftButton | Qt.RightButton):
+                pos = self.app.image_handler.get_image_position(event.pos())
+                if pos:
+                    superpixels.paint_at(pos.x(), pos.y(), self.is_erase_event(event))
+        elif self.annotating and self.current_polygon:
             # 在临时多边形上显示当前鼠标位置
             pos = self.app.image_handler.get_image_position(event.pos())
             if pos:
                 temp_polygon = self.current_polygon.copy()
-                temp_polygon.append((pos.x(), pos.y()))
+                # 智能剪刀模式下显示吸附到边缘的路径，本次未扩展到鼠标位置时暂时显示直线
+                path = None
+                if self.live_wire and self.wire is not None:
+                    path = self.wire.path_to(pos.x(), pos.y(), budget=self.live_wire_budget)
+                if path:
+                    temp_polygon.extend(path[1:])
+                else:
+                    temp_polygon.append((pos.x(), pos.y()))
                 self.draw_annotations(temp_polygon)
     
     def annotation_mouse_release(self, event):
         """标注模式下的鼠标释放事件"""
         pass  # 不需要特殊处理
     
+    def lod_for_zoom(self, zoom):
+        """根据缩放比例计算细节级别
+        
+        参数:
+            zoom: 缩放因子
+        
+        返回:
+            (level, band_zoom): 细节级别和该级别对应的名义缩放比例(2的负幂)
+        """
+        if zoom >= 1.0:
+            return 0, 1.0
+        level = min(self.lod_max_level, int(math.ceil(-math.log2(zoom))))
+        return level, 2.0 ** -level
+    
+    def update_lod(self, zoom):
+        """缩放比例变化后，细节级别改变时重新绘制标注
+        
+        参数:
+            zoom: 新的缩放因子
+        
+        返回:
+            是否已重新绘制(已重绘时显示已按新缩放更新)
+        """
+        if self.annotated_pixmap is None:
+            return False
+        # 只有当前显示的正是标注图像时才重绘，避免覆盖裁剪遮罩或原图
+        if self.app.image_handler.current_image is not self.annotated_pixmap:
+            return False
+        if self.lod_for_zoom(zoom)[0] == self.rendered_level:
+            return False
+        self.draw_annotations()
+        return True
+    
+    @tracer.traced("draw_annotations")
     def draw_annotations(self, temp_polygon=None):
-        """绘制所有标注"""
+        """按当前缩放对应的细节级别绘制所有标注(多边形的绘制计入本跨度的自身耗时)"""
         if not self.app.image_handler.current_image:
             return
+        
+        level, band_zoom = self.lod_for_zoom(self.app.zoom_controller.zoom_factor)
+        # 线宽和点大小按细节级别放大，缩小显示后在屏幕上保持可见
+        scale = 1.0 / band_zoom
             
         # 创建临时画布
-        pixmap = self.app.image_handler.backup_image.copy()
+        with tracer.span("pixmap.copy"):
+            pixmap = self.app.image_handler.backup_image.copy()
+        tracer.count("annotation.polygons_drawn", len(self.polygons))
         painter = QPainter(pixmap)
+        # 先绘制分类结果等叠加层
+        self.app.image_handler.paint_overlays(painter, pixmap)
         painter.setRenderHint(QPainter.Antialiasing)
+        show_text = painter.fontMetrics().height() * band_zoom >= self.lod_min_text_px
+        
+        # 多边形在屏幕上的尺寸
+        bounds = self.polygons.bounds()
+        extents = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) * band_zoom
+        tiny = extents < self.lod_point_px
         
         # 绘制已保存的多边形
-        for points, label, color in self.polygons:
-            poly = QPolygonF([QPointF(x, y) for x, y in points])
+        tolerance = 0.5 * scale
+        tiny_points = {}  # {颜色: 合并为点的小多边形中心}
+        for i in range(len(self.polygons)):
+            color = self.polygons.color(i)
+            if tiny[i]:
+                min_x, min_y, max_x, max_y = bounds[i].tolist()
+                tiny_points.setdefault(color, []).append(QPointF((min_x + max_x) / 2, (min_y + max_y) / 2))
+                continue
+            
+            poly = self.polygons.lod_qpolygon(i, level, tolerance)
             
             # 设置半透明填充
             fill_color = QColor(color)
@@ -158,16 +387,26 @@ class AnnotationHandler:
             
             # 设置边框
             pen = QPen(QColor(color))
-            pen.setWidth(2)
+            pen.setWidthF(2 * scale)
             painter.setPen(pen)
             
             # 绘制多边形
             painter.drawPolygon(poly)
             
-            # 绘制标签文字
-            text_pen = QPen(Qt.black)
-            painter.setPen(text_pen)
-            painter.drawText(QPointF(points[0][0], points[0][1] - 5), label)
+            # 绘制标签文字，文字太小或多边形太小时跳过
+            if show_text and extents[i] >= self.lod_min_label_extent:
+                points = self.polygons.points(i)
+                text_pen = QPen(Qt.black)
+                painter.setPen(text_pen)
+                painter.drawText(QPointF(float(points[0][0]), float(points[0][1]) - 5), self.polygons.label(i))
+        
+        # 小多边形按颜色批量绘制为点
+        for color, centers in tiny_points.items():
+            pen = QPen(QColor(color))
+            pen.setWidthF(self.lod_point_px * scale)
+            pen.setCapStyle(Qt.RoundCap)
+            painter.setPen(pen)
+            painter.drawPoints(QPolygonF(centers))
         
         # 绘制当前正在创建的多边形
         if self.current_polygon:
@@ -177,15 +416,11 @@ class AnnotationHandler:
                 
             # 绘制线段
             pen = QPen(QColor(self.labels.get(self.current_label, "#FF0000")))
-            pen.setWidth(2)
+            pen.setWidthF(2 * scale)
             pen.setStyle(Qt.DashLine)
             painter.setPen(pen)
             
-            for i in range(len(points) - 1):
-                painter.drawLine(
-                    QPointF(points[i][0], points[i][1]),
-                    QPointF(points[i+1][0], points[i+1][1])
-                )
+            painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in points]))
             
             # 如果是临时多边形，绘制回到起点的线
             if temp_polygon and len(points) > 2:
@@ -194,35 +429,43 @@ class AnnotationHandler:
                     QPointF(points[0][0], points[0][1])
                 )
             
-            # 绘制点
-            point_pen = QPen(Qt.red)
-            painter.setPen(point_pen)
-            for x, y in points:
-                painter.drawEllipse(QPointF(x, y), 3, 3)
+            # 绘制点，顶点过于密集时隐藏标记
+            spacing = np.hypot(*np.diff(np.asarray(points, dtype=np.float32), axis=0).T).mean() if len(points) > 1 else 0
+            if len(points) == 1 or spacing * band_zoom >= self.lod_marker_spacing:
+                point_pen = QPen(Qt.red)
+                painter.setPen(point_pen)
+                for x, y in points:
+                    painter.drawEllipse(QPointF(x, y), 3 * scale, 3 * scale)
         
         painter.end()
         
         # 显示标注后的图像
+        self.rendered_level = level
+        self.annotated_pixmap = pixmap
         self.app.image_handler.display_image(pixmap)
     
     def load_annotations(self, image_path):
         """加载图像的标注数据"""
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        anno_path = os.path.join(self.annotations_dir, f"{base_name}.json")
+        anno_path = annotation_path(self.annotations_dir, image_path)
+        
+        # 清除上一幅图像的标注，避免没有标注文件的图像沿用旧多边形
+        self.clear_annotations()
+        self.image_path = image_path
         
         if os.path.exists(anno_path):
             try:
                 with open(anno_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                 
-                self.polygons = []
+                polygons = []
                 for poly in data.get('polygons', []):
                     points = poly.get('points', [])
                     label = poly.get('label', 'unknown')
                     color = poly.get('color', '#FF0000')
                     
                     if points and label:
-                        self.polygons.append((points, label, color))
+                        polygons.append((points, label, color))
+                self.polygons.extend(polygons)
                 
                 # 更新显示
                 self.draw_annotations()
@@ -232,29 +475,69 @@ class AnnotationHandler:
         
         return False
     
+    def clear_annotations(self):
+        """清除内存中的标注(切换到没有标注的图像时调用)"""
+        self.polygons.clear()
+        self.current_polygon = []
+        self.wire = None
+        self.image_path = None
+        self.annotated_pixmap = None
+    
+    def build_crop_annotations(self, crop_rect, chip_path):
+        """将与裁剪区域相交的多边形裁剪到区域内，并转换为裁剪图坐标
+        
+        参数:
+            crop_rect: 裁剪区域 QRect(当前图像坐标)
+            chip_path: 裁剪图保存路径
+        
+        返回:
+            裁剪图的标注数据字典，没有相交的多边形时返回None
+        """
+        if not self.polygons:
+            return None
+        
+        rect = (crop_rect.x(), crop_rect.y(),
+                crop_rect.x() + crop_rect.width(), crop_rect.y() + crop_rect.height())
+        count = len(self.polygons)
+        return crop_annotation(self.polygons.coords, self.polygons.offsets,
+                               [self.polygons.label(i) for i in range(count)],
+                               [self.polygons.color(i) for i in range(count)],
+                               rect, os.path.basename(chip_path))
+    
+    def write_crop_annotations(self, chip_path, data):
+        """写入裁剪图的标注文件并更新标签索引
+        
+        参数:
+            chip_path: 裁剪图路径
+            data: build_crop_annotations 返回的标注数据
+        """
+        anno_path = annotation_path(self.annotations_dir, chip_path)
+        write_annotation(anno_path, data)
+        self.update_label_index(anno_path, data)
+    
     def save_annotations(self, image_path):
         """保存标注数据"""
         if not self.polygons:
             return
             
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        anno_path = os.path.join(self.annotations_dir, f"{base_name}.json")
+        anno_path = annotation_path(self.annotations_dir, image_path)
         
         try:
             data = {
                 'image': os.path.basename(image_path),
-                'polygons': []
+                # 完整路径，批量裁剪和训练分类器时查找不在裁剪目录中的导入图像
+                'image_path': os.path.abspath(image_path),
+                'polygons': self.polygons.to_records()
             }
+            # 记录图像尺寸，供统计覆盖率使用
+            base_image = self.app.image_handler.backup_image
+            if base_image:
+                data['image_size'] = [base_image.width(), base_image.height()]
             
-            for points, label, color in self.polygons:
-                data['polygons'].append({
-                    'points': points,
-                    'label': label,
-                    'color': color
-                })
+            write_annotation(anno_path, data)
             
-            with open(anno_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # 增量更新标签索引
+            self.update_label_index(anno_path, data)
                 
             self.app.statusBar.showMessage(f"标注已保存到 {anno_path}")
             return True
@@ -302,7 +585,7 @@ class AnnotationHandler:
                 break
         
         # 从多边形中删除相关标注
-        self.polygons = [(p, l, c) for p, l, c in self.polygons if l != name]
+        self.polygons.remove_label(name)
         
         # 更新显示
         self.draw_annotations()
@@ -339,9 +622,7 @@ class AnnotationHandler:
                 break
         
         # 更新多边形中的标签
-        for i, (points, label, _) in enumerate(self.polygons):
-            if label == old_name:
-                self.polygons[i] = (points, new_name, color.name())
+        self.polygons.rename_label(old_name, new_name, color.name())
         
         # 更新显示
         self.draw_annotations()
@@ -0,0 +1,39 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class BackgroundTask(QThread):
+    """在后台线程中运行耗时函数，通过信号报告进度和结果
+
+    被运行的函数需要接受关键字参数 progress，用于报告 (已完成, 总数)。
+    """
+
+    progress = pyqtSignal(int, int)  # 进度信号 (已完成, 总数)
+    succeeded = pyqtSignal(object)  # 完成信号，携带函数返回值
+    failed = pyqtSignal(str)  # 失败信号，携带错误信息
+
+    def __init__(self, func, *args, parent=None, **kwargs):
+        """初始化后台任务
+
+        参数:
+            func: 要运行的函数
+            args, kwargs: 传给函数的参数
+            parent: 父对象
+        """
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.func(*self.args, progress=self.report_progress, **self.kwargs)
+        except Exception as e:
+            import traceback
+            print(f"后台任务出错: {traceback.format_exc()}")
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(result)
+
+    def report_progress(self, done, total):
+        """供被运行的函数调用的进度回调"""
+        self.progress.emit(int(done), int(total or 0))
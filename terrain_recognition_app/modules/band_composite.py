@@ -0,0 +1,83 @@
+from PyQt5.QtWidgets import QMessageBox, QInputDialog
+from PyQt5.QtGui import QPixmap
+
+from modules.background_task import BackgroundTask
+from utils.band_cache import COMPOSITE_PRESETS, composite_bands, display_band_cache
+from utils.image_processing import array_to_qimage
+from utils.raster_io import RasterSource
+
+
+class BandCompositeHandler:
+    """多波段图像的波段组合切换，波段按需读取并缓存"""
+
+    CUSTOM = "自定义..."
+    PRESETS = COMPOSITE_PRESETS
+
+    def __init__(self, app):
+        """初始化波段组合处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        self.task = None
+
+    def select_composite(self, name):
+        """切换到预设或自定义的波段组合
+
+        参数:
+            name: 预设名称或 CUSTOM
+        """
+        if self.task and self.task.isRunning():
+            QMessageBox.information(self.app, "提示", "正在读取波段，请稍候")
+            return
+        source_path = self.app.image_handler.source_path
+        if not source_path:
+            QMessageBox.information(self.app, "提示", "请先导入或选择图片")
+            return
+        if name == self.CUSTOM:
+            text, ok = QInputDialog.getText(self.app, "自定义波段组合", "红,绿,蓝 波段编号:", text="4,3,2")
+            if not ok:
+                return
+            try:
+                bands = tuple(int(part) for part in text.replace('，', ',').split(','))
+            except ValueError:
+                bands = ()
+            if len(bands) != 3:
+                QMessageBox.warning(self.app, "错误", "请输入三个以逗号分隔的波段编号")
+                return
+        else:
+            source = RasterSource(source_path)
+            try:
+                bands = composite_bands(name, source)
+            finally:
+                source.close()
+
+        reads_before = display_band_cache.reads
+        self.task = BackgroundTask(display_band_cache.composite, source_path, bands, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在准备波段组合: {done}/{total}")
+        )
+        self.task.succeeded.connect(
+            lambda rgb: self.on_composited(source_path, bands, rgb, display_band_cache.reads - reads_before))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"切换波段组合出错: {message}"))
+        self.task.start()
+
+    def on_composited(self, source_path, bands, rgb, new_reads):
+        """波段组合完成，替换底图并重新合成叠加层和标注"""
+        handler = self.app.image_handler
+        if handler.source_path != source_path:
+            return
+        pixmap = QPixmap.fromImage(array_to_qimage(rgb))
+        if handler.backup_image and pixmap.size() != handler.backup_image.size():
+            self.app.statusBar.showMessage("波段组合的尺寸与当前图像不一致，无法替换")
+            return
+        # 当前图像就是导入的原图时，原图也使用新的波段组合
+        if source_path == getattr(self.app, 'original_file_path', None):
+            handler.original_image = pixmap
+        handler.backup_image = QPixmap(pixmap)
+        handler.refresh_overlays()
+        # 新的显示波段的原始数值在后台读取，读取完成后可以继续调整拉伸
+        self.app.contrast_handler.load_source_async(source_path, bands)
+        self.app.statusBar.showMessage(
+            f"已切换到波段组合 R{bands[0]} G{bands[1]} B{bands[2]}，新读取 {new_reads} 个波段")
@@ -0,0 +1,78 @@
+import os
+import numpy as np
+from PyQt5.QtWidgets import QMessageBox
+
+from modules.background_task import BackgroundTask
+from modules.image_import import apply_colormap_jet_vectorized
+from utils.band_math import BandExpression, INDEX_PRESETS, compute_index
+from utils.image_processing import array_to_qimage
+from utils.raster_io import to_uint8
+
+
+class BandMathHandler:
+    """波段运算：对当前多波段图像计算植被、水体等指数并以伪彩色叠加显示"""
+
+    OVERLAY_NAME = "band_math"
+    PRESETS = INDEX_PRESETS
+
+    def __init__(self, app):
+        """初始化波段运算处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.output_dir = os.path.join(app_dir, "classified")
+        self.task = None
+
+    def compute_action(self):
+        """计算输入框中的表达式"""
+        if self.task and self.task.isRunning():
+            QMessageBox.information(self.app, "提示", "波段运算正在进行中，请稍候")
+            return
+        source_path = self.app.image_handler.source_path
+        if not source_path:
+            QMessageBox.information(self.app, "提示", "请先导入或选择图片")
+            return
+        text = self.app.band_math_combo.currentText()
+        try:
+            BandExpression(text)
+        except ValueError as e:
+            QMessageBox.warning(self.app, "表达式错误", str(e))
+            return
+
+        base_name = os.path.splitext(os.path.basename(source_path))[0]
+        output_path = os.path.join(self.output_dir, f"{base_name}_index.tif")
+        self.task = BackgroundTask(compute_index, source_path, text, output_path, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在计算 {text}: {done}/{total} 个分块")
+        )
+        self.task.succeeded.connect(lambda result: self.on_computed(source_path, result))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"波段运算出错: {message}"))
+        self.task.start()
+
+    def on_computed(self, source_path, result):
+        """计算完成，伪彩色叠加显示"""
+        preview = result['preview']
+        valid = np.isfinite(preview)
+        if not valid.any():
+            self.app.statusBar.showMessage(f"{result['expression']} 的结果全部无效")
+            return
+        values = preview[valid]
+        # 归一化差值指数使用固定的 [-1, 1] 范围，其余表达式忽略极端值拉伸
+        if values.min() >= -1 and values.max() <= 1:
+            low, high = -1.0, 1.0
+        else:
+            low, high = (float(v) for v in np.percentile(values, [2, 98]))
+        self.app.statusBar.showMessage(
+            f"{result['expression']} 计算完成 (显示范围 {low:.3g} ~ {high:.3g})，结果已保存到 {result['output']}")
+        if self.app.image_handler.source_path != source_path:
+            return
+        rgb = apply_colormap_jet_vectorized(to_uint8(np.where(valid, preview, low), low, high))
+        rgb[~valid] = 0
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, array_to_qimage(rgb))
+
+    def clear_action(self):
+        """移除指数叠加层"""
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
@@ -0,0 +1,148 @@
+import os
+from PyQt5.QtWidgets import QMessageBox, QInputDialog
+from PyQt5.QtGui import QColor
+
+from modules.background_task import BackgroundTask
+from utils.image_processing import index_overlay_image
+from utils.raster_io import get_gdal
+from utils.terrain_classifier import train_classifier, classify_image, NO_CLASS
+from utils.kmeans import cluster_image
+
+
+class ClassifierHandler:
+    """地形分类：用标注训练分类器或做无监督聚类，对当前图像逐块处理并叠加显示结果"""
+
+    OVERLAY_NAME = "classification"
+    CLUSTER_OVERLAY_NAME = "clusters"
+
+    def __init__(self, app):
+        """初始化分类处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.model_path = os.path.join(app_dir, "models", "terrain_classifier.npz")
+        self.classified_dir = os.path.join(app_dir, "classified")
+        self.cache_root = os.path.join(app_dir, "cache", "tiles")  # 与纹理图层共用的特征分块缓存
+        self.task = None
+
+    def is_busy(self):
+        """是否有分类任务正在运行"""
+        if self.task and self.task.isRunning():
+            QMessageBox.information(self.app, "提示", "分类任务正在进行中，请稍候")
+            return True
+        return False
+
+    def train_action(self):
+        """用所有标注文件训练分类器"""
+        if self.is_busy():
+            return
+        handler = self.app.annotation_handler
+        self.task = BackgroundTask(
+            train_classifier,
+            handler.annotations_dir,
+            self.app.file_operations.image_search_dirs(),
+            self.model_path,
+            label_colors=dict(handler.labels),
+            parent=self.app
+        )
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在采样训练数据: {done}/{total} 个标注文件")
+        )
+        self.task.succeeded.connect(self.on_trained)
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"训练分类器出错: {message}"))
+        self.task.start()
+        self.app.statusBar.showMessage("正在训练分类器...")
+
+    def on_trained(self, result):
+        """训练完成"""
+        samples = "，".join(f"{name}: {count}" for name, count in result['samples'].items())
+        self.app.statusBar.showMessage(f"分类器训练完成 ({samples})")
+
+    def classify_action(self):
+        """对当前图像进行地形分类"""
+        if self.is_busy():
+            return
+        if not os.path.exists(self.model_path):
+            QMessageBox.information(self.app, "提示", "还没有训练分类器，请先点击'训练分类器'")
+            return
+        output_path = self.current_output_path("classes")
+        if not output_path:
+            return
+        source_path = self.app.image_handler.source_path
+
+        self.task = BackgroundTask(classify_image, source_path, self.model_path, output_path,
+                                   cache_root=self.cache_root, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在分类: {done}/{total} 个分块")
+        )
+        self.task.succeeded.connect(lambda result: self.on_classified(source_path, result))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"分类出错: {message}"))
+        self.task.start()
+        self.app.statusBar.showMessage("正在分类当前图像...")
+
+    def current_output_path(self, suffix):
+        """当前图像的结果文件路径，没有当前图像时返回None"""
+        source_path = self.app.image_handler.source_path
+        if not source_path:
+            QMessageBox.information(self.app, "提示", "请先导入或选择图片")
+            return None
+        ext = ".tif" if get_gdal() is not None else ".png"
+        base_name = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.classified_dir, f"{base_name}_{suffix}{ext}")
+
+    def cluster_action(self):
+        """对当前图像做无监督 k-means 预分割"""
+        if self.is_busy():
+            return
+        output_path = self.current_output_path("clusters")
+        if not output_path:
+            return
+        clusters, ok = QInputDialog.getInt(self.app, "无监督预分割", "聚类数量:", 6, 2, 32)
+        if not ok:
+            return
+
+        source_path = self.app.image_handler.source_path
+        self.task = BackgroundTask(cluster_image, source_path, output_path, clusters=clusters, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在聚类: {done}/{total}")
+        )
+        self.task.succeeded.connect(lambda result: self.on_clustered(source_path, clusters, result))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"聚类出错: {message}"))
+        self.task.start()
+        self.app.statusBar.showMessage("正在对当前图像做无监督预分割...")
+
+    def cluster_palette(self, count):
+        """聚类颜色：先使用标签颜色，不够时按色相均匀补充"""
+        colors = list(self.app.annotation_handler.labels.values())[:count]
+        for i in range(len(colors), count):
+            colors.append(QColor.fromHsv(int(360 * i / count) % 360, 200, 230).name())
+        return colors
+
+    def on_clustered(self, source_path, clusters, result):
+        """聚类完成，叠加显示结果"""
+        self.app.statusBar.showMessage(f"预分割完成，结果已保存到 {result['output']}")
+        base = self.app.image_handler.backup_image
+        if self.app.image_handler.source_path != source_path or not base:
+            return
+        overlay = index_overlay_image(result['preview'], self.cluster_palette(clusters),
+                                      base.width(), base.height())
+        self.app.image_handler.set_overlay(self.CLUSTER_OVERLAY_NAME, overlay)
+
+    def on_classified(self, source_path, result):
+        """分类完成，叠加显示结果"""
+        self.app.statusBar.showMessage(f"分类完成，结果已保存到 {result['output']}")
+        base = self.app.image_handler.backup_image
+        # 分类期间切换了图像则不叠加
+        if self.app.image_handler.source_path != source_path or not base:
+            return
+        overlay = index_overlay_image(result['preview'], result['class_colors'],
+                                      base.width(), base.height(), skip_value=NO_CLASS)
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, overlay)
+
+    def clear_overlay_action(self):
+        """移除分类和聚类叠加层"""
+        self.app.image_handler.overlays.pop(self.CLUSTER_OVERLAY_NAME, None)
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
@@ -0,0 +1,173 @@
+import os
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtWidgets import QMessageBox
+
+from modules.background_task import BackgroundTask
+from utils.contours import generate_contours
+from utils.geometry import simplify_polyline
+from utils.raster_io import RasterSource
+
+
+def array_to_qpolygonf(points):
+    """将 (N, 2) 坐标数组直接写入 QPolygonF 的缓冲区，避免逐点创建 QPointF"""
+    points = np.asarray(points, dtype=np.float64)
+    polygon = QPolygonF(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(points.size * 8)
+        np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+
+class ContourOverlay:
+    """等高线矢量叠加层，按缩放对应的细节级别简化并绘制折线"""
+
+    INDEX_EVERY = 5  # 每隔几条等高线绘制一条加粗的计曲线
+    MINOR_MAX_LEVEL = 2  # 超过该细节级别时只绘制计曲线
+    MIN_EXTENT_PX = 2  # 屏幕尺寸小于该值的等高线不绘制
+
+    def __init__(self, contours, width, height):
+        """初始化
+
+        参数:
+            contours: ContourSet
+            width, height: 等高线坐标对应的源图像大小
+        """
+        self.contours = contours
+        self.width = width
+        self.height = height
+        bounds = contours.bounds()
+        self.extents = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+        self.is_index = contours.levels % self.INDEX_EVERY == 0
+        self._qpolylines = {}  # {细节级别: {折线编号: QPolygonF}}
+
+    def qpolyline(self, index, level, tolerance):
+        """获取指定细节级别下简化后的折线(缓存)"""
+        cache = self._qpolylines.setdefault(level, {})
+        polyline = cache.get(index)
+        if polyline is None:
+            points = self.contours.points(index)
+            if level > 0:
+                points = points[simplify_polyline(points, tolerance)]
+            polyline = array_to_qpolygonf(points)
+            cache[index] = polyline
+        return polyline
+
+    def paint(self, painter, target, level, band_zoom):
+        """在画布的目标区域内绘制等高线
+
+        参数:
+            painter: QPainter
+            target: 叠加层对应的目标矩形 QRectF
+            level, band_zoom: 细节级别和对应的名义缩放比例
+        """
+        scale = 1.0 / band_zoom
+        visible = self.extents * band_zoom >= self.MIN_EXTENT_PX
+        if level > self.MINOR_MAX_LEVEL:
+            visible &= self.is_index
+
+        painter.save()
+        painter.translate(target.x(), target.y())
+        painter.scale(target.width() / self.width, target.height() / self.height)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for is_index, width in ((False, 1.0), (True, 2.0)):
+            pen = QPen(QColor(150, 75, 0))
+            pen.setWidthF(width * scale)
+            pen.setCapStyle(Qt.RoundCap)
+            painter.setPen(pen)
+            for i in np.flatnonzero(visible & (self.is_index == is_index)).tolist():
+                painter.drawPolyline(self.qpolyline(i, level, 0.5 * scale))
+        painter.restore()
+
+
+class ContourHandler:
+    """DEM等高线的生成、叠加显示、查询和导出"""
+
+    OVERLAY_NAME = "contours"
+
+    def __init__(self, app):
+        """初始化等高线处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.output_dir = os.path.join(app_dir, "classified")
+        self.task = None
+
+    def current_overlay(self):
+        """当前显示的等高线叠加层，没有时返回None"""
+        return self.app.image_handler.overlays.get(self.OVERLAY_NAME)
+
+    def generate_action(self):
+        """按设置的等高距生成当前DEM的等高线"""
+        if self.task and self.task.isRunning():
+            QMessageBox.information(self.app, "提示", "等高线正在生成中，请稍候")
+            return
+        source_path = self.app.image_handler.source_path
+        if not source_path:
+            QMessageBox.information(self.app, "提示", "请先导入或选择图片")
+            return
+        source = RasterSource(source_path)
+        band_count, width, height = source.band_count, source.width, source.height
+        source.close()
+        if band_count != 1:
+            QMessageBox.information(self.app, "提示", "等高线需要单波段的高程图像(DEM)")
+            return
+
+        interval = self.app.contour_interval_spin.value()
+        self.task = BackgroundTask(generate_contours, source_path, interval, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在生成等高线: {done}/{total} 个分块")
+        )
+        self.task.succeeded.connect(lambda contours: self.on_generated(source_path, width, height, contours))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"生成等高线出错: {message}"))
+        self.task.start()
+        self.app.statusBar.showMessage(f"正在生成等距 {interval:g} 的等高线...")
+
+    def on_generated(self, source_path, width, height, contours):
+        """等高线生成完成，叠加显示"""
+        self.app.statusBar.showMessage(f"已生成 {len(contours)} 条等高线")
+        if self.app.image_handler.source_path != source_path:
+            return
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, ContourOverlay(contours, width, height))
+
+    def export_action(self):
+        """将当前等高线导出为GeoJSON"""
+        overlay = self.current_overlay()
+        if overlay is None:
+            QMessageBox.information(self.app, "提示", "请先生成等高线")
+            return
+        contours = overlay.contours
+        base_name = os.path.splitext(os.path.basename(self.app.image_handler.source_path))[0]
+        output_path = os.path.join(self.output_dir, f"{base_name}_contours_{contours.interval:g}.geojson")
+        try:
+            contours.to_geojson(output_path)
+            self.app.statusBar.showMessage(f"等高线已导出到 {output_path}")
+        except Exception as e:
+            QMessageBox.critical(self.app, "错误", f"导出等高线出错: {str(e)}")
+
+    def clear_action(self):
+        """移除等高线叠加层"""
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
+
+    def show_elevation_at(self, pos):
+        """在状态栏显示点击位置附近等高线的高程
+
+        参数:
+            pos: 当前显示图像中的位置 QPoint
+        """
+        overlay = self.current_overlay()
+        image = self.app.image_handler.current_image
+        if overlay is None or not image:
+            return
+        # 显示图像坐标转换为等高线(源图像)坐标，搜索半径约为屏幕上的8个像素
+        sx = overlay.width / image.width()
+        sy = overlay.height / image.height()
+        radius = 8 / self.app.zoom_controller.zoom_factor * max(sx, sy)
+        found = overlay.contours.nearest(pos.x() * sx, pos.y() * sy, radius)
+        if found:
+            self.app.statusBar.showMessage(f"等高线高程: {overlay.contours.elevation(found[0]):g}")
@@ -0,0 +1,323 @@
+import math
+from PyQt5.QtCore import Qt, QTimer, QPoint, QRect
+from PyQt5.QtGui import QPixmap, QColor
+from PyQt5.QtWidgets import QLabel
+
+from modules.background_task import BackgroundTask
+from utils.image_processing import array_to_qimage
+from utils.memory_budget import memory_budget
+from utils.render import apply_windows, block_histogram, histogram_window, read_display_raw
+from utils.trace import tracer
+
+
+class ContrastHandler:
+    """显示波段的拉伸调整：在直方图上拖动黑点/白点、调整伽马，可分波段拉伸
+
+    对导入时保留的原始数值(如16位)查表生成显示图像，不重新读取文件。拖动过程中只对
+    可见区域查表并显示为预览层，停止调整后再生成整幅图像、重新合成叠加层和标注。
+    """
+
+    COMMIT_DELAY_MS = 300  # 停止调整多久后生成整幅图像(拖动直方图时松开鼠标立即生成)
+    ALL_BANDS = "全部波段"
+    BAND_NAMES = ("红", "绿", "蓝")
+    BAND_COLORS = ((220, 40, 40, 110), (40, 160, 40, 110), (40, 80, 220, 110))
+
+    def __init__(self, app):
+        """初始化对比度处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        self.source_path = None  # 原始数值对应的图像
+        self.raws = None  # 各显示波段的原始数值数组
+        self.histograms = []  # 各波段的直方图，导入时计算一次
+        self.default_windows = []  # 导入时的拉伸窗口
+        self.windows = []  # 各波段当前的窗口 (下限, 上限)
+        self.gamma = 1.0
+        self.band_index = -1  # 正在调整的波段，-1 表示同时调整全部波段
+        self.task = None
+        self.preview_label = None  # 可见区域的预览层，第一次预览时创建
+        self.preview_timer = QTimer()
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self.preview)
+        self.commit_timer = QTimer()
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.timeout.connect(self.apply)
+
+    @tracer.traced("contrast.set_source")
+    def set_source(self, path, raws, windows, nodata=None):
+        """导入图像后保留原始数值并计算直方图
+
+        参数:
+            path: 图像路径
+            raws: 各显示波段的原始数值数组
+            windows: 各波段导入时使用的窗口 (下限, 上限)
+            nodata: 无数据值，不计入直方图
+        """
+        self.source_path = path
+        self.raws = raws
+        self.histograms = [block_histogram(raw, nodata) for raw in raws]
+        self.default_windows = list(windows)
+        self.windows = list(windows)
+        self.gamma = 1.0
+        self.band_index = -1
+        self.hide_preview()
+        self.update_band_combo()
+        self.update_controls()
+
+    def load_source_async(self, path, bands):
+        """在后台读取显示波段的原始数值(从预处理缓存显示或切换波段组合后)，读取完成时图像未变才使用
+
+        参数:
+            path: 图像路径
+            bands: (红, 绿, 蓝) 波段编号，None 表示默认的显示波段
+        """
+        self.clear()
+        task = BackgroundTask(read_display_raw, path, bands, max_bytes=memory_budget.limit // 2, parent=self.app)
+        task.succeeded.connect(lambda result: self.on_source_loaded(task, path, result))
+        task.failed.connect(lambda message: print(f"读取原始数值出错: {message}"))
+        self.task = task
+        task.start()
+
+    def on_source_loaded(self, task, path, result):
+        """后台读取的原始数值，期间又切换了波段组合或图像时丢弃"""
+        if result is None or task is not self.task or self.app.image_handler.source_path != path:
+            return
+        self.set_source(path, *result)
+
+    def clear(self):
+        """导入的图像没有保留原始数值时释放"""
+        self.source_path = None
+        self.raws = None
+        self.histograms = []
+        self.windows = []
+        self.default_windows = []
+        self.preview_timer.stop()
+        self.commit_timer.stop()
+        self.hide_preview()
+        self.update_band_combo()
+        self.update_controls()
+
+    def active(self):
+        """当前显示的是否是保留了原始数值的图像"""
+        return self.raws is not None and self.app.image_handler.source_path == self.source_path
+
+    def selected(self):
+        """正在调整的波段下标"""
+        if self.raws is None:
+            return []
+        return list(range(len(self.raws))) if self.band_index < 0 else [self.band_index]
+
+    def panel_window(self):
+        """直方图上显示的窗口，调整全部波段时为各波段窗口的外包范围"""
+        indices = self.selected()
+        return (min(self.windows[i][0] for i in indices), max(self.windows[i][1] for i in indices))
+
+    def value_range(self):
+        """直方图横轴范围：所选波段的数值范围和窗口的并集"""
+        lows, highs = [], []
+        for i in self.selected():
+            histogram = self.histograms[i]
+            lows += [histogram.start, self.windows[i][0], self.default_windows[i][0]]
+            highs += [histogram.start + len(histogram.counts) * histogram.bin_width,
+                      self.windows[i][1], self.default_windows[i][1]]
+        return min(lows), max(highs)
+
+    def update_band_combo(self):
+        """多波段图像可以选择单独调整某个波段"""
+        combo = self.app.stretch_band_combo
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItem(self.ALL_BANDS)
+        if self.raws is not None and len(self.raws) > 1:
+            combo.addItems(list(self.BAND_NAMES[:len(self.raws)]))
+        combo.setCurrentIndex(self.band_index + 1)
+        combo.blockSignals(False)
+
+    def update_controls(self):
+        """按当前窗口更新直方图和控件，没有原始数值时禁用"""
+        enabled = self.raws is not None
+        for widget in (self.app.histogram_panel, self.app.stretch_band_combo, self.app.gamma_spin,
+                       self.app.auto_window_btn, self.app.reset_window_btn):
+            widget.setEnabled(enabled)
+        self.app.stretch_band_combo.setEnabled(enabled and len(self.raws) > 1)
+        self.app.gamma_spin.blockSignals(True)
+        self.app.gamma_spin.setValue(self.gamma)
+        self.app.gamma_spin.blockSignals(False)
+        if not enabled:
+            self.app.histogram_panel.set_histograms([], [], (0.0, 255.0))
+        else:
+            indices = self.selected()
+            if len(self.raws) == 1:
+                colors = [QColor(90, 90, 90, 160)]
+            else:
+                colors = [QColor(*self.BAND_COLORS[i]) for i in indices]
+            self.app.histogram_panel.set_histograms([self.histograms[i] for i in indices], colors,
+                                                    self.value_range())
+            self.app.histogram_panel.set_window(*self.panel_window(), self.gamma)
+        self.update_label()
+
+    def update_label(self):
+        """显示当前窗口的数值"""
+        if self.raws is None:
+            self.app.window_label.setText("导入GeoTIFF后可调整拉伸")
+            return
+        dtype = self.raws[0].dtype
+        if len(self.raws) == 1:
+            low, high = self.windows[0]
+            self.app.window_label.setText(
+                f"窗口 {low:.6g} ~ {high:.6g} | 窗位 {(low + high) / 2:.6g} 窗宽 {high - low:.6g} | {dtype}"
+            )
+            return
+        parts = [f"{name} {low:.6g}~{high:.6g}" for name, (low, high) in zip(self.BAND_NAMES, self.windows)]
+        self.app.window_label.setText(" | ".join(parts) + f" | {dtype}")
+
+    def band_changed(self, index):
+        """切换正在调整的波段"""
+        self.band_index = index - 1
+        self.update_controls()
+
+    def window_changed(self, low, high):
+        """拖动直方图上的黑点或白点：调整全部波段时各波段窗口同样平移，保持波段之间的色彩平衡"""
+        if self.raws is None:
+            return
+        old_low, old_high = self.panel_window()
+        for i in self.selected():
+            band_low, band_high = self.windows[i]
+            band_low += low - old_low
+            band_high += high - old_high
+            if band_high <= band_low:
+                band_high = band_low + self.histograms[i].bin_width
+            self.windows[i] = (band_low, band_high)
+        self.update_label()
+        self.schedule_preview()
+
+    def window_committed(self):
+        """松开鼠标后生成整幅图像"""
+        self.commit_timer.stop()
+        self.apply()
+
+    def gamma_changed(self, value):
+        """修改伽马值"""
+        self.gamma = value
+        if self.raws is not None:
+            self.app.histogram_panel.set_window(*self.panel_window(), self.gamma)
+        self.schedule_preview()
+        self.commit_timer.start(self.COMMIT_DELAY_MS)
+
+    def auto_window_action(self):
+        """按直方图的2%~98%百分位数自动拉伸所选波段"""
+        if self.raws is None:
+            return
+        for i in self.selected():
+            self.windows[i] = histogram_window(self.histograms[i])
+        self.update_controls()
+        self.apply()
+
+    def reset_window_action(self):
+        """恢复所选波段导入时的拉伸"""
+        if self.raws is None:
+            return
+        for i in self.selected():
+            self.windows[i] = self.default_windows[i]
+        if self.band_index < 0:
+            self.gamma = 1.0
+        self.update_controls()
+        self.apply()
+
+    def schedule_preview(self):
+        """合并同一轮事件循环中的连续调整"""
+        self.preview_timer.start(0)
+
+    def visible_region(self):
+        """
+        滚动区域中可见部分对应的原始数值范围
+
+        返回:
+            (显示控件中的可见矩形, x0, y0, x1, y1)，没有可见部分时返回None
+        """
+        label = self.app.image_display
+        viewport = self.app.scroll_area.viewport()
+        visible = QRect(label.mapFrom(viewport, QPoint(0, 0)), viewport.size()).intersected(label.rect())
+        if visible.isEmpty():
+            return None
+        height, width = self.raws[0].shape
+        scale_x, scale_y = label.width() / width, label.height() / height
+        x0 = max(0, int(visible.left() / scale_x))
+        y0 = max(0, int(visible.top() / scale_y))
+        x1 = min(width, int(math.ceil((visible.right() + 1) / scale_x)))
+        y1 = min(height, int(math.ceil((visible.bottom() + 1) / scale_y)))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return visible, x0, y0, x1, y1
+
+    @tracer.traced("contrast.preview")
+    def preview(self):
+        """只对可见区域查表，显示在图像上方的预览层中，耗时与窗口大小有关、与图像大小无关"""
+        if not self.can_apply():
+            return
+        region = self.visible_region()
+        if region is None:
+            return
+        _, x0, y0, x1, y1 = region
+        label = self.app.image_display
+        height, width = self.raws[0].shape
+        scale_x, scale_y = label.width() / width, label.height() / height
+        # 缩小显示时按屏幕像素抽样，不处理看不到的像素
+        step = max(1, int(1 / max(scale_x, scale_y)))
+        with tracer.span("contrast.window", visible=(x1 - x0) * (y1 - y0), step=step):
+            display = apply_windows([raw[y0:y1:step, x0:x1:step] for raw in self.raws], self.windows, self.gamma)
+        target = QRect(int(round(x0 * scale_x)), int(round(y0 * scale_y)),
+                       int(round((x1 - x0) * scale_x)), int(round((y1 - y0) * scale_y)))
+        with tracer.span("qimage"):
+            pixmap = QPixmap.fromImage(array_to_qimage(display))
+            if pixmap.size() != target.size():
+                pixmap = pixmap.scaled(target.size(), Qt.IgnoreAspectRatio, Qt.FastTransformation)
+        if self.preview_label is None:
+            self.preview_label = QLabel(label)
+            self.preview_label.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.preview_label.setPixmap(pixmap)
+        self.preview_label.setGeometry(target)
+        self.preview_label.show()
+        self.preview_label.raise_()
+
+    def hide_preview(self):
+        """隐藏预览层"""
+        if self.preview_label is not None:
+            self.preview_label.hide()
+            self.preview_label.clear()
+
+    def can_apply(self):
+        """当前显示的图像能否替换为重新拉伸的结果"""
+        if not self.active():
+            return False
+        handler = self.app.image_handler
+        # 查看原图或裁剪时不替换正在显示的图像
+        if handler.cropping or hasattr(handler, 'temp_current_image'):
+            return False
+        height, width = self.raws[0].shape
+        backup = handler.backup_image
+        return not backup or (backup.width(), backup.height()) == (width, height)
+
+    @tracer.traced("contrast.apply")
+    def apply(self):
+        """用当前窗口重新生成整幅显示图像，替换底图并重新合成叠加层和标注"""
+        self.preview_timer.stop()
+        self.commit_timer.stop()
+        if not self.can_apply():
+            self.hide_preview()
+            return
+        handler = self.app.image_handler
+        with tracer.span("contrast.window"):
+            display = apply_windows(self.raws, self.windows, self.gamma)
+        with tracer.span("qimage"):
+            pixmap = QPixmap.fromImage(array_to_qimage(display))
+        if self.source_path == getattr(self.app, 'original_file_path', None):
+            handler.original_image = pixmap
+        handler.backup_image = QPixmap(pixmap)
+        if handler.overlays or self.app.annotation_handler.polygons or self.app.annotation_handler.annotating:
+            handler.refresh_overlays()
+        else:
+            handler.display_image(pixmap)
+        self.hide_preview()
@@ -1,8 +1,30 @@
 import os
-from PyQt5.QtWidgets import QFileDialog, QMessageBox
+from PyQt5.QtWidgets import QFileDialog, QMessageBox, QInputDialog
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
 
+from modules.background_task import BackgroundTask
+from utils.chip_extractor import extract_annotation_chips
+from utils.memory_budget import memory_budget
+from utils.trace import tracer
+
+
+def list_cropped_images(cropped_dir, progress=None):
+    """
+    列出裁剪目录中的图片文件(供后台任务调用)
+
+    参数:
+        cropped_dir: 裁剪目录
+        progress: 进度回调，未使用
+
+    返回:
+        排序后的文件名列表，目录不存在时返回None
+    """
+    if not os.path.exists(cropped_dir):
+        return None
+    return sorted(f for f in os.listdir(cropped_dir)
+                  if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')))
+
 class FileOperations:
     """处理文件相关操作，包括导入、保存和管理文件"""
     
@@ -15,6 +37,13 @@ class FileOperations:
         self.app = app
         # 使用主应用中定义的裁剪目录路径
         self.cropped_dir = self.app.cropped_dir
+        # 按标注批量裁剪的输出目录
+        self.objects_dir = os.path.join(self.cropped_dir, "objects")
+        # 与预处理守护进程共用的分块缓存目录
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.cache_root = os.path.join(app_dir, "cache", "tiles")
+        self.chip_task = None
+        self.scan_task = None
     
     def import_image_action(self):
         """导入图片按钮的动作"""
@@ -27,8 +56,12 @@ class FileOperations:
         if file_path:
             self.load_image(file_path)
     
+    @tracer.traced("load_image")
     def load_image(self, file_path):
         """加载图片"""
+        # 正在标注时先把多边形保存到当前图像，导入后标注属于新图像
+        if self.app.annotation_handler.annotating:
+            self.app.annotation_handler.finish_annotation()
         try:
             # 显示正在加载提示
             self.app.statusBar.showMessage(f"正在加载 {os.path.basename(file_path)}，请稍候...")
@@ -39,10 +72,26 @@ class FileOperations:
             
             # 根据文件类型调用不同的加载函数
             if file_path.lower().endswith(('.tif', '.tiff')):
-                from modules.image_import import load_geotiff_with_gdal, load_tiff_image, GDAL_AVAILABLE
+                from modules.image_import import (load_cached_display, load_geotiff_with_gdal, load_tiff_image,
+                                                  load_raw_display, gdal_available)
                 
+                # 已经预处理过的图像直接读取缓存的显示图像，调整拉伸用的原始数值在显示后于后台读取
+                raw_display = None
+                pixmap = load_cached_display(file_path, self.cache_root)
+                from_cache = pixmap is not None
+                if not from_cache:
+                    # 保留显示波段的原始数值(如16位)，调整拉伸时只查表、不重新读取；原始数值最多占内存预算的一半
+                    try:
+                        raw_display = load_raw_display(file_path, max_bytes=memory_budget.limit // 2)
+                    except Exception as e:
+                        self.app.statusBar.showMessage(f"按原始数值加载失败，使用固定拉伸显示: {str(e)}")
+                if raw_display is not None:
+                    pixmap, raws, windows, nodata = raw_display
+                    self.app.statusBar.showMessage("已按原始数值加载图像，可在直方图中调整拉伸")
+                elif from_cache:
+                    self.app.statusBar.showMessage("已从预处理缓存加载GeoTIFF文件")
                 # 优先使用GDAL库加载GeoTIFF文件
-                if GDAL_AVAILABLE:
+                elif gdal_available():
                     try:
                         pixmap = load_geotiff_with_gdal(file_path)
                         self.app.statusBar.showMessage("使用GDAL库成功加载GeoTIFF文件")
@@ -54,14 +103,28 @@ class FileOperations:
                     # GDAL不可用时使用PIL
                     pixmap = load_tiff_image(file_path)
             else:
-                pixmap = QPixmap(file_path)
+                raw_display = None
+                from_cache = False
+                with tracer.span("decode.qpixmap"):
+                    pixmap = QPixmap(file_path)
                 
             if not pixmap.isNull():
+                if raw_display is not None:
+                    self.app.contrast_handler.set_source(file_path, raws, windows, nodata)
+                elif from_cache:
+                    self.app.contrast_handler.load_source_async(file_path, None)
+                else:
+                    self.app.contrast_handler.clear()
                 self.app.original_file_path = file_path  # 保存原始文件路径
+                # 新导入的图像没有标注，清除上一幅图像的多边形和叠加层
+                with tracer.span("clear_annotations"):
+                    self.app.annotation_handler.clear_annotations()
+                self.app.image_handler.clear_overlays()
+                self.app.image_handler.source_path = file_path
                 self.app.image_handler.display_image(pixmap)
                 
-                # 初始化备份图像
-                self.app.image_handler.backup_image = pixmap.copy()
+                # 初始化备份图像(隐式共享，绘制时才复制像素)
+                self.app.image_handler.backup_image = QPixmap(pixmap)
                 
                 # 更新状态和按钮
                 self.app.statusBar.showMessage(f"已加载图片: {os.path.basename(file_path)}")
@@ -69,6 +132,7 @@ class FileOperations:
                     f"图片: {os.path.basename(file_path)} | 尺寸: {pixmap.width()}x{pixmap.height()}"
                 )
                 self.app.crop_btn.setEnabled(True)
+                self.app.annotation_btn.setEnabled(True)
                 self.app.view_original_btn.setEnabled(True)  # 启用查看原图按钮
                 
                 # 重置裁剪状态
@@ -80,6 +144,10 @@ class FileOperations:
                 self.app.zoom_out_btn.setEnabled(True)
                 self.app.reset_zoom_btn.setEnabled(True)
                 self.app.zoom_controller.reset_zoom()  # 重置缩放比例
+                
+                # 之后的标注保存到导入的图像，加载该图像已有的标注
+                self.app.current_file_path = file_path
+                self.app.annotation_handler.load_annotations(file_path)
             else:
                 self.app.image_display.setText("无法加载图片")
         except Exception as e:
@@ -88,17 +156,31 @@ class FileOperations:
     
     def load_cropped_images(self):
         """加载裁剪后的图片文件列表"""
-        if not os.path.exists(self.cropped_dir):
+        self.show_cropped_images(list_cropped_images(self.cropped_dir))
+
+    def load_cropped_images_async(self, on_finished=None):
+        """
+        在后台扫描裁剪目录，完成后填充文件列表(启动时使用，不阻塞窗口显示)
+
+        参数:
+            on_finished: 扫描结束(成功或失败)后在界面线程中调用
+        """
+        self.scan_task = BackgroundTask(list_cropped_images, self.cropped_dir, parent=self.app)
+        self.scan_task.succeeded.connect(self.show_cropped_images)
+        if on_finished:
+            self.scan_task.finished.connect(on_finished)
+        self.scan_task.start()
+
+    def show_cropped_images(self, image_files):
+        """用扫描得到的文件名列表填充文件列表"""
+        if image_files is None:
             return
         # 清空现有列表
         self.app.file_list.clear()
         # 重置计数器，我们将根据实际文件重新计算
         max_counter = 0  # 使用局部变量记录最大编号
-        # 获取所有图片文件并排序
-        image_files = [f for f in os.listdir(self.cropped_dir) 
-                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'))]
         # 添加到列表，并使用更友好的显示名称
-        for i, file_name in enumerate(sorted(image_files)):
+        for i, file_name in enumerate(image_files):
             # 提取数字编号
             counter = i + 1  # 默认按顺序编号
             # 尝试从文件名中提取实际编号
@@ -150,9 +232,12 @@ class FileOperations:
                 pixmap = QPixmap(file_path)
                 if not pixmap.isNull():
                     # 更新当前图像
+                    self.app.contrast_handler.clear()
+                    self.app.image_handler.clear_overlays()
+                    self.app.image_handler.source_path = file_path
                     self.app.image_handler.current_image = pixmap
-                    # 初始化备份图像
-                    self.app.image_handler.backup_image = pixmap.copy()
+                    # 初始化备份图像(隐式共享，绘制时才复制像素)
+                    self.app.image_handler.backup_image = QPixmap(pixmap)
                     
                     # 保持原始尺寸比例调整图像大小
                     display_size = self.app.image_display.size()
@@ -268,3 +353,64 @@ class FileOperations:
         
         # 显示菜单
         context_menu.exec_(self.app.file_list.mapToGlobal(position))
+
+    def image_search_dirs(self):
+        """查找标注源图像的目录：裁剪目录和当前导入图像所在的目录"""
+        dirs = [self.cropped_dir]
+        original = getattr(self.app, 'original_file_path', None)
+        if original and os.path.dirname(os.path.abspath(original)) not in dirs:
+            dirs.append(os.path.dirname(os.path.abspath(original)))
+        return dirs
+
+    def extract_object_chips_action(self):
+        """按标注多边形批量裁剪图片(每个多边形一张)"""
+        if self.chip_task and self.chip_task.isRunning():
+            QMessageBox.information(self.app, "提示", "批量裁剪正在进行中")
+            return
+        
+        handler = self.app.annotation_handler
+        all_labels = "全部标签"
+        label, ok = QInputDialog.getItem(
+            self.app, "按标注批量裁剪", "选择要裁剪的标签:",
+            [all_labels] + list(handler.labels.keys()), 0, False
+        )
+        if not ok:
+            return
+        margin, ok = QInputDialog.getInt(
+            self.app, "按标注批量裁剪", "多边形四周的边距(像素):", 64, 0, 4096
+        )
+        if not ok:
+            return
+        reply = QMessageBox.question(
+            self.app, "按标注批量裁剪", "是否将多边形外的像素设为透明？",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        
+        self.chip_task = BackgroundTask(
+            extract_annotation_chips,
+            handler.annotations_dir,
+            self.image_search_dirs(),
+            self.objects_dir,
+            labels=None if label == all_labels else {label},
+            margin=margin,
+            mask_outside=reply == QMessageBox.Yes,
+            parent=self.app
+        )
+        self.chip_task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在按标注批量裁剪: {done}/{total} 个标注文件")
+        )
+        self.chip_task.succeeded.connect(self.on_object_chips_finished)
+        self.chip_task.failed.connect(
+            lambda message: self.app.statusBar.showMessage(f"批量裁剪出错: {message}")
+        )
+        self.chip_task.start()
+        self.app.statusBar.showMessage("正在按标注批量裁剪...")
+    
+    def on_object_chips_finished(self, result):
+        """批量裁剪完成"""
+        message = f"批量裁剪完成，共生成 {result['chips']} 张图片，保存在 {self.objects_dir}"
+        if result['errors']:
+            message += f"，{len(result['errors'])} 个错误"
+            for error in result['errors']:
+                print(f"批量裁剪错误: {error}")
+        self.app.statusBar.showMessage(message)
@@ -1,6 +1,9 @@
 import os
-from PyQt5.QtCore import Qt, QRect, QPoint
-from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor
+from PyQt5.QtCore import Qt, QRect, QRectF, QPoint
+from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor, QImage
+
+from modules.memory_handler import restore_pixmap
+from utils.trace import tracer
 
 class ImageHandler:
     """处理图像相关操作的类，包括裁剪、显示等功能"""
@@ -19,6 +22,10 @@ class ImageHandler:
         self.cropping = False
         self.crop_start_pos = None
         self.crop_rect = None
+        self.source_path = None  # 当前显示图像对应的源文件
+        self.overlays = {}  # 叠加层 {名称: QImage 或矢量叠加层}，绘制时缩放到图像大小
+        self.overlay_pixmap = None  # 最近一次合成的叠加图像
+        self.overlay_level = None  # 最近一次绘制矢量叠加层时的细节级别
         
     def display_image(self, pixmap):
         """在显示区域显示图片，考虑当前的缩放比例"""
@@ -32,6 +39,8 @@ class ImageHandler:
     def view_original_image(self):
         """查看原始图片"""
         if self.original_image:
+            # 超出内存预算时原图可能已转存到磁盘
+            self.original_image = restore_pixmap(self.original_image)
             # 存储当前状态
             self.temp_current_image = self.current_image
             self.temp_crop_state = self.cropping
@@ -64,6 +73,7 @@ class ImageHandler:
         """从查看原图状态恢复到当前图片状态"""
         if hasattr(self, 'temp_current_image') and self.temp_current_image:
             # 恢复当前图片
+            self.temp_current_image = restore_pixmap(self.temp_current_image)
             self.current_image = self.temp_current_image
             self.display_image(self.temp_current_image)
             
@@ -86,6 +96,76 @@ class ImageHandler:
             if hasattr(self, 'temp_crop_state'):
                 delattr(self, 'temp_crop_state')
 
+    def is_composited(self):
+        """当前显示的图像是否是在底图上绘制了标注或叠加层的合成图"""
+        return (self.current_image is not None and
+                (self.current_image is self.overlay_pixmap or
+                 self.current_image is self.app.annotation_handler.annotated_pixmap))
+
+    def set_overlay(self, name, image):
+        """设置或移除叠加层并刷新显示
+        
+        参数:
+            name: 叠加层名称
+            image: QImage 或带 paint(painter, target, level, band_zoom) 方法的矢量叠加层，
+                为None时移除该叠加层
+        """
+        if image is None:
+            self.overlays.pop(name, None)
+        else:
+            self.overlays[name] = image
+        self.refresh_overlays()
+
+    def clear_overlays(self):
+        """清除所有叠加层(切换图像时调用)"""
+        self.overlays = {}
+        self.overlay_pixmap = None
+
+    @tracer.traced("overlays.paint")
+    def paint_overlays(self, painter, pixmap):
+        """在画布上绘制所有叠加层"""
+        target = QRectF(0, 0, pixmap.width(), pixmap.height())
+        level, band_zoom = self.app.annotation_handler.lod_for_zoom(self.app.zoom_controller.zoom_factor)
+        for overlay in self.overlays.values():
+            if isinstance(overlay, QImage):
+                painter.drawImage(target, overlay)
+            else:
+                overlay.paint(painter, target, level, band_zoom)
+        self.overlay_level = level
+
+    def update_overlay_lod(self, zoom):
+        """缩放比例变化后，细节级别改变时重新绘制矢量叠加层
+        
+        返回:
+            是否已重新绘制
+        """
+        if self.current_image is None or self.current_image is not self.overlay_pixmap:
+            return False
+        if all(isinstance(overlay, QImage) for overlay in self.overlays.values()):
+            return False
+        if self.app.annotation_handler.lod_for_zoom(zoom)[0] == self.overlay_level:
+            return False
+        self.refresh_overlays()
+        return True
+
+    @tracer.traced("refresh_overlays")
+    def refresh_overlays(self):
+        """重新合成底图、叠加层和标注并显示"""
+        if not self.backup_image:
+            return
+        handler = self.app.annotation_handler
+        if handler.polygons or handler.annotating:
+            # 标注绘制时会先绘制叠加层
+            handler.draw_annotations()
+            return
+        pixmap = self.backup_image.copy()
+        if self.overlays:
+            painter = QPainter(pixmap)
+            self.paint_overlays(painter, pixmap)
+            painter.end()
+        self.overlay_pixmap = pixmap
+        self.display_image(pixmap)
+
     def toggle_crop(self):
         """切换裁剪模式"""
         if not self.cropping:
@@ -96,7 +176,10 @@ class ImageHandler:
     def start_crop_action(self):
         """开始裁剪"""
         if self.current_image:
-            self.backup_image = self.current_image.copy()  # 保存当前图像的副本
+            # 当前显示的是标注或叠加层合成图时，backup_image 已是干净的底图，不能用合成图覆盖
+            if not self.is_composited():
+                # 隐式共享：只有在其中一个被修改时才真正复制像素
+                self.backup_image = QPixmap(self.current_image)
             self.cropping = True
             self.app.statusBar.showMessage("请在图片上拖动以选择裁剪区域")
             self.app.confirm_crop_btn.setEnabled(True)
@@ -112,12 +195,14 @@ class ImageHandler:
         self.app.cancel_crop_btn.setEnabled(False)
         self.app.statusBar.showMessage("已取消裁剪")
 
+    @tracer.traced("crop_save")
     def confirm_crop(self):
         """确认裁剪"""
         if self.crop_rect and self.current_image:
             try:
                 # 使用backup_image（原始图像）而不是可能包含遮罩的current_image
-                cropped_pixmap = self.backup_image.copy(self.crop_rect)
+                with tracer.span("crop.copy"):
+                    cropped_pixmap = self.backup_image.copy(self.crop_rect)
                 # 递增图片计数器
                 self.app.image_counter += 1
                 # 使用新命名格式保存裁剪后的图片
@@ -128,19 +213,39 @@ class ImageHandler:
                     save_path = os.path.join(self.app.cropped_dir, f"{image_name}_original_{timestamp}.png")
                 else:
                     save_path = os.path.join(self.app.cropped_dir, f"{image_name}_{timestamp}.png")
-                cropped_pixmap.save(save_path)
+                # 将父图像中与裁剪区域相交的标注裁剪到新图中
+                chip_annotations = None
+                if self.annotations_follow_crop():
+                    with tracer.span("crop.annotations"):
+                        chip_annotations = self.app.annotation_handler.build_crop_annotations(self.crop_rect, save_path)
+                with tracer.span("crop.png_encode"):
+                    saved = cropped_pixmap.save(save_path)
+                if not saved:
+                    raise IOError(f"无法保存裁剪图片: {save_path}")
+                if chip_annotations:
+                    try:
+                        self.app.annotation_handler.write_crop_annotations(save_path, chip_annotations)
+                    except Exception:
+                        # 标注写入失败时删除图片，保证图片与标注同时存在
+                        os.remove(save_path)
+                        raise
                 # 显示裁剪后的图片
                 self.current_image = cropped_pixmap
                 self.display_image(cropped_pixmap)
                 # 更新状态
-                self.app.statusBar.showMessage(f"裁剪成功，已保存为: {image_name}")
+                if chip_annotations:
+                    self.app.statusBar.showMessage(
+                        f"裁剪成功，已保存为: {image_name}，带有 {len(chip_annotations['polygons'])} 个标注多边形")
+                else:
+                    self.app.statusBar.showMessage(f"裁剪成功，已保存为: {image_name}")
                 self.app.image_info.setText(
                     f"裁剪后图片: {image_name} | "
                     f"尺寸: {cropped_pixmap.width()}x{cropped_pixmap.height()}"
                 )
                 self.add_to_history(cropped_pixmap)
                 # 刷新文件列表
-                self.app.file_operations.load_cropped_images()
+                with tracer.span("crop.refresh_list"):
+                    self.app.file_operations.load_cropped_images()
                 # 判断之前是否在原图模式
                 if hasattr(self, 'temp_current_image'):
                     # 之前在原图模式，恢复"查看原图"按钮
@@ -156,6 +261,15 @@ class ImageHandler:
             # 重置裁剪状态
             self.reset_crop_state()
 
+    def annotations_follow_crop(self):
+        """判断当前裁剪的图像是否就是已加载标注的图像"""
+        handler = self.app.annotation_handler
+        if not handler.polygons or not handler.image_path:
+            return False
+        if hasattr(self, 'temp_current_image') or self.current_image is self.original_image:
+            return False
+        return handler.image_path == getattr(self.app, 'current_file_path', None)
+
     def reset_crop_state(self):
         """重置裁剪状态"""
         self.crop_rect = None
@@ -171,6 +285,8 @@ class ImageHandler:
         # 添加到历史
         self.app.history.append(pixmap)
         self.app.current_history_index = len(self.app.history) - 1
+        # 历史记录增长后立即检查内存预算
+        self.app.memory_handler.refresh()
         
     def image_mouse_press_event(self, event):
         """鼠标按下事件"""
@@ -180,6 +296,11 @@ class ImageHandler:
             if pos:
                 self.crop_start_pos = pos
                 self.app.statusBar.showMessage("正在选择裁剪区域...")
+        elif self.current_image:
+            # 显示等高线时，点击查看附近等高线的高程
+            pos = self.get_image_position(event.pos())
+            if pos:
+                self.app.contour_handler.show_elevation_at(pos)
 
     def image_mouse_move_event(self, event):
         """鼠标移动事件"""
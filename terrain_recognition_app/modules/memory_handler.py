@@ -0,0 +1,188 @@
+import os
+import uuid
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QImage, QPixmap
+
+from utils.memory_budget import (memory_budget, format_bytes, PRIORITY_HISTORY, PRIORITY_SPILL, PRIORITY_CACHE,
+                                 PRIORITY_DERIVED, PRIORITY_PINNED)
+
+
+class SpilledPixmap:
+    """转存到磁盘的图像，使用前调用 load() 读回内存
+
+    以原始像素写入，不经过PNG编码，转存和读回的速度接近磁盘速度。
+    """
+
+    def __init__(self, pixmap, spill_dir):
+        """将图像写入转存目录
+
+        参数:
+            pixmap: 要转存的 QPixmap
+            spill_dir: 转存目录
+        """
+        image = pixmap.toImage()
+        self.width = image.width()
+        self.height = image.height()
+        self.format = image.format()
+        self.bytes_per_line = image.bytesPerLine()
+        self.nbytes = image.sizeInBytes()
+        os.makedirs(spill_dir, exist_ok=True)
+        self.path = os.path.join(spill_dir, f"{uuid.uuid4().hex}.raw")
+        with open(self.path, 'wb') as f:
+            f.write(image.constBits().asstring(self.nbytes))
+
+    def load(self):
+        """读回图像并删除转存文件
+
+        返回:
+            QPixmap对象
+        """
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        image = QImage(data, self.width, self.height, self.bytes_per_line, self.format).copy()
+        self.discard()
+        return QPixmap.fromImage(image)
+
+    def discard(self):
+        """删除转存文件"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __del__(self):
+        self.discard()
+
+
+def restore_pixmap(image):
+    """转存的图像读回内存，其他值原样返回"""
+    if isinstance(image, SpilledPixmap):
+        return image.load()
+    return image
+
+
+def pixmap_item(pixmap, priority, release=None):
+    """QPixmap 的内存登记项，隐式共享的副本键相同、只计一次"""
+    nbytes = pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+    return (('pixmap', pixmap.cacheKey()), nbytes, priority, release)
+
+
+class MemoryHandler:
+    """内存预算：统计界面持有的图像和缓存，超出预算时转存历史记录和暂不显示的图像、丢弃可重建的缓存"""
+
+    REFRESH_MS = 1000  # 统计和执行预算的间隔
+
+    def __init__(self, app):
+        """初始化内存预算处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        self.budget = memory_budget
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.spill_dir = os.path.join(app_dir, "cache", "spill")
+        self.clear_spill_dir()
+        self.timer = QTimer(app)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_MS)
+
+    def clear_spill_dir(self):
+        """删除上次运行遗留的转存文件"""
+        if not os.path.isdir(self.spill_dir):
+            return
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".raw"):
+                try:
+                    os.remove(os.path.join(self.spill_dir, name))
+                except OSError:
+                    pass
+
+    def image_items(self):
+        """图像处理器持有的图像"""
+        handler = self.app.image_handler
+        items = []
+        for name in ('current_image', 'backup_image'):
+            pixmap = getattr(handler, name, None)
+            if isinstance(pixmap, QPixmap) and not pixmap.isNull():
+                items.append(pixmap_item(pixmap, PRIORITY_PINNED))
+        displayed = self.app.image_display.pixmap()
+        if displayed is not None and not displayed.isNull():
+            items.append(pixmap_item(displayed, PRIORITY_PINNED))
+        for name in ('original_image', 'temp_current_image'):
+            pixmap = getattr(handler, name, None)
+            if isinstance(pixmap, QPixmap) and not pixmap.isNull():
+                items.append(pixmap_item(pixmap, PRIORITY_SPILL, lambda name=name: self.spill_attribute(name)))
+        return items
+
+    def derived_items(self):
+        """叠加层和标注的合成图，淘汰后在下次绘制时重建"""
+        items = []
+        image_handler = self.app.image_handler
+        if image_handler.overlay_pixmap is not None:
+            items.append(pixmap_item(image_handler.overlay_pixmap, PRIORITY_DERIVED,
+                                     lambda: setattr(image_handler, 'overlay_pixmap', None)))
+        annotation_handler = self.app.annotation_handler
+        if annotation_handler.annotated_pixmap is not None:
+            items.append(pixmap_item(annotation_handler.annotated_pixmap, PRIORITY_DERIVED,
+                                     lambda: setattr(annotation_handler, 'annotated_pixmap', None)))
+        return items
+
+    def history_items(self):
+        """历史记录中的图像"""
+        items = []
+        for pixmap in self.app.history:
+            if isinstance(pixmap, QPixmap) and not pixmap.isNull():
+                items.append(pixmap_item(pixmap, PRIORITY_HISTORY, lambda pixmap=pixmap: self.spill_history(pixmap)))
+        return items
+
+    def pixel_items(self):
+        """标注使用的底图像素数组和边缘代价图"""
+        handler = self.app.annotation_handler
+        if handler.pixels is None:
+            return []
+        key, array, cost_map = handler.pixels
+        nbytes = array.nbytes + sum(tile.nbytes for tile in cost_map.tiles.values())
+        # 智能剪刀正在使用代价图时不能释放
+        release = None if handler.wire is not None else lambda: setattr(handler, 'pixels', None)
+        return [(('pixels', key), nbytes, PRIORITY_CACHE, release)]
+
+    def raw_items(self):
+        """显示波段保留的原始数值，调整拉伸需要，只计数不释放"""
+        raws = self.app.contrast_handler.raws
+        if raws is None:
+            return []
+        return [(('raw', id(raw)), raw.nbytes, PRIORITY_PINNED, None) for raw in raws]
+
+    def spill_attribute(self, name):
+        """将图像处理器中暂不显示的图像转存到磁盘"""
+        handler = self.app.image_handler
+        pixmap = getattr(handler, name, None)
+        if isinstance(pixmap, QPixmap):
+            setattr(handler, name, SpilledPixmap(pixmap, self.spill_dir))
+
+    def spill_history(self, pixmap):
+        """将历史记录中的图像转存到磁盘"""
+        for i, item in enumerate(self.app.history):
+            if item is pixmap:
+                self.app.history[i] = SpilledPixmap(pixmap, self.spill_dir)
+                return
+
+    def refresh(self):
+        """重新统计持有的图像，执行预算并更新状态栏"""
+        self.budget.replace_group("图像", self.image_items())
+        self.budget.replace_group("合成图", self.derived_items())
+        self.budget.replace_group("历史记录", self.history_items())
+        self.budget.replace_group("像素缓存", self.pixel_items())
+        self.budget.replace_group("原始数值", self.raw_items())
+        self.budget.enforce()
+        self.update_label()
+
+    def update_label(self):
+        """在状态栏显示内存用量，提示中列出各分组"""
+        total, groups = self.budget.usage()
+        self.app.memory_label.setText(f"内存 {format_bytes(total)} / {format_bytes(self.budget.limit)}")
+        lines = [f"{group}: {format_bytes(nbytes)}" for group, nbytes in sorted(groups.items(), key=lambda item: -item[1])]
+        lines.append(f"已转存或释放 {self.budget.evictions} 项，共 {format_bytes(self.budget.evicted_bytes)}")
+        lines.append("设置环境变量 TERRAIN_MEMORY_MB 调整预算")
+        self.app.memory_label.setToolTip("\n".join(lines))
@@ -0,0 +1,208 @@
+import numpy as np
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QPolygonF
+
+from utils.geometry import pack_polygons, simplify_polygon
+
+
+class PolygonStore:
+    """紧凑的多边形存储
+
+    所有顶点保存在一个连续的 float32 坐标数组中，通过偏移量数组划分多边形；
+    标签以整数编号保存，标签名和颜色各存一份。每个多边形的 QPolygonF 按需创建并缓存。
+    """
+
+    def __init__(self):
+        self.coords = np.zeros((0, 2), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.label_ids = np.zeros(0, dtype=np.int32)
+        self.label_names = []  # 标签编号 → 标签名
+        self.label_colors = []  # 标签编号 → 颜色
+        self._label_lookup = {}  # 标签名 → 标签编号
+        self._qpolygons = []  # QPolygonF 缓存
+        self._lod_qpolygons = {}  # {细节级别: QPolygonF 缓存列表}
+        self._bounds = None  # 外接矩形缓存
+        self.version = 0  # 内容每次变化时递增，供依赖缓存判断是否失效
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def __bool__(self):
+        return len(self.label_ids) > 0
+
+    def __iter__(self):
+        """逐个返回 (points, label, color)，points 为坐标数组视图"""
+        for i in range(len(self)):
+            yield self.points(i), self.label(i), self.color(i)
+
+    @property
+    def nbytes(self):
+        """坐标、偏移量和标签编号数组占用的字节数"""
+        return self.coords.nbytes + self.offsets.nbytes + self.label_ids.nbytes
+
+    def points(self, index):
+        """获取第 index 个多边形的坐标数组(视图)"""
+        return self.coords[self.offsets[index]:self.offsets[index + 1]]
+
+    def label(self, index):
+        """获取第 index 个多边形的标签名"""
+        return self.label_names[self.label_ids[index]]
+
+    def color(self, index):
+        """获取第 index 个多边形的颜色"""
+        return self.label_colors[self.label_ids[index]]
+
+    def qpolygon(self, index):
+        """获取第 index 个多边形的 QPolygonF(缓存)"""
+        poly = self._qpolygons[index]
+        if poly is None:
+            poly = QPolygonF([QPointF(x, y) for x, y in self.points(index).tolist()])
+            self._qpolygons[index] = poly
+        return poly
+
+    def bounds(self):
+        """获取所有多边形的外接矩形
+
+        返回:
+            (M, 4) float32 数组，每行为 (min_x, min_y, max_x, max_y)
+        """
+        if self._bounds is None:
+            count = len(self)
+            bounds = np.zeros((count, 4), dtype=np.float32)
+            lengths = np.diff(self.offsets)
+            non_empty = lengths > 0
+            if non_empty.any():
+                starts = self.offsets[:-1][non_empty]
+                bounds[non_empty, 0] = np.minimum.reduceat(self.coords[:, 0], starts)
+                bounds[non_empty, 1] = np.minimum.reduceat(self.coords[:, 1], starts)
+                bounds[non_empty, 2] = np.maximum.reduceat(self.coords[:, 0], starts)
+                bounds[non_empty, 3] = np.maximum.reduceat(self.coords[:, 1], starts)
+            self._bounds = bounds
+        return self._bounds
+
+    def lod_qpolygon(self, index, level, tolerance):
+        """获取指定细节级别下简化后的 QPolygonF(缓存)
+
+        参数:
+            index: 多边形索引
+            level: 细节级别编号，0为完整细节
+            tolerance: 该级别的简化容差(图像像素)
+        """
+        if level == 0 or tolerance <= 0:
+            return self.qpolygon(index)
+        cache = self._lod_qpolygons.get(level)
+        if cache is None or len(cache) != len(self):
+            cache = [None] * len(self)
+            self._lod_qpolygons[level] = cache
+        poly = cache[index]
+        if poly is None:
+            points = simplify_polygon(self.points(index), tolerance)
+            poly = QPolygonF([QPointF(x, y) for x, y in points.tolist()])
+            cache[index] = poly
+        return poly
+
+    def label_id(self, label, color):
+        """获取标签编号，标签不存在时加入标签表"""
+        label_id = self._label_lookup.get(label)
+        if label_id is None:
+            label_id = len(self.label_names)
+            self._label_lookup[label] = label_id
+            self.label_names.append(label)
+            self.label_colors.append(color)
+        return label_id
+
+    def append(self, points, label, color, tolerance=0.0):
+        """添加一个多边形
+
+        参数:
+            points: 点列表 [(x, y), ...] 或 (N, 2) 数组
+            label: 标签名
+            color: 标签颜色
+            tolerance: Douglas-Peucker 简化容差(像素)，0表示不简化
+        """
+        points = simplify_polygon(points, tolerance).astype(np.float32)
+        self.coords = np.concatenate([self.coords, points])
+        self.offsets = np.append(self.offsets, self.offsets[-1] + len(points))
+        self.label_ids = np.append(self.label_ids, np.int32(self.label_id(label, color)))
+        self._appended(1)
+
+    def extend(self, polygons):
+        """一次性添加多个多边形
+
+        参数:
+            polygons: (points, label, color) 序列
+        """
+        polygons = list(polygons)
+        if not polygons:
+            return
+        coords, offsets = pack_polygons([points for points, _, _ in polygons])
+        ids = np.array([self.label_id(label, color) for _, label, color in polygons], dtype=np.int32)
+        self.coords = np.concatenate([self.coords, coords.astype(np.float32)])
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + offsets[1:]])
+        self.label_ids = np.concatenate([self.label_ids, ids])
+        self._appended(len(polygons))
+
+    def clear(self):
+        """清空所有多边形和标签表"""
+        self.__init__()
+
+    def remove_label(self, label):
+        """删除指定标签的所有多边形"""
+        label_id = self._label_lookup.get(label)
+        if label_id is None:
+            return
+        keep = self.label_ids != label_id
+        self._select(keep)
+
+    def rename_label(self, old_label, new_label, color):
+        """重命名标签并更新颜色，只需修改标签表"""
+        label_id = self._label_lookup.pop(old_label, None)
+        if label_id is None:
+            return
+        existing = self._label_lookup.get(new_label)
+        if existing is not None and existing != label_id:
+            # 与已有标签合并
+            self.label_ids[self.label_ids == label_id] = existing
+            label_id = existing
+        self._label_lookup[new_label] = label_id
+        self.label_names[label_id] = new_label
+        self.label_colors[label_id] = color
+        self.version += 1
+
+    def to_records(self):
+        """转换为可写入JSON的多边形记录列表"""
+        records = []
+        for points, label, color in self:
+            if np.array_equal(points, np.round(points)):
+                points = points.astype(np.int64)
+            records.append({
+                'points': points.tolist(),
+                'label': label,
+                'color': color
+            })
+        return records
+
+    def _select(self, keep):
+        """只保留掩码为True的多边形"""
+        lengths = np.diff(self.offsets)
+        point_mask = np.repeat(keep, lengths)
+        self.coords = self.coords[point_mask]
+        self.offsets = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(lengths[keep], out=self.offsets[1:])
+        self.label_ids = self.label_ids[keep]
+        self._qpolygons = [poly for poly, k in zip(self._qpolygons, keep) if k]
+        self._invalidate()
+
+    def _appended(self, count):
+        """末尾添加多边形后补齐缓存，已有多边形的简化结果保留"""
+        self._qpolygons.extend([None] * count)
+        for cache in self._lod_qpolygons.values():
+            cache.extend([None] * count)
+        self._bounds = None
+        self.version += 1
+
+    def _invalidate(self):
+        """几何发生变化后清除派生缓存"""
+        self._lod_qpolygons = {}
+        self._bounds = None
+        self.version += 1
@@ -0,0 +1,62 @@
+import os
+from PyQt5.QtCore import QObject, QTimer, QCoreApplication, pyqtSignal
+
+from utils.stall import StallDetector
+from widgets.stall_report_dialog import StallReportDialog
+
+
+class _StallNotifier(QObject):
+    """把看门狗线程中的卡顿通知转到界面线程"""
+
+    stalled = pyqtSignal(object)  # 卡顿信号，携带 StallEpisode
+
+
+class StallHandler:
+    """界面卡顿检测：事件循环超过阈值没有响应时采样界面线程的调用栈，并提供按处理函数汇总的报告"""
+
+    HEARTBEAT_MS = 50  # 心跳定时器间隔
+
+    def __init__(self, app):
+        """初始化卡顿检测
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        # 环境变量 TERRAIN_STALL_MS 设置卡顿阈值(毫秒)，0 表示关闭检测
+        threshold_ms = int(os.environ.get("TERRAIN_STALL_MS", "250") or 0)
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.detector = StallDetector(
+            threshold=threshold_ms / 1000,
+            heartbeat_interval=self.HEARTBEAT_MS / 1000,
+            log_path=os.path.join(app_dir, "logs", "stalls.log"),
+        )
+
+        self.notifier = _StallNotifier()
+        self.notifier.stalled.connect(self.on_stall)
+        self.detector.listeners.append(self.notifier.stalled.emit)
+
+        self.timer = QTimer(app)
+        self.timer.timeout.connect(self.detector.heartbeat)
+        if threshold_ms > 0:
+            self.timer.start(self.HEARTBEAT_MS)
+            self.detector.start()
+            qt_app = QCoreApplication.instance()
+            if qt_app is not None:
+                qt_app.aboutToQuit.connect(self.stop)
+
+    def stop(self):
+        """停止检测"""
+        self.timer.stop()
+        self.detector.stop()
+
+    def on_stall(self, episode):
+        """卡顿结束后在状态栏提示"""
+        self.app.statusBar.showMessage(
+            f"界面卡顿 {episode.duration * 1000:.0f}ms: {episode.handler}", 5000
+        )
+
+    def show_report(self):
+        """显示卡顿报告"""
+        dialog = StallReportDialog(self.detector, self.app)
+        dialog.exec_()
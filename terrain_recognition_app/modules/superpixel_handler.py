@@ -0,0 +1,193 @@
+import numpy as np
+from PyQt5.QtGui import QPen, QColor, QBrush
+
+from modules.background_task import BackgroundTask
+from modules.contour_handler import array_to_qpolygonf
+from utils.region_grow import trace_outlines
+from utils.superpixels import SuperpixelMap, compute_superpixels
+
+
+class SuperpixelSelectionOverlay:
+    """已选超像素并集的矢量叠加层"""
+
+    def __init__(self, outlines, color, width, height):
+        """初始化
+
+        参数:
+            outlines: 外轮廓列表，坐标为源图像像素坐标
+            color: 填充颜色
+            width, height: 源图像大小
+        """
+        self.polygons = [array_to_qpolygonf(outline) for outline in outlines]
+        self.color = color
+        self.width = width
+        self.height = height
+
+    def paint(self, painter, target, level, band_zoom):
+        """在画布的目标区域内绘制选区"""
+        painter.save()
+        painter.translate(target.x(), target.y())
+        painter.scale(target.width() / self.width, target.height() / self.height)
+        fill_color = QColor(self.color)
+        fill_color.setAlpha(90)
+        painter.setBrush(QBrush(fill_color))
+        pen = QPen(QColor(self.color))
+        pen.setWidthF(1.0 / band_zoom)
+        painter.setPen(pen)
+        for polygon in self.polygons:
+            painter.drawPolygon(polygon)
+        painter.restore()
+
+
+class SuperpixelHandler:
+    """超像素的后台预计算，以及标注时按超像素点选/涂抹选区"""
+
+    OVERLAY_NAME = "superpixels"
+
+    def __init__(self, app):
+        """初始化超像素处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        self.enabled = False  # 超像素模式：标注时单击或拖动选择超像素
+        self.maps = {}  # {源文件: SuperpixelMap}
+        self.selected = set()  # 已选超像素编号
+        self.selection_source = None  # 选区所属的源文件
+        self.task = None
+
+    def set_enabled(self, enabled):
+        """开启或关闭超像素模式，开启时准备当前图像的超像素"""
+        self.enabled = enabled
+        if enabled:
+            self.current_map()
+        else:
+            self.clear_selection()
+
+    def current_map(self):
+        """
+        获取当前图像的超像素，没有缓存时在后台开始计算
+
+        返回:
+            SuperpixelMap，尚未计算完成时返回None
+        """
+        source_path = self.app.image_handler.source_path
+        if not source_path:
+            return None
+        superpixels = self.maps.get(source_path)
+        if superpixels is None:
+            superpixels = SuperpixelMap.open_cached(source_path)
+            if superpixels is not None:
+                self.maps[source_path] = superpixels
+        if superpixels is None:
+            self.start_compute(source_path)
+        return superpixels
+
+    def start_compute(self, source_path):
+        """在后台计算超像素"""
+        if self.task and self.task.isRunning():
+            self.app.statusBar.showMessage("超像素正在计算中，请稍候")
+            return
+        self.task = BackgroundTask(compute_superpixels, source_path, parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在计算超像素: {done}/{total} 个分块")
+        )
+        self.task.succeeded.connect(lambda labels_path: self.on_computed(source_path))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"计算超像素出错: {message}"))
+        self.task.start()
+        self.app.statusBar.showMessage("正在后台计算超像素...")
+
+    def on_computed(self, source_path):
+        """超像素计算完成"""
+        superpixels = SuperpixelMap.open_cached(source_path)
+        if superpixels is None:
+            return
+        self.maps[source_path] = superpixels
+        if self.app.image_handler.source_path == source_path:
+            self.app.statusBar.showMessage("超像素计算完成，单击或拖动选择超像素，按住Ctrl或右键取消选择，双击生成多边形")
+
+    def display_scale(self, superpixels):
+        """标注坐标(显示的底图像素)到源图像像素的缩放比例 (x方向, y方向)"""
+        pixmap = self.app.image_handler.backup_image
+        return superpixels.width / pixmap.width(), superpixels.height / pixmap.height()
+
+    def paint_at(self, x, y, remove=False):
+        """
+        选择或取消选择标注坐标 (x, y) 处的超像素
+
+        参数:
+            x, y: 标注坐标
+            remove: True 表示取消选择
+        """
+        superpixels = self.current_map()
+        if superpixels is None:
+            return
+        source_path = self.app.image_handler.source_path
+        if self.selection_source != source_path:
+            self.selected = set()
+            self.selection_source = source_path
+
+        scale_x, scale_y = self.display_scale(superpixels)
+        label = superpixels.label_at(x * scale_x, y * scale_y)
+        if label is None or (label in self.selected) != remove:
+            return
+        if remove:
+            self.selected.discard(label)
+        else:
+            self.selected.add(label)
+        self.update_overlay()
+
+    def selection_outlines(self):
+        """已选超像素并集的外轮廓(源图像像素坐标)"""
+        superpixels = self.maps.get(self.selection_source)
+        if superpixels is None or not self.selected:
+            return []
+        mask, origin = superpixels.mask(self.selected)
+        return trace_outlines(mask, origin)
+
+    def update_overlay(self):
+        """刷新选区叠加层"""
+        handler = self.app.annotation_handler
+        superpixels = self.maps.get(self.selection_source)
+        if superpixels is None or not self.selected:
+            self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
+            return
+        color = handler.labels.get(handler.current_label, "#FF0000")
+        overlay = SuperpixelSelectionOverlay(self.selection_outlines(), color,
+                                             superpixels.width, superpixels.height)
+        self.app.image_handler.set_overlay(self.OVERLAY_NAME, overlay)
+
+    def commit(self):
+        """
+        将选区矢量化为多边形，添加到当前标签
+
+        返回:
+            添加的多边形数量
+        """
+        handler = self.app.annotation_handler
+        superpixels = self.maps.get(self.selection_source)
+        if superpixels is None or not self.selected or self.selection_source != self.app.image_handler.source_path:
+            return 0
+        scale_x, scale_y = self.display_scale(superpixels)
+        scale = np.array([1.0 / scale_x, 1.0 / scale_y])
+        count = 0
+        for outline in self.selection_outlines():
+            if len(outline) < 3:
+                continue
+            # 像素轮廓是阶梯状的，至少按1像素简化
+            handler.polygons.append(
+                outline * scale,
+                handler.current_label,
+                handler.labels[handler.current_label],
+                max(handler.simplify_tolerance, 1.0)
+            )
+            count += 1
+        self.clear_selection()
+        return count
+
+    def clear_selection(self):
+        """清除选区"""
+        self.selected = set()
+        if self.OVERLAY_NAME in self.app.image_handler.overlays:
+            self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
@@ -0,0 +1,115 @@
+import os
+import numpy as np
+from PyQt5.QtWidgets import QMessageBox
+
+from modules.background_task import BackgroundTask
+from modules.image_import import apply_colormap_jet_vectorized
+from utils.image_processing import array_to_qimage
+from utils.raster_io import RasterSource, to_uint8
+from utils.terrain_derivatives import derive_layer
+from utils.features import feature_layer
+
+
+class TerrainLayerHandler:
+    """DEM地形派生图层(山体阴影、坡度、坡向、曲率)和纹理特征图层的计算和显示"""
+
+    OVERLAY_NAME = "terrain"
+
+    # 显示名称 → 图层名称，None 表示显示原始图像
+    LAYER_NAMES = {
+        "原始图像": None,
+        "山体阴影": "hillshade",
+        "坡度": "slope",
+        "坡向": "aspect",
+        "曲率": "curvature",
+    }
+
+    # 纹理特征图层：显示名称 → 特征名称，任意波段数的图像都可以计算
+    TEXTURE_NAMES = {
+        "纹理: 局部标准差": "local_std",
+        "纹理: 梯度": "gradient",
+        "纹理: GLCM对比度": "contrast",
+        "纹理: GLCM同质性": "homogeneity",
+        "纹理: GLCM熵": "entropy",
+    }
+
+    def __init__(self, app):
+        """初始化图层处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.cache_root = os.path.join(app_dir, "cache", "tiles")
+        self.layer_images = {}  # {(源文件, 图层): QImage}
+        self.task = None
+
+    def select_layer(self, display_name):
+        """切换显示图层
+
+        参数:
+            display_name: 图层显示名称，见 LAYER_NAMES
+        """
+        texture = display_name in self.TEXTURE_NAMES
+        layer = self.TEXTURE_NAMES[display_name] if texture else self.LAYER_NAMES.get(display_name)
+        source_path = self.app.image_handler.source_path
+        if layer is None or not source_path:
+            self.app.image_handler.set_overlay(self.OVERLAY_NAME, None)
+            return
+
+        cached = self.layer_images.get((source_path, layer))
+        if cached is not None:
+            self.app.image_handler.set_overlay(self.OVERLAY_NAME, cached)
+            self.app.statusBar.showMessage(f"已显示{display_name}图层")
+            return
+
+        if self.task and self.task.isRunning():
+            QMessageBox.information(self.app, "提示", "地形图层正在计算中，请稍候")
+            return
+        if texture:
+            self.task = BackgroundTask(feature_layer, source_path, layer, cache_root=self.cache_root, parent=self.app)
+        else:
+            source = RasterSource(source_path)
+            band_count = source.band_count
+            source.close()
+            if band_count != 1:
+                QMessageBox.information(self.app, "提示", "地形图层需要单波段的高程图像(DEM)")
+                return
+            self.task = BackgroundTask(derive_layer, source_path, layer, cache_root=self.cache_root,
+                                       parent=self.app)
+        self.task.progress.connect(
+            lambda done, total: self.app.statusBar.showMessage(f"正在计算{display_name}: {done}/{total} 个分块")
+        )
+        self.task.succeeded.connect(lambda preview: self.on_layer_ready(source_path, layer, display_name, preview))
+        self.task.failed.connect(lambda message: self.app.statusBar.showMessage(f"计算地形图层出错: {message}"))
+        self.task.start()
+
+    def on_layer_ready(self, source_path, layer, display_name, preview):
+        """图层计算完成"""
+        image = array_to_qimage(self.to_display(layer, preview))
+        self.layer_images[(source_path, layer)] = image
+        if self.app.image_handler.source_path == source_path:
+            self.app.image_handler.set_overlay(self.OVERLAY_NAME, image)
+            self.app.statusBar.showMessage(f"已显示{display_name}图层")
+
+    def to_display(self, layer, preview):
+        """将图层预览转换为显示用的 uint8 图像"""
+        if layer == "hillshade":
+            return preview
+        valid = np.isfinite(preview)
+        values = np.where(valid, preview, 0)
+        if layer == "slope":
+            gray = to_uint8(values, 0, 90)
+        elif layer == "aspect":
+            gray = to_uint8(values, 0, 360)
+        elif layer in self.TEXTURE_NAMES.values():
+            low, high = np.percentile(values[valid], [2, 98]) if valid.any() else (0.0, 1.0)
+            gray = to_uint8(values, float(low), float(high))
+        else:
+            # 曲率使用以0为中心的对称拉伸，忽略极端值
+            limit = float(np.percentile(np.abs(values[valid]), 98)) if valid.any() else 1.0
+            gray = to_uint8(values, -limit, limit)
+        rgb = apply_colormap_jet_vectorized(gray)
+        rgb[~valid] = 0
+        return rgb
@@ -0,0 +1,55 @@
+import os
+import time
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
+
+from utils.trace import tracer, format_breakdown
+
+
+class TraceHandler:
+    """性能跟踪：在状态栏显示最近一次操作的各阶段耗时，并导出 Chrome trace"""
+
+    def __init__(self, app):
+        """初始化跟踪处理器
+
+        参数:
+            app: TerrainApp 实例的引用
+        """
+        self.app = app
+        tracer.listeners.append(self.on_span_finished)
+
+    def set_enabled(self, enabled):
+        """开启或关闭性能跟踪"""
+        tracer.set_enabled(enabled)
+        self.app.trace_label.setVisible(enabled)
+        if enabled:
+            self.app.trace_label.setText("性能跟踪已开启")
+            self.app.trace_label.setToolTip("")
+
+    def on_span_finished(self, name, duration, children):
+        """顶层操作结束后更新状态栏中的耗时拆分"""
+        self.app.trace_label.setText(format_breakdown(name, duration, children))
+        # 提示中列出全部阶段
+        lines = [f"{name}: {duration * 1000:.1f} ms"]
+        for child, seconds in sorted(children.items(), key=lambda item: -item[1]):
+            lines.append(f"  {child}: {seconds * 1000:.1f} ms")
+        self.app.trace_label.setToolTip("\n".join(lines))
+
+    def export_action(self):
+        """导出已记录的跟踪事件"""
+        if not tracer.events:
+            QMessageBox.information(self.app, "提示", "还没有记录到跟踪事件，请先勾选\"性能跟踪\"并执行操作")
+            return
+        default_name = time.strftime("trace_%Y%m%d_%H%M%S.json")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self.app, "导出性能跟踪", default_name, "Chrome trace (*.json);;所有文件 (*)"
+        )
+        if not file_path:
+            return
+        try:
+            count = tracer.export_chrome_trace(file_path)
+        except Exception as e:
+            QMessageBox.warning(self.app, "错误", f"导出跟踪失败: {str(e)}")
+            return
+        self.app.statusBar.showMessage(
+            f"已导出 {count} 个跟踪事件到 {os.path.basename(file_path)}，可在 chrome://tracing 或 Perfetto 中打开"
+        )
@@ -1,5 +1,7 @@
 from PyQt5.QtCore import Qt
 
+from utils.trace import tracer
+
 class ZoomController:
     """处理图像缩放相关功能"""
     
@@ -33,7 +35,7 @@ class ZoomController:
             self.app.zoom_slider.setValue(int(self.zoom_factor * 100))
             
             # 应用缩放
-            self.apply_zoom()
+            self.refresh_view()
             
             # 更新状态栏
             self.app.statusBar.showMessage(f"当前缩放比例: {int(self.zoom_factor * 100)}%")
@@ -52,9 +54,17 @@ class ZoomController:
         # 只有当缩放比例真的改变时才应用
         if abs(new_zoom - self.zoom_factor) > 0.01:
             self.zoom_factor = new_zoom
-            self.apply_zoom()
+            self.refresh_view()
             self.app.statusBar.showMessage(f"当前缩放比例: {int(self.zoom_factor * 100)}%")
     
+    def refresh_view(self):
+        """缩放变化后刷新显示，标注或矢量叠加层的细节级别改变时先重绘"""
+        if self.app.annotation_handler.update_lod(self.zoom_factor):
+            return
+        if not self.app.image_handler.update_overlay_lod(self.zoom_factor):
+            self.apply_zoom()
+    
+    @tracer.traced("zoom.apply")
     def apply_zoom(self):
         """应用当前缩放因子到图像"""
         if self.app.image_handler.current_image:
@@ -67,22 +77,24 @@ class ZoomController:
             new_height = max(1, new_height)
             
             # 创建缩放后的图像
-            scaled_image = self.app.image_handler.current_image.scaled(
-                new_width, 
-                new_height, 
-                Qt.KeepAspectRatio, 
-                Qt.SmoothTransformation
-            )
+            with tracer.span("zoom.smooth_scale", zoom=self.zoom_factor, width=new_width, height=new_height):
+                scaled_image = self.app.image_handler.current_image.scaled(
+                    new_width, 
+                    new_height, 
+                    Qt.KeepAspectRatio, 
+                    Qt.SmoothTransformation
+                )
             
             # 更新显示
-            self.app.image_display.setPixmap(scaled_image)
-            self.app.image_display.setFixedSize(new_width, new_height)
+            with tracer.span("zoom.set_pixmap"):
+                self.app.image_display.setPixmap(scaled_image)
+                self.app.image_display.setFixedSize(new_width, new_height)
     
     def reset_zoom(self):
         """重置缩放比例为100%"""
         self.zoom_factor = 1.0
         self.app.zoom_slider.setValue(int(self.zoom_factor * 100))
-        self.apply_zoom()
+        self.refresh_view()
         self.app.statusBar.showMessage("缩放重置为100%")
         
     def image_wheel_event(self, event):
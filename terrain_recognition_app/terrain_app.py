@@ -4,8 +4,9 @@ from PyQt5.QtWidgets import (QMainWindow, QLabel, QPushButton,
                             QVBoxLayout, QHBoxLayout, QWidget, 
                             QStatusBar, QScrollArea, QListWidget, QFileDialog,
                             QSlider, QGroupBox, QInputDialog, QColorDialog, QMessageBox,
-                            QMenu, QAction, QStyle)
-from PyQt5.QtCore import Qt
+                            QMenu, QAction, QStyle, QDoubleSpinBox, QComboBox, QCheckBox,
+                            QSpinBox)
+from PyQt5.QtCore import Qt, QTimer
 
 # 添加当前目录和父目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,14 +19,21 @@ from modules.image_handlers import ImageHandler
 from modules.file_operations import FileOperations
 from modules.zoom_controller import ZoomController
 from modules.annotation_handler import AnnotationHandler
-
-# 添加PIL检测
-try:
-    from PIL import Image
-    import numpy as np
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
+from modules.classifier_handler import ClassifierHandler
+from modules.terrain_layers import TerrainLayerHandler
+from modules.contour_handler import ContourHandler
+from modules.band_math_handler import BandMathHandler
+from modules.band_composite import BandCompositeHandler
+from modules.contrast_handler import ContrastHandler
+from modules.superpixel_handler import SuperpixelHandler
+from modules.trace_handler import TraceHandler
+from modules.stall_handler import StallHandler
+from modules.memory_handler import MemoryHandler
+from modules.background_task import BackgroundTask
+from utils.startup import startup, preload_modules
+from utils.trace import tracer
+from widgets.label_stats_panel import LabelStatsPanel
+from widgets.histogram_panel import HistogramPanel
 
 # 主应用类
 class TerrainApp(QMainWindow):
@@ -55,12 +63,45 @@ class TerrainApp(QMainWindow):
         self.zoom_controller = ZoomController(self)
         self.file_operations = FileOperations(self)
         self.annotation_handler = AnnotationHandler(self)  # 添加标注处理器
+        self.classifier_handler = ClassifierHandler(self)  # 地形分类处理器
+        self.terrain_layer_handler = TerrainLayerHandler(self)  # DEM地形图层处理器
+        self.contour_handler = ContourHandler(self)  # 等高线处理器
+        self.band_math_handler = BandMathHandler(self)  # 波段运算处理器
+        self.band_composite_handler = BandCompositeHandler(self)  # 波段组合处理器
+        self.contrast_handler = ContrastHandler(self)  # 单波段图像的窗宽窗位
+        self.superpixel_handler = SuperpixelHandler(self)  # 超像素选区处理器
+        self.trace_handler = TraceHandler(self)  # 性能跟踪
+        self.stall_handler = StallHandler(self)  # 界面卡顿检测
+        self.memory_handler = MemoryHandler(self)  # 内存预算
         
         # 创建UI组件
         self.setup_ui()
         
-        # 加载裁剪后的图片
-        self.file_operations.load_cropped_images()
+        # 标签、裁剪目录和标签索引在首次绘制后加载，窗口先显示出来
+        self.startup_started = False
+        self.preload_task = None
+    
+    def paintEvent(self, event):
+        """首次绘制后开始加载启动数据"""
+        super().paintEvent(event)
+        if not self.startup_started:
+            self.startup_started = True
+            # 等本轮绘制(包括子控件)完成后再记录首次绘制时间
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """加载标签，并在后台扫描裁剪目录、刷新标签索引、预先导入较慢的库"""
+        startup.mark("首次绘制")
+        self.annotation_handler.load_labels()
+        startup.mark("标签")
+        
+        for name in ("裁剪目录", "标签索引", "预加载模块"):
+            startup.begin(name)
+        self.file_operations.load_cropped_images_async(lambda: startup.end("裁剪目录"))
+        self.annotation_handler.refresh_label_index_async(lambda: startup.end("标签索引"))
+        self.preload_task = BackgroundTask(preload_modules, parent=self)
+        self.preload_task.finished.connect(lambda: startup.end("预加载模块"))
+        self.preload_task.start()
     
     def setup_ui(self):
         """设置用户界面"""
@@ -201,6 +242,11 @@ class TerrainApp(QMainWindow):
         file_buttons_layout.addWidget(delete_button)
         
         files_layout.addLayout(file_buttons_layout)
+        
+        # 按标注批量裁剪按钮
+        extract_objects_btn = QPushButton("按标注批量裁剪")
+        extract_objects_btn.clicked.connect(self.file_operations.extract_object_chips_action)
+        files_layout.addWidget(extract_objects_btn)
         right_layout.addWidget(files_group)
         
         # 标签管理区域
@@ -227,10 +273,191 @@ class TerrainApp(QMainWindow):
         delete_label_btn.setStyleSheet("QPushButton { background-color: #ff9800; color: white; }")
         label_buttons_layout.addWidget(delete_label_btn)
         
+        # 标注统计按钮
+        stats_btn = QPushButton("标注统计")
+        stats_btn.clicked.connect(self.show_label_stats)
+        label_buttons_layout.addWidget(stats_btn)
+        
         labels_layout.addLayout(label_buttons_layout)
+        
+        # 多边形简化容差设置
+        tolerance_layout = QHBoxLayout()
+        tolerance_layout.addWidget(QLabel("简化容差(像素):"))
+        self.tolerance_spin = QDoubleSpinBox()
+        self.tolerance_spin.setRange(0.0, 20.0)
+        self.tolerance_spin.setSingleStep(0.5)
+        self.tolerance_spin.setValue(self.annotation_handler.simplify_tolerance)
+        self.tolerance_spin.setToolTip("提交多边形时使用Douglas-Peucker算法简化顶点，0表示不简化")
+        self.tolerance_spin.valueChanged.connect(self.set_simplify_tolerance)
+        tolerance_layout.addWidget(self.tolerance_spin)
+        labels_layout.addLayout(tolerance_layout)
+        
+        # 魔棒模式及颜色容差设置
+        wand_layout = QHBoxLayout()
+        self.wand_check = QCheckBox("魔棒模式")
+        self.wand_check.setToolTip("标注时单击按颜色容差自动选取相近区域并生成多边形")
+        self.wand_check.toggled.connect(self.set_magic_wand)
+        wand_layout.addWidget(self.wand_check)
+        wand_layout.addWidget(QLabel("颜色容差:"))
+        self.wand_tolerance_spin = QSpinBox()
+        self.wand_tolerance_spin.setRange(1, 255)
+        self.wand_tolerance_spin.setValue(self.annotation_handler.wand_tolerance)
+        self.wand_tolerance_spin.valueChanged.connect(self.set_wand_tolerance)
+        wand_layout.addWidget(self.wand_tolerance_spin)
+        labels_layout.addLayout(wand_layout)
+        
+        # 超像素模式和智能剪刀模式
+        modes_layout = QHBoxLayout()
+        self.superpixel_check = QCheckBox("超像素模式")
+        self.superpixel_check.setToolTip("标注时单击或拖动选择超像素，按住Ctrl或右键取消选择，双击生成多边形；"
+                                         "首次使用时在后台计算并缓存到图像旁边")
+        self.superpixel_check.toggled.connect(self.set_superpixel_mode)
+        modes_layout.addWidget(self.superpixel_check)
+        self.live_wire_check = QCheckBox("智能剪刀")
+        self.live_wire_check.setToolTip("标注时上一个顶点到鼠标之间的线段沿图像边缘吸附，单击确定顶点，双击完成多边形")
+        self.live_wire_check.toggled.connect(self.set_live_wire)
+        modes_layout.addWidget(self.live_wire_check)
+        labels_layout.addLayout(modes_layout)
         labels_group.setLayout(labels_layout)
         right_layout.addWidget(labels_group)
         
+        # 地形分析区域
+        analysis_group = QGroupBox("地形分析")
+        analysis_layout = QVBoxLayout(analysis_group)
+        
+        classify_buttons_layout = QHBoxLayout()
+        
+        # 训练分类器按钮
+        train_btn = QPushButton("训练分类器")
+        train_btn.clicked.connect(self.classifier_handler.train_action)
+        classify_buttons_layout.addWidget(train_btn)
+        
+        # 识别当前图像按钮
+        classify_btn = QPushButton("识别当前图像")
+        classify_btn.clicked.connect(self.classifier_handler.classify_action)
+        classify_buttons_layout.addWidget(classify_btn)
+        
+        # 无监督预分割按钮
+        cluster_btn = QPushButton("无监督预分割")
+        cluster_btn.clicked.connect(self.classifier_handler.cluster_action)
+        classify_buttons_layout.addWidget(cluster_btn)
+        
+        # 清除分类叠加层按钮
+        clear_classify_btn = QPushButton("清除识别结果")
+        clear_classify_btn.clicked.connect(self.classifier_handler.clear_overlay_action)
+        classify_buttons_layout.addWidget(clear_classify_btn)
+        
+        analysis_layout.addLayout(classify_buttons_layout)
+        
+        # DEM地形图层选择
+        layer_layout = QHBoxLayout()
+        layer_layout.addWidget(QLabel("显示图层:"))
+        self.layer_combo = QComboBox()
+        self.layer_combo.addItems(list(TerrainLayerHandler.LAYER_NAMES) + list(TerrainLayerHandler.TEXTURE_NAMES))
+        self.layer_combo.activated[str].connect(self.terrain_layer_handler.select_layer)
+        layer_layout.addWidget(self.layer_combo)
+        analysis_layout.addLayout(layer_layout)
+        
+        # 多波段图像的波段组合
+        composite_layout = QHBoxLayout()
+        composite_layout.addWidget(QLabel("波段组合:"))
+        self.composite_combo = QComboBox()
+        self.composite_combo.addItems(list(BandCompositeHandler.PRESETS) + [BandCompositeHandler.CUSTOM])
+        self.composite_combo.setToolTip(
+            "，".join(f"{name}: R{r} G{g} B{b}" for name, (r, g, b) in BandCompositeHandler.PRESETS.items())
+        )
+        self.composite_combo.activated[str].connect(self.band_composite_handler.select_composite)
+        composite_layout.addWidget(self.composite_combo)
+        analysis_layout.addLayout(composite_layout)
+        
+        # 显示拉伸：直方图上拖动黑点/白点，对保留的原始数值查表，不重新读取文件
+        window_layout = QHBoxLayout()
+        window_layout.addWidget(QLabel("拉伸:"))
+        self.stretch_band_combo = QComboBox()
+        self.stretch_band_combo.setToolTip("多波段图像可以单独调整某个波段的拉伸")
+        self.stretch_band_combo.currentIndexChanged.connect(self.contrast_handler.band_changed)
+        window_layout.addWidget(self.stretch_band_combo)
+        window_layout.addWidget(QLabel("伽马:"))
+        self.gamma_spin = QDoubleSpinBox()
+        self.gamma_spin.setRange(0.1, 5.0)
+        self.gamma_spin.setSingleStep(0.1)
+        self.gamma_spin.valueChanged.connect(self.contrast_handler.gamma_changed)
+        window_layout.addWidget(self.gamma_spin)
+        self.auto_window_btn = QPushButton("自动拉伸")
+        self.auto_window_btn.setToolTip("按2%~98%百分位数设置窗口")
+        self.auto_window_btn.clicked.connect(self.contrast_handler.auto_window_action)
+        window_layout.addWidget(self.auto_window_btn)
+        self.reset_window_btn = QPushButton("重置")
+        self.reset_window_btn.clicked.connect(self.contrast_handler.reset_window_action)
+        window_layout.addWidget(self.reset_window_btn)
+        analysis_layout.addLayout(window_layout)
+        self.histogram_panel = HistogramPanel()
+        self.histogram_panel.setToolTip("拖动黑色/白色端点调整窗口下限/上限，在两点之间拖动整体平移")
+        self.histogram_panel.windowChanged.connect(self.contrast_handler.window_changed)
+        self.histogram_panel.windowCommitted.connect(self.contrast_handler.window_committed)
+        analysis_layout.addWidget(self.histogram_panel)
+        self.window_label = QLabel()
+        analysis_layout.addWidget(self.window_label)
+        self.contrast_handler.clear()
+        
+        # 等高线
+        contour_layout = QHBoxLayout()
+        contour_layout.addWidget(QLabel("等高距:"))
+        self.contour_interval_spin = QDoubleSpinBox()
+        self.contour_interval_spin.setRange(0.01, 10000.0)
+        self.contour_interval_spin.setValue(10.0)
+        contour_layout.addWidget(self.contour_interval_spin)
+        contour_btn = QPushButton("生成等高线")
+        contour_btn.clicked.connect(self.contour_handler.generate_action)
+        contour_layout.addWidget(contour_btn)
+        export_contour_btn = QPushButton("导出等高线")
+        export_contour_btn.clicked.connect(self.contour_handler.export_action)
+        contour_layout.addWidget(export_contour_btn)
+        clear_contour_btn = QPushButton("清除等高线")
+        clear_contour_btn.clicked.connect(self.contour_handler.clear_action)
+        contour_layout.addWidget(clear_contour_btn)
+        analysis_layout.addLayout(contour_layout)
+        
+        # 波段运算
+        band_math_layout = QHBoxLayout()
+        band_math_layout.addWidget(QLabel("波段运算:"))
+        self.band_math_combo = QComboBox()
+        self.band_math_combo.setEditable(True)
+        self.band_math_combo.addItems(list(BandMathHandler.PRESETS.values()))
+        self.band_math_combo.setToolTip(
+            "用 b1、b2… 引用波段，例如 " +
+            "，".join(f"{name}: {expression}" for name, expression in BandMathHandler.PRESETS.items())
+        )
+        band_math_layout.addWidget(self.band_math_combo, 1)
+        band_math_btn = QPushButton("计算指数")
+        band_math_btn.clicked.connect(self.band_math_handler.compute_action)
+        band_math_layout.addWidget(band_math_btn)
+        clear_band_math_btn = QPushButton("清除指数")
+        clear_band_math_btn.clicked.connect(self.band_math_handler.clear_action)
+        band_math_layout.addWidget(clear_band_math_btn)
+        analysis_layout.addLayout(band_math_layout)
+        right_layout.addWidget(analysis_group)
+        
+        # 状态栏右侧：性能跟踪开关、最近一次操作的耗时拆分和导出按钮
+        self.memory_label = QLabel()
+        self.statusBar.addPermanentWidget(self.memory_label)
+        self.trace_label = QLabel()
+        self.trace_label.setVisible(tracer.enabled)
+        self.statusBar.addPermanentWidget(self.trace_label)
+        self.trace_check = QCheckBox("性能跟踪")
+        self.trace_check.setChecked(tracer.enabled)
+        self.trace_check.setToolTip("记录导入、显示、缩放、标注绘制和裁剪的各阶段耗时")
+        self.trace_check.toggled.connect(self.trace_handler.set_enabled)
+        self.statusBar.addPermanentWidget(self.trace_check)
+        export_trace_btn = QPushButton("导出跟踪")
+        export_trace_btn.setToolTip("导出为 Chrome trace-event JSON(chrome://tracing 或 Perfetto)")
+        export_trace_btn.clicked.connect(self.trace_handler.export_action)
+        self.statusBar.addPermanentWidget(export_trace_btn)
+        stall_report_btn = QPushButton("卡顿分析")
+        stall_report_btn.setToolTip("查看界面卡顿记录和各处理函数的卡顿时长")
+        stall_report_btn.clicked.connect(self.stall_handler.show_report)
+        self.statusBar.addPermanentWidget(stall_report_btn)
+        
         # 添加左右两个区域到主布局
         main_layout.addWidget(left_panel, 4)  # 图片显示区域占4/6
         main_layout.addWidget(right_panel, 2)  # 文件列表和标签区域占2/6
@@ -266,6 +493,48 @@ class TerrainApp(QMainWindow):
             if reply == QMessageBox.Yes:
                 self.annotation_handler.delete_label(selected_items[0].text())
     
+    def set_simplify_tolerance(self, value):
+        """设置多边形简化容差"""
+        self.annotation_handler.simplify_tolerance = value
+    
+    def set_magic_wand(self, enabled):
+        """开启或关闭魔棒模式，与超像素和智能剪刀模式互斥"""
+        self.annotation_handler.magic_wand = enabled
+        if enabled:
+            self.superpixel_check.setChecked(False)
+            self.live_wire_check.setChecked(False)
+    
+    def set_superpixel_mode(self, enabled):
+        """开启或关闭超像素模式，与魔棒和智能剪刀模式互斥"""
+        self.superpixel_handler.set_enabled(enabled)
+        if enabled:
+            self.wand_check.setChecked(False)
+            self.live_wire_check.setChecked(False)
+    
+    def set_live_wire(self, enabled):
+        """开启或关闭智能剪刀模式，与魔棒和超像素模式互斥"""
+        self.annotation_handler.live_wire = enabled
+        self.annotation_handler.wire = None
+        if enabled:
+            self.wand_check.setChecked(False)
+            self.superpixel_check.setChecked(False)
+    
+    def set_wand_tolerance(self, value):
+        """设置魔棒的颜色容差"""
+        self.annotation_handler.wand_tolerance = value
+    
+    def show_label_stats(self):
+        """显示各标签的标注统计"""
+        if self.annotation_handler.index_refreshing():
+            QMessageBox.information(self, "提示", "标签索引正在后台加载，请稍候")
+            return
+        panel = LabelStatsPanel(
+            self.annotation_handler.label_index,
+            self.annotation_handler.labels,
+            self
+        )
+        panel.exec_()
+    
     def show_label_context_menu(self, position):
         """显示标签的右键菜单"""
         if not self.labels_list.selectedItems():
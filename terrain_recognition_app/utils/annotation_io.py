@@ -0,0 +1,124 @@
+import os
+import json
+
+import numpy as np
+
+from utils.geometry import clip_polygons_to_rect
+
+# 标注目录中不属于单幅图像标注的文件
+RESERVED_FILES = {"labels.json"}
+
+
+def annotation_path(annotations_dir, image_path):
+    """
+    获取图像对应的标注文件路径
+
+    参数:
+        annotations_dir: 标注目录
+        image_path: 图像文件路径
+
+    返回:
+        标注JSON文件路径
+    """
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(annotations_dir, f"{base_name}.json")
+
+
+def list_annotation_files(annotations_dir):
+    """
+    列出标注目录中的所有图像标注文件(不含标签文件和隐藏的缓存文件)
+
+    参数:
+        annotations_dir: 标注目录
+
+    返回:
+        文件名列表(已排序)
+    """
+    if not os.path.exists(annotations_dir):
+        return []
+    return sorted(
+        f for f in os.listdir(annotations_dir)
+        if f.lower().endswith('.json') and not f.startswith('.') and f not in RESERVED_FILES
+    )
+
+
+def read_annotation(anno_path):
+    """
+    读取标注文件
+
+    参数:
+        anno_path: 标注JSON文件路径
+
+    返回:
+        标注数据字典
+    """
+    with open(anno_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def annotation_scale(data, width, height):
+    """
+    标注坐标到源图像像素的缩放比例
+
+    标注按显示的底图像素保存，超大图像降采样显示时与源图像像素不一致，按标注中记录的图像尺寸换算。
+
+    参数:
+        data: 标注数据字典
+        width, height: 源图像尺寸
+
+    返回:
+        (x方向, y方向)，标注中没有记录图像尺寸时为 (1.0, 1.0)
+    """
+    size = data.get('image_size')
+    if not size or size[0] <= 0 or size[1] <= 0:
+        return 1.0, 1.0
+    return width / size[0], height / size[1]
+
+
+def crop_annotation(coords, offsets, labels, colors, rect, chip_name):
+    """
+    将与裁剪区域相交的多边形裁剪到区域内，并转换为裁剪图坐标
+
+    参数:
+        coords, offsets: 打包的多边形坐标，见 pack_polygons
+        labels, colors: 每个多边形的标签名和颜色
+        rect: 裁剪区域 (min_x, min_y, max_x, max_y)
+        chip_name: 裁剪图文件名
+
+    返回:
+        裁剪图的标注数据字典，没有相交的多边形时返回None
+    """
+    clipped = clip_polygons_to_rect(coords, offsets, rect)
+    if not clipped:
+        return None
+
+    polygons = []
+    for index, points in clipped:
+        points = np.round(points, 2)
+        if np.array_equal(points, np.round(points)):
+            points = points.astype(np.int64)
+        polygons.append({
+            'points': points.tolist(),
+            'label': labels[index],
+            'color': colors[index]
+        })
+
+    return {
+        'image': chip_name,
+        'polygons': polygons,
+        'image_size': [int(rect[2] - rect[0]), int(rect[3] - rect[1])]
+    }
+
+
+def write_annotation(anno_path, data):
+    """
+    原子地写入标注文件(先写临时文件再替换)
+
+    参数:
+        anno_path: 标注JSON文件路径
+        data: 标注数据字典
+    """
+    temp_path = anno_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, anno_path)
@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.memory_budget import memory_budget, PRIORITY_CACHE
+from utils.raster_io import RasterSource, to_uint8
+from utils.tile_cache import source_key
+from utils.trace import tracer
+
+# 常用波段组合 (红, 绿, 蓝)，多光谱图像的波段顺序与 INDEX_PRESETS 一致：蓝、绿、红、近红外、短波红外1、短波红外2
+COMPOSITE_PRESETS = {
+    "真彩色": (3, 2, 1),
+    "标准假彩色(近红外)": (4, 3, 2),
+    "短波红外": (6, 4, 3),
+}
+TRUE_COLOR = "真彩色"
+
+
+def composite_bands(name, source):
+    """
+    预设波段组合在某幅图像上对应的波段
+
+    真彩色优先使用颜色解释标记的红绿蓝波段；没有颜色解释的3波段图像按普通RGB(1, 2, 3)处理，
+    只有4个以上波段且没有颜色解释时才按多光谱的蓝、绿、红顺序使用预设。
+
+    参数:
+        name: COMPOSITE_PRESETS 中的名称
+        source: RasterSource
+
+    返回:
+        (红, 绿, 蓝) 波段编号
+    """
+    if name == TRUE_COLOR:
+        interpreted = source.interpreted_rgb_bands()
+        if interpreted is not None:
+            return interpreted
+        if source.band_count <= 3:
+            return 1, 2, 3
+    return COMPOSITE_PRESETS[name]
+
+# 超过该像素数的图像按2倍降采样显示
+LARGE_IMAGE_PIXELS = 100000000
+
+
+def display_step(width, height):
+    """显示时的降采样步长"""
+    return 2 if width * height > LARGE_IMAGE_PIXELS else 1
+
+
+def read_display_band(source, band, step, strip_rows=512):
+    """
+    逐条带读取一个波段，按步长做均值降采样并拉伸为 uint8
+
+    参数:
+        source: RasterSource
+        band: 波段编号
+        step: 降采样步长
+        strip_rows: 每次读取的输出行数
+
+    返回:
+        (height // step, width // step) uint8 数组
+    """
+    out_width = source.width // step
+    out_height = source.height // step
+    result = np.zeros((out_height, out_width), dtype=np.uint8)
+    low, high = None, None
+    for row in range(0, out_height, strip_rows):
+        rows = min(strip_rows, out_height - row)
+        with tracer.span("raster.read", band=band):
+            block = source.read_band(band, 0, row * step, out_width * step, rows * step)
+        if block.dtype == np.uint8 and step == 1:
+            result[row:row + rows] = block
+            continue
+        if low is None:
+            with tracer.span("raster.band_range", band=band):
+                low, high = (0, 255) if block.dtype == np.uint8 else source.band_range(band)
+        with tracer.span("normalize", band=band):
+            if step > 1:
+                block = block.reshape(rows, step, out_width, step).mean(axis=(1, 3), dtype=np.float32)
+            result[row:row + rows] = to_uint8(block, low, high)
+    return result
+
+
+class BandCache:
+    """按波段缓存显示用的 uint8 数组
+
+    切换波段组合时只读取缓存中还没有的波段；缓存按最近使用顺序淘汰，总大小不超过上限。
+    缓存键包含文件的修改时间和大小，文件变化后自动失效。
+    各波段登记到全局内存预算，超出预算时也可能被淘汰。
+    波段组合在后台线程中读取，内存预算在界面线程中释放，对缓存字典的访问都加锁。
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        """初始化
+
+        参数:
+            max_bytes: 缓存总大小上限(字节)
+        """
+        self.max_bytes = max_bytes
+        self._bands = OrderedDict()  # {(数据源标识, 波段, 步长): uint8 数组}
+        self._lock = threading.Lock()
+        self.reads = 0  # 实际从文件读取的波段数
+
+    def _total_bytes(self):
+        """缓存总字节数，调用时需持有锁"""
+        return sum(array.nbytes for array in self._bands.values())
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return self._total_bytes()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            keys = list(self._bands)
+        for key in keys:
+            self._release(key)
+
+    def _release(self, key):
+        """移除一个波段并注销其内存登记，内存预算淘汰时也调用"""
+        with self._lock:
+            self._bands.pop(key, None)
+        memory_budget.unregister(('band',) + key)
+
+    def band(self, source, band, step):
+        """获取一个显示波段，不在缓存中时读取
+
+        参数:
+            source: RasterSource
+            band: 波段编号
+            step: 降采样步长
+        """
+        key = (source_key(source.path), band, step)
+        with self._lock:
+            array = self._bands.get(key)
+            if array is not None:
+                self._bands.move_to_end(key)
+        if array is not None:
+            memory_budget.touch(('band',) + key)
+            tracer.count("band_cache.hit")
+            return array
+        tracer.count("band_cache.miss")
+        # 读取时不持有锁，其他线程仍可使用缓存
+        array = read_display_band(source, band, step)
+        evicted = []
+        with self._lock:
+            self.reads += 1
+            self._bands[key] = array
+            # 淘汰最久未使用的波段，至少保留刚读取的波段
+            while len(self._bands) > 1 and self._total_bytes() > self.max_bytes:
+                evicted.append(self._bands.popitem(last=False)[0])
+        memory_budget.register(('band',) + key, array.nbytes, "波段缓存", PRIORITY_CACHE,
+                               release=lambda: self._release(key))
+        for old_key in evicted:
+            memory_budget.unregister(('band',) + old_key)
+        return array
+
+    def composite(self, path, bands, progress=None):
+        """
+        组合三个波段为显示用的RGB数组
+
+        参数:
+            path: 图像路径
+            bands: (红, 绿, 蓝) 波段编号
+            progress: 进度回调 progress(已完成波段数, 3)
+
+        返回:
+            (H, W, 3) uint8 数组，大图像按 display_step 降采样
+        """
+        source = RasterSource(path)
+        try:
+            for band in bands:
+                if not 1 <= band <= source.band_count:
+                    raise ValueError(f"图像只有 {source.band_count} 个波段，无法使用第 {band} 波段")
+            step = display_step(source.width, source.height)
+            channels = []
+            for done, band in enumerate(bands, start=1):
+                channels.append(self.band(source, band, step))
+                if progress:
+                    progress(done, len(bands))
+        finally:
+            source.close()
+        return np.stack(channels, axis=2)
+
+
+# 图像导入和波段组合切换共用的显示波段缓存
+display_band_cache = BandCache()
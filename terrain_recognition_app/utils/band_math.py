@@ -0,0 +1,199 @@
+import ast
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.raster_io import RasterSource, RasterWriter, PreviewBuilder, iter_tiles
+
+# 常用指数表达式(波段顺序按 蓝、绿、红、近红外 排列的四波段影像)
+INDEX_PRESETS = {
+    "NDVI": "(b4-b3)/(b4+b3)",
+    "NDWI": "(b2-b4)/(b2+b4)",
+}
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+_FUNCTIONS = {
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "log": np.log,
+    "exp": np.exp,
+    "min": np.minimum,
+    "max": np.maximum,
+}
+
+
+class BandExpression:
+    """波段运算表达式
+
+    表达式使用 b1、b2… 引用波段，支持 + - * / **、括号、数值常量和
+    sqrt、abs、log、exp、min、max 函数。计算时中间结果尽量原地复用，
+    整个表达式只产生少量 float32 临时数组。
+    """
+
+    def __init__(self, text):
+        """解析表达式
+
+        参数:
+            text: 表达式文本，如 "(b4-b3)/(b4+b3)"
+        """
+        self.text = text.strip()
+        try:
+            self.tree = ast.parse(self.text, mode='eval').body
+        except SyntaxError:
+            raise ValueError(f"表达式语法错误: {text}")
+        bands = set()
+        self._check(self.tree, bands)
+        if not bands:
+            raise ValueError("表达式中没有引用任何波段")
+        self.bands = sorted(bands)
+
+    def _check(self, node, bands):
+        """检查表达式只包含允许的运算，并收集引用的波段"""
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            self._check(node.left, bands)
+            self._check(node.right, bands)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            self._check(node.operand, bands)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            pass
+        elif isinstance(node, ast.Name):
+            bands.add(self._band_number(node.id))
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and
+              node.func.id in _FUNCTIONS and not node.keywords):
+            expected = 2 if node.func.id in ("min", "max") else 1
+            if len(node.args) != expected:
+                raise ValueError(f"函数 {node.func.id} 需要 {expected} 个参数")
+            for arg in node.args:
+                self._check(arg, bands)
+        else:
+            raise ValueError(f"表达式中包含不支持的内容: {ast.get_source_segment(self.text, node)}")
+
+    @staticmethod
+    def _band_number(name):
+        """解析 b1、B2 形式的波段名"""
+        if len(name) > 1 and name[0] in "bB" and name[1:].isdigit() and int(name[1:]) > 0:
+            return int(name[1:])
+        raise ValueError(f"未知的名称: {name}，请使用 b1、b2… 引用波段")
+
+    def evaluate(self, bands):
+        """
+        对一块数据计算表达式
+
+        参数:
+            bands: {波段编号: 数组}，至少包含 self.bands 中的波段
+
+        返回:
+            float32 数组，除零等无效结果为NaN
+        """
+        inputs = {band: np.asarray(array, dtype=np.float32) for band, array in bands.items()}
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            result, _ = self._evaluate(self.tree, inputs)
+            result = np.asarray(result, dtype=np.float32)
+            if result.ndim == 0:
+                result = np.full(next(iter(inputs.values())).shape, result, dtype=np.float32)
+            result[~np.isfinite(result)] = np.nan
+        return result
+
+    def _evaluate(self, node, inputs):
+        """递归计算节点
+
+        返回:
+            (值, 是否为可以原地改写的临时数组)
+        """
+        if isinstance(node, ast.Constant):
+            return np.float32(node.value), False
+        if isinstance(node, ast.Name):
+            return inputs[self._band_number(node.id)], False
+        if isinstance(node, ast.UnaryOp):
+            value, temp = self._evaluate(node.operand, inputs)
+            if isinstance(node.op, ast.UAdd):
+                return value, temp
+            return self._apply(np.negative, [(value, temp)])
+        if isinstance(node, ast.BinOp):
+            operands = [self._evaluate(node.left, inputs), self._evaluate(node.right, inputs)]
+            return self._apply(_BINARY_OPS[type(node.op)], operands)
+        operands = [self._evaluate(arg, inputs) for arg in node.args]
+        return self._apply(_FUNCTIONS[node.func.id], operands)
+
+    @staticmethod
+    def _apply(ufunc, operands):
+        """调用 ufunc，有临时数组时把结果直接写入其中"""
+        values = [value for value, _ in operands]
+        for value, temp in operands:
+            if temp:
+                return ufunc(*values, out=value), True
+        result = ufunc(*values)
+        return result, isinstance(result, np.ndarray)
+
+
+# 工作进程中的数据源和表达式
+_worker_source = None
+_worker_expression = None
+
+
+def _init_worker(image_path, expression_text):
+    """工作进程初始化"""
+    global _worker_source, _worker_expression
+    _worker_source = RasterSource(image_path)
+    _worker_expression = BandExpression(expression_text)
+
+
+def _index_tile(tile):
+    """在工作进程中计算一个分块，只读取表达式引用的波段"""
+    bands = _worker_expression.bands
+    block = _worker_source.read_window(tile.x, tile.y, tile.width, tile.height, bands)
+    result = _worker_expression.evaluate({band: block[:, :, i] for i, band in enumerate(bands)})
+    if _worker_source.nodata is not None:
+        result[(block == _worker_source.nodata).any(axis=2)] = np.nan
+    return tile, result
+
+
+def compute_index(image_path, expression, output_path, tile_size=512, workers=None, progress=None):
+    """
+    逐块计算波段运算表达式并保存为 float32 栅格
+
+    每个工作进程一次只持有一个分块的引用波段，结果逐块写入磁盘，内存中只保留有限大小的预览。
+
+    参数:
+        image_path: 多波段图像路径
+        expression: 表达式文本
+        output_path: 结果栅格保存路径(.tif)
+        tile_size: 分块大小
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        {'output': 输出路径, 'preview': float32 预览数组(无效值为NaN), 'expression': 表达式}
+    """
+    parsed = BandExpression(expression)
+    source = RasterSource(image_path)
+    width, height, band_count = source.width, source.height, source.band_count
+    source.close()
+    if parsed.bands[-1] > band_count:
+        raise ValueError(f"表达式引用了第 {parsed.bands[-1]} 波段，但图像只有 {band_count} 个波段")
+
+    tiles = list(iter_tiles(width, height, tile_size))
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    writer = RasterWriter(output_path, width, height, dtype=np.float32, reference_path=image_path, fill=np.nan)
+    preview = PreviewBuilder(width, height, dtype=np.float32, fill=np.nan)
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(image_path, parsed.text)) as pool:
+            for done, (tile, result) in enumerate(pool.map(_index_tile, tiles, chunksize=4), start=1):
+                writer.write(tile.x, tile.y, result)
+                preview.add(tile.x, tile.y, result)
+                if progress:
+                    progress(done, len(tiles))
+    finally:
+        writer.close()
+
+    return {'output': output_path, 'preview': preview.array, 'expression': parsed.text}
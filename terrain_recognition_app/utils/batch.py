@@ -0,0 +1,280 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.annotation_io import annotation_path, read_annotation, write_annotation, crop_annotation, annotation_scale
+from utils.chip_extractor import save_png
+from utils.geometry import pack_polygons, rasterize_polygon, polygons_intersecting_rect
+from utils.raster_io import RasterSource, RasterWriter, iter_tiles
+from utils.render import apply_colormap_jet, render_display_array, read_display_window, display_bands
+
+# 批处理默认处理的栅格扩展名
+RASTER_EXTENSIONS = ('.tif', '.tiff')
+
+# 标签栅格中表示"无标注"的值
+NO_LABEL = 255
+
+
+def list_rasters(path, extensions=RASTER_EXTENSIONS):
+    """
+    列出要处理的栅格文件
+
+    参数:
+        path: 目录或单个文件
+        extensions: 目录中要处理的扩展名
+
+    返回:
+        文件路径列表(已排序)
+    """
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.lower().endswith(extensions) and os.path.isfile(os.path.join(path, name))
+    )
+
+
+def stem(path):
+    """不含扩展名的文件名"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def convert_file(path, output_dir, colormap=False):
+    """
+    将栅格转换为显示用的PNG，与界面导入时的解码和拉伸方式一致
+
+    参数:
+        path: 栅格路径
+        output_dir: 输出目录
+        colormap: 单波段图像是否使用jet伪彩色
+
+    返回:
+        {'output': 输出路径}
+    """
+    rgb = render_display_array(path)
+    if colormap and rgb.ndim == 3 and np.array_equal(rgb[:, :, 0], rgb[:, :, 1]) and \
+            np.array_equal(rgb[:, :, 0], rgb[:, :, 2]):
+        rgb = rgb[:, :, 0]
+    if colormap and rgb.ndim == 2:
+        rgb = apply_colormap_jet(rgb)
+    output_path = os.path.join(output_dir, f"{stem(path)}.png")
+    save_png(rgb, output_path)
+    return {'output': output_path}
+
+
+def load_image_annotation(annotations_dir, path, size=None):
+    """
+    读取图像的标注并打包多边形
+
+    参数:
+        annotations_dir: 标注目录
+        path: 图像路径
+        size: 源图像尺寸 (宽, 高)，给出时将标注坐标换算为源图像像素
+
+    返回:
+        (coords, offsets, labels, colors)，没有标注时返回None
+    """
+    if not annotations_dir:
+        return None
+    anno_path = annotation_path(annotations_dir, path)
+    if not os.path.exists(anno_path):
+        return None
+    data = read_annotation(anno_path)
+    polygons = [poly for poly in data.get('polygons', []) if len(poly.get('points', [])) >= 3]
+    if not polygons:
+        return None
+    coords, offsets = pack_polygons([poly['points'] for poly in polygons])
+    if size is not None:
+        coords = coords * np.array(annotation_scale(data, *size), dtype=coords.dtype)
+    return (coords, offsets, [poly.get('label', 'unknown') for poly in polygons],
+            [poly.get('color', "#FF0000") for poly in polygons])
+
+
+def chip_file(path, output_dir, chip_size=512, overlap=0, annotations_dir=None):
+    """
+    将栅格按网格切分为PNG小图，有标注时同时写入裁剪到每张小图的标注
+
+    与界面中的裁剪一致：小图按整幅图像的取值范围拉伸，标注多边形裁剪到小图范围并平移到小图坐标。
+    标注写入 output_dir/annotations。
+
+    参数:
+        path: 栅格路径
+        output_dir: 输出目录
+        chip_size: 小图大小
+        overlap: 相邻小图的重叠像素数
+        annotations_dir: 标注目录，None表示不处理标注
+
+    返回:
+        {'chips': 小图数量, 'annotations': 带标注的小图数量}
+    """
+    stride = chip_size - overlap
+    if stride <= 0:
+        raise ValueError("重叠必须小于小图大小")
+    chips_dir = os.path.join(output_dir, "annotations")
+    source = RasterSource(path)
+    try:
+        annotation = load_image_annotation(annotations_dir, path, (source.width, source.height))
+        ranges = [source.band_range(band) for band in display_bands(source)]
+        chips = annotated = 0
+        for y in range(0, max(1, source.height - overlap), stride):
+            for x in range(0, max(1, source.width - overlap), stride):
+                width = min(chip_size, source.width - x)
+                height = min(chip_size, source.height - y)
+                chip_name = f"{stem(path)}_{x}_{y}.png"
+                save_png(read_display_window(source, x, y, width, height, ranges),
+                         os.path.join(output_dir, chip_name))
+                chips += 1
+                if annotation is None:
+                    continue
+                data = crop_annotation(*annotation, (x, y, x + width, y + height), chip_name)
+                if data is not None:
+                    os.makedirs(chips_dir, exist_ok=True)
+                    write_annotation(annotation_path(chips_dir, chip_name), data)
+                    annotated += 1
+    finally:
+        source.close()
+    return {'chips': chips, 'annotations': annotated}
+
+
+def rasterize_file(path, output_dir, annotations_dir, class_names, tile_size=1024):
+    """
+    将图像的标注多边形栅格化为类别栅格，逐块写入，内存占用与图像大小无关
+
+    参数:
+        path: 栅格路径
+        output_dir: 输出目录
+        annotations_dir: 标注目录
+        class_names: 类别名称列表，第 i 个类别写为 i，未标注的像素为 NO_LABEL
+        tile_size: 分块大小
+
+    返回:
+        {'output': 输出路径, 'polygons': 栅格化的多边形数}
+    """
+    source = RasterSource(path)
+    width, height = source.width, source.height
+    source.close()
+    annotation = load_image_annotation(annotations_dir, path, (width, height))
+    if annotation is None:
+        raise ValueError("没有找到该图像的标注")
+    coords, offsets, labels, _ = annotation
+    class_ids = {name: index for index, name in enumerate(class_names)}
+    polygon_classes = [class_ids.get(label) for label in labels]
+    output_path = os.path.join(output_dir, f"{stem(path)}_labels.tif")
+    writer = RasterWriter(output_path, width, height, reference_path=path, fill=NO_LABEL)
+    try:
+        for tile in iter_tiles(width, height, tile_size):
+            rect = (tile.x, tile.y, tile.x + tile.width, tile.y + tile.height)
+            indices = polygons_intersecting_rect(coords, offsets, rect)
+            if not len(indices):
+                continue
+            block = np.full((tile.height, tile.width), NO_LABEL, dtype=np.uint8)
+            # 按标注顺序绘制，后画的多边形覆盖先画的
+            for index in sorted(indices):
+                if polygon_classes[index] is None:
+                    continue
+                mask = rasterize_polygon(coords[offsets[index]:offsets[index + 1]], tile.height, tile.width,
+                                         origin=(tile.x, tile.y))
+                block[mask] = polygon_classes[index]
+            writer.write(tile.x, tile.y, block)
+    finally:
+        writer.close()
+    return {'output': output_path, 'polygons': sum(c is not None for c in polygon_classes)}
+
+
+def stats_file(path, tile_size=1024):
+    """
+    逐块统计栅格各波段的最小值、最大值、均值和标准差(忽略无效值)
+
+    参数:
+        path: 栅格路径
+        tile_size: 分块大小
+
+    返回:
+        {'width', 'height', 'bands': [{'band', 'min', 'max', 'mean', 'std', 'valid'}, ...]}
+    """
+    source = RasterSource(path)
+    try:
+        bands = []
+        for band in range(1, source.band_count + 1):
+            count, total, squares = 0, 0.0, 0.0
+            low, high = np.inf, -np.inf
+            for tile in iter_tiles(source.width, source.height, tile_size):
+                block = source.read_band(band, tile.x, tile.y, tile.width, tile.height)
+                values = block.ravel().astype(np.float64)
+                if source.nodata is not None:
+                    values = values[values != source.nodata]
+                values = values[np.isfinite(values)]
+                if not len(values):
+                    continue
+                count += len(values)
+                total += float(values.sum())
+                squares += float(np.dot(values, values))
+                low, high = min(low, float(values.min())), max(high, float(values.max()))
+            mean = total / count if count else float('nan')
+            std = float(np.sqrt(max(squares / count - mean * mean, 0.0))) if count else float('nan')
+            bands.append({'band': band, 'min': low if count else float('nan'), 'max': high if count else float('nan'),
+                          'mean': mean, 'std': std, 'valid': count})
+        return {'width': source.width, 'height': source.height, 'bands': bands}
+    finally:
+        source.close()
+
+
+# 批处理操作名称 → 处理单个文件的函数
+OPERATIONS = {
+    'convert': convert_file,
+    'chip': chip_file,
+    'rasterize': rasterize_file,
+    'stats': stats_file,
+}
+
+
+def _run_file(operation, path, kwargs):
+    """在工作进程中处理一个文件，异常转换为错误信息返回"""
+    try:
+        return path, OPERATIONS[operation](path, **kwargs), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {str(e)}"
+
+
+def run_batch(operation, paths, workers=None, progress=None, **kwargs):
+    """
+    用进程池对一组文件执行批处理操作，单个文件出错不影响其他文件
+
+    参数:
+        operation: 操作名称，见 OPERATIONS
+        paths: 文件路径列表
+        workers: 工作进程数，默认为CPU核数
+        progress: 每个文件完成时的回调 progress(已完成数, 总数, 文件路径, 结果, 错误信息)
+        kwargs: 传给操作函数的参数
+
+    返回:
+        [(文件路径, 结果, 错误信息), ...]，按 paths 的顺序排列，成功时错误信息为None
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"未知的批处理操作: {operation}")
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_file, operation, path, kwargs) for path in paths]
+        for done, future in enumerate(as_completed(futures), start=1):
+            path, result, error = future.result()
+            results[path] = (path, result, error)
+            if progress:
+                progress(done, len(paths), path, result, error)
+    return [results[path] for path in paths]
+
+
+def load_class_names(annotations_dir):
+    """
+    按 labels.json 中的顺序获取类别名称
+
+    返回:
+        类别名称列表，没有标签文件时为空列表
+    """
+    labels_path = os.path.join(annotations_dir, "labels.json")
+    if not os.path.exists(labels_path):
+        return []
+    with open(labels_path, 'r', encoding='utf-8') as f:
+        return list(json.load(f))
@@ -0,0 +1,218 @@
+import os
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from utils.annotation_io import list_annotation_files, read_annotation, annotation_scale
+from utils.geometry import rasterize_polygon, polygon_area
+from utils.raster_io import RasterSource, find_image, to_uint8
+
+# 每个任务处理的多边形数量上限，保证单幅大图的大量多边形也能分给多个进程
+POLYGONS_PER_JOB = 256
+
+
+def safe_name(text):
+    """将标签名转换为可用作文件名的字符串"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(text)).strip('_') or "unknown"
+
+
+def iter_chip_jobs(annotations_dir, image_dirs, labels=None):
+    """
+    遍历标注文件，生成按图像分组的裁剪任务
+
+    参数:
+        annotations_dir: 标注目录
+        image_dirs: 查找源图像的目录列表
+        labels: 只处理这些标签，None表示全部
+
+    返回:
+        生成器，每个元素为 (annotation_name, jobs)，job 中 image_path 为None表示找不到源图像
+    """
+    for name in list_annotation_files(annotations_dir):
+        try:
+            data = read_annotation(os.path.join(annotations_dir, name))
+        except Exception as e:
+            yield name, [{'annotation': name, 'image_path': None, 'polygons': [], 'error': str(e)}]
+            continue
+
+        polygons = [
+            (index, poly.get('label', 'unknown'), poly.get('points', []))
+            for index, poly in enumerate(data.get('polygons', []))
+            if len(poly.get('points', [])) >= 3 and (labels is None or poly.get('label') in labels)
+        ]
+        if not polygons:
+            yield name, []
+            continue
+
+        image_path = find_image(data.get('image', ''), image_dirs, data.get('image_path'))
+        yield name, [
+            {
+                'annotation': name,
+                'image_path': image_path,
+                'image_size': data.get('image_size'),
+                'polygons': polygons[start:start + POLYGONS_PER_JOB],
+            }
+            for start in range(0, len(polygons), POLYGONS_PER_JOB)
+        ]
+
+
+def extract_job_chips(job, output_dir, margin=64, mask_outside=False):
+    """
+    裁剪一个任务中的所有多边形(在工作进程中运行)
+
+    参数:
+        job: iter_chip_jobs 生成的任务
+        output_dir: 输出目录，按标签分子目录保存
+        margin: 多边形外接矩形四周的边距(像素)
+        mask_outside: 是否将多边形外的像素设为透明
+
+    返回:
+        (records, errors): 元数据记录列表和错误信息列表
+    """
+    if job.get('error'):
+        return [], [f"{job['annotation']}: {job['error']}"]
+    if not job['image_path']:
+        return [], [f"{job['annotation']}: 找不到源图像"]
+
+    records = []
+    errors = []
+    source = RasterSource(job['image_path'])
+    try:
+        bands = [1, 2, 3] if source.band_count >= 3 else [1]
+        stem = os.path.splitext(os.path.basename(job['image_path']))[0]
+        ranges = None
+        scale = np.array(annotation_scale(job, source.width, source.height))
+
+        for index, label, points in job['polygons']:
+            try:
+                # 标注坐标换算为源图像像素
+                points = np.asarray(points, dtype=np.float64).reshape(-1, 2) * scale
+                # 外接矩形加边距，并限制在图像范围内
+                x0 = max(0, int(np.floor(points[:, 0].min())) - margin)
+                y0 = max(0, int(np.floor(points[:, 1].min())) - margin)
+                x1 = min(source.width, int(np.ceil(points[:, 0].max())) + margin + 1)
+                y1 = min(source.height, int(np.ceil(points[:, 1].max())) + margin + 1)
+                if x1 <= x0 or y1 <= y0:
+                    errors.append(f"{job['annotation']}#{index}: 多边形在图像范围之外")
+                    continue
+
+                # 只读取需要的窗口
+                chip = source.read_window(x0, y0, x1 - x0, y1 - y0, bands)
+                if chip.dtype != np.uint8:
+                    # 使用整幅图像的取值范围拉伸，保证同一场景的裁剪图亮度一致
+                    if ranges is None:
+                        ranges = [source.band_range(b) for b in bands]
+                    chip = np.stack([to_uint8(chip[:, :, i], *ranges[i]) for i in range(len(bands))], axis=2)
+
+                if mask_outside:
+                    mask = rasterize_polygon(points, y1 - y0, x1 - x0, origin=(x0, y0))
+                    alpha = (mask * 255).astype(np.uint8)[:, :, None]
+                    if chip.shape[2] == 1:
+                        chip = np.repeat(chip, 3, axis=2)
+                    chip = np.concatenate([chip, alpha], axis=2)
+
+                label_dir = os.path.join(output_dir, safe_name(label))
+                os.makedirs(label_dir, exist_ok=True)
+                chip_name = f"object_{safe_name(label)}_{stem}_{index}.png"
+                chip_path = os.path.join(label_dir, chip_name)
+                save_png(chip, chip_path)
+
+                local_points = points - np.array([x0, y0])
+                records.append({
+                    'chip': os.path.relpath(chip_path, output_dir),
+                    'label': label,
+                    'image': os.path.basename(job['image_path']),
+                    'annotation': job['annotation'],
+                    'polygon_index': index,
+                    'window': [x0, y0, x1 - x0, y1 - y0],
+                    'area': polygon_area(points),
+                    'points': np.round(local_points, 2).tolist(),
+                })
+            except Exception as e:
+                errors.append(f"{job['annotation']}#{index}: {str(e)}")
+    finally:
+        source.close()
+    return records, errors
+
+
+def save_png(array, path):
+    """将 (H, W) 灰度或 (H, W, C) uint8 数组保存为PNG"""
+    from PIL import Image
+    if array.ndim == 2:
+        image = Image.fromarray(np.ascontiguousarray(array), 'L')
+    elif array.shape[2] == 1:
+        image = Image.fromarray(array[:, :, 0], 'L')
+    elif array.shape[2] == 4:
+        image = Image.fromarray(np.ascontiguousarray(array), 'RGBA')
+    else:
+        image = Image.fromarray(np.ascontiguousarray(array[:, :, :3]), 'RGB')
+    image.save(path)
+
+
+def extract_annotation_chips(annotations_dir, image_dirs, output_dir, labels=None, margin=64,
+                             mask_outside=False, workers=None, progress=None):
+    """
+    为每个标注多边形裁剪一张图片，并写入元数据文件 metadata.jsonl
+
+    参数:
+        annotations_dir: 标注目录
+        image_dirs: 查找源图像的目录列表
+        output_dir: 输出目录
+        labels: 只处理这些标签，None表示全部
+        margin: 边距(像素)
+        mask_outside: 是否将多边形外的像素设为透明
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成的标注文件数, 标注文件总数)
+
+    返回:
+        {'chips': 生成的图片数量, 'errors': 错误信息列表, 'metadata': 元数据文件路径}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    metadata_path = os.path.join(output_dir, "metadata.jsonl")
+    workers = workers or os.cpu_count() or 1
+    total_files = len(list_annotation_files(annotations_dir))
+
+    chips = 0
+    errors = []
+    pending = {}  # {future: 标注文件名}
+    remaining = {}  # {标注文件名: 未完成的任务数}
+    done_files = 0
+
+    def collect(done):
+        nonlocal chips, done_files
+        for future in done:
+            name = pending.pop(future)
+            try:
+                records, job_errors = future.result()
+            except Exception as e:
+                records, job_errors = [], [f"{name}: {str(e)}"]
+            for record in records:
+                meta.write(json.dumps(record, ensure_ascii=False) + "\n")
+            chips += len(records)
+            errors.extend(job_errors)
+            remaining[name] -= 1
+            if remaining[name] == 0:
+                del remaining[name]
+                done_files += 1
+                if progress:
+                    progress(done_files, total_files)
+
+    with open(metadata_path, 'w', encoding='utf-8') as meta, ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, jobs in iter_chip_jobs(annotations_dir, image_dirs, labels):
+            if not jobs:
+                done_files += 1
+                continue
+            remaining[name] = len(jobs)
+            for job in jobs:
+                # 限制同时提交的任务数量，保持内存占用有界
+                while len(pending) >= workers * 4:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[pool.submit(extract_job_chips, job, output_dir, margin, mask_outside)] = name
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    return {'chips': chips, 'errors': errors, 'metadata': metadata_path}
@@ -0,0 +1,106 @@
+import numpy as np
+
+# 预测时每批处理的像素数，限制中间数组大小
+PREDICT_CHUNK = 1 << 18
+
+
+class GaussianNaiveBayes:
+    """NumPy 实现的高斯朴素贝叶斯分类器"""
+
+    def __init__(self, var_smoothing=1e-6):
+        """初始化分类器
+
+        参数:
+            var_smoothing: 加到方差上的平滑项(相对于最大特征方差的比例)
+        """
+        self.var_smoothing = var_smoothing
+        self.class_names = []
+        self.class_colors = []
+        self.means = None  # (K, F)
+        self.variances = None  # (K, F)
+        self.log_priors = None  # (K,)
+
+    def fit(self, features, labels, class_names, class_colors=None):
+        """训练分类器
+
+        参数:
+            features: (N, F) 特征数组
+            labels: (N,) 类别编号数组，取值为 0..K-1
+            class_names: 类别名称列表
+            class_colors: 类别颜色列表
+
+        返回:
+            self
+        """
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels)
+        count = len(class_names)
+        feature_count = features.shape[1]
+
+        self.means = np.zeros((count, feature_count))
+        self.variances = np.ones((count, feature_count))
+        priors = np.zeros(count)
+        epsilon = self.var_smoothing * max(float(features.var(axis=0).max()), 1e-12)
+        for k in range(count):
+            samples = features[labels == k]
+            priors[k] = len(samples)
+            if len(samples):
+                self.means[k] = samples.mean(axis=0)
+                self.variances[k] = samples.var(axis=0) + epsilon
+
+        priors = priors / max(priors.sum(), 1)
+        with np.errstate(divide='ignore'):
+            self.log_priors = np.log(priors)
+        self.class_names = list(class_names)
+        self.class_colors = list(class_colors or ["#FF0000"] * count)
+        return self
+
+    def predict(self, features):
+        """预测类别
+
+        参数:
+            features: (..., F) 特征数组
+
+        返回:
+            (...) uint8 类别编号数组
+        """
+        shape = features.shape[:-1]
+        flat = features.reshape(-1, features.shape[-1])
+        result = np.empty(len(flat), dtype=np.uint8)
+
+        # 高斯对数似然展开为与像素无关的常数项和逐特征的二次项
+        inv_var = (-0.5 / self.variances).astype(np.float32)  # (K, F)
+        means = self.means.astype(np.float32)
+        constants = (self.log_priors - 0.5 * np.log(2 * np.pi * self.variances).sum(axis=1)).astype(np.float32)
+
+        for start in range(0, len(flat), PREDICT_CHUNK):
+            chunk = flat[start:start + PREDICT_CHUNK].astype(np.float32)
+            scores = np.empty((len(chunk), len(means)), dtype=np.float32)
+            for k in range(len(means)):
+                diff = chunk - means[k]
+                scores[:, k] = (diff * diff) @ inv_var[k] + constants[k]
+            result[start:start + len(chunk)] = np.argmax(scores, axis=1)
+        return result.reshape(shape)
+
+    def save(self, path):
+        """保存模型到 .npz 文件"""
+        np.savez(
+            path,
+            means=self.means,
+            variances=self.variances,
+            log_priors=self.log_priors,
+            class_names=np.array(self.class_names),
+            class_colors=np.array(self.class_colors),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件加载模型"""
+        with np.load(path) as data:
+            model = cls()
+            model.means = data['means']
+            model.variances = data['variances']
+            model.log_priors = data['log_priors']
+            model.class_names = [str(name) for name in data['class_names']]
+            model.class_colors = [str(color) for color in data['class_colors']]
+        return model
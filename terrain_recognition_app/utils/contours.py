@@ -0,0 +1,340 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.raster_io import RasterSource, iter_tiles
+from utils.spatial_index import GridIndex
+
+# 等值线穿过的单元边：0=上 1=右 2=下 3=左
+# 单元角点编码：左上=1 右上=2 右下=4 左下=8(高程不低于等值线时置位)
+# 每种情况最多两条线段，每条线段为一对有向的单元边编号，-1 表示没有；
+# 线段方向统一为高处在前进方向的同一侧，相邻单元的线段因此首尾相接、方向一致
+SEGMENT_EDGES = np.array([
+    [[-1, -1], [-1, -1]],
+    [[0, 3], [-1, -1]],
+    [[1, 0], [-1, -1]],
+    [[1, 3], [-1, -1]],
+    [[2, 1], [-1, -1]],
+    [[0, 3], [1, 2]],
+    [[2, 0], [-1, -1]],
+    [[2, 3], [-1, -1]],
+    [[3, 2], [-1, -1]],
+    [[0, 2], [-1, -1]],
+    [[1, 0], [3, 2]],
+    [[1, 2], [-1, -1]],
+    [[3, 1], [-1, -1]],
+    [[0, 1], [-1, -1]],
+    [[3, 0], [-1, -1]],
+    [[-1, -1], [-1, -1]],
+], dtype=np.int8)
+
+
+def contour_segments(z, interval, base=0.0, origin=(0, 0), image_size=None):
+    """
+    使用向量化的 marching squares 计算一个高程块中所有等高线的线段
+
+    只处理与单元高程范围相交的等值线，计算量与线段数成正比，而不是与等值线数乘以像素数成正比。
+    线段端点用所在像素边和等值线编号组成的整数键标识，相邻分块在共享边上得到相同的键和坐标，
+    可以据此拼接。线段方向统一为高处在同一侧。
+
+    参数:
+        z: (H, W) float 高程数组，无效值为NaN
+        interval: 等高距
+        base: 基准高程，等值线为 base + n * interval
+        origin: 高程块左上角在整幅图像中的位置 (x, y)
+        image_size: 整幅图像大小 (width, height)，默认为高程块大小
+
+    返回:
+        (keys, points, levels): (N, 2) int64 起点和终点键、(N, 2, 2) float32 端点坐标(像素中心坐标系)
+        和 (N,) int64 等值线编号
+    """
+    z = np.asarray(z, dtype=np.float64)
+    width, height = image_size or (z.shape[1], z.shape[0])
+    edge_count = 2 * width * height
+    cell_cols = z.shape[1] - 1
+
+    tl, tr = z[:-1, :-1], z[:-1, 1:]
+    bl, br = z[1:, :-1], z[1:, 1:]
+    low = np.minimum(np.minimum(tl, tr), np.minimum(bl, br))
+    high = np.maximum(np.maximum(tl, tr), np.maximum(bl, br))
+
+    # 每个单元穿过的等值线编号范围 (first, first + count)
+    with np.errstate(invalid='ignore'):
+        first = np.floor((low - base) / interval) + 1
+        count = np.floor((high - base) / interval) - first + 1
+    count = np.where(np.isfinite(count), count, 0).astype(np.int64).ravel()
+    cells = np.flatnonzero(count > 0)
+    empty = (np.zeros((0, 2), np.int64), np.zeros((0, 2, 2), np.float32), np.zeros(0, np.int64))
+    if len(cells) == 0:
+        return empty
+
+    # 展开为 (单元, 等值线) 对
+    repeats = count[cells]
+    cell = np.repeat(cells, repeats)
+    level_id = (np.repeat(first.ravel()[cells].astype(np.int64), repeats) +
+                np.arange(len(cell)) - np.repeat(np.cumsum(repeats) - repeats, repeats))
+    level = base + level_id * interval
+    a, b = tl.ravel()[cell], tr.ravel()[cell]
+    c, d = bl.ravel()[cell], br.ravel()[cell]
+
+    case = ((a >= level) * 1 + (b >= level) * 2 + (d >= level) * 4 + (c >= level) * 8).astype(np.int8)
+    # 鞍点：中心高于等值线时两个高点相连，改用另一种鞍点的连接方式(线段方向随之反转)
+    saddle = ((case == 5) | (case == 10)) & ((a + b + c + d) / 4 >= level)
+    case[saddle] = 15 - case[saddle]
+
+    # 四条单元边上的交点，按边编号排列
+    row, col = np.divmod(cell, cell_cols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.stack([(level - a) / (b - a), (level - b) / (d - b),
+                      (level - c) / (d - c), (level - a) / (c - a)], axis=1)
+    x = (col + origin[0] + 0.5)[:, None] + np.stack([t[:, 0], np.ones(len(cell)), t[:, 2], np.zeros(len(cell))], axis=1)
+    y = (row + origin[1] + 0.5)[:, None] + np.stack([np.zeros(len(cell)), t[:, 1], np.ones(len(cell)), t[:, 3]], axis=1)
+
+    # 交点所在像素边的编号：水平边为偶数，竖直边为奇数
+    gr = row + origin[1]
+    gc = col + origin[0]
+    edge_ids = np.stack([(gr * width + gc) * 2, (gr * width + gc + 1) * 2 + 1,
+                         ((gr + 1) * width + gc) * 2, (gr * width + gc) * 2 + 1], axis=1)
+    keys = edge_ids + (level_id * edge_count)[:, None]
+
+    keys_out, points_out, levels_out = [], [], []
+    for k in range(2):
+        edges = SEGMENT_EDGES[case, k]
+        has = edges[:, 0] >= 0
+        rows = np.flatnonzero(has)
+        e = edges[has].astype(np.int64)
+        e[saddle[rows]] = e[saddle[rows]][:, ::-1]
+        keys_out.append(np.take_along_axis(keys[rows], e, axis=1))
+        points_out.append(np.stack([np.take_along_axis(x[rows], e, axis=1),
+                                    np.take_along_axis(y[rows], e, axis=1)], axis=2))
+        levels_out.append(level_id[rows])
+    return (np.concatenate(keys_out), np.concatenate(points_out).astype(np.float32),
+            np.concatenate(levels_out))
+
+
+def chain_paths(key_a, key_b):
+    """
+    按端点键把有向路径首尾相连成链
+
+    所有路径方向一致，每个键最多作为一条路径的起点和一条路径的终点，
+    因此后继关系可以通过排序一次性求出，只有沿链遍历需要逐个进行。
+
+    参数:
+        key_a, key_b: 每条路径起点和终点的键
+
+    返回:
+        [(路径编号列表, 是否闭合), ...]
+    """
+    key_a = np.asarray(key_a, dtype=np.int64)
+    key_b = np.asarray(key_b, dtype=np.int64)
+    count = len(key_a)
+    if count == 0:
+        return []
+    order = np.argsort(key_a, kind='stable')
+    sorted_a = key_a[order]
+    pos = np.minimum(np.searchsorted(sorted_a, key_b), count - 1)
+    successor = np.where(sorted_a[pos] == key_b, order[pos], -1)
+    has_predecessor = np.zeros(count, dtype=bool)
+    has_predecessor[successor[successor >= 0]] = True
+
+    successor = successor.tolist()
+    visited = [False] * count
+    chains = []
+    # 先从没有前驱的路径出发得到开放的链，剩下的都在闭合的环上
+    for start in np.flatnonzero(~has_predecessor).tolist() + list(range(count)):
+        if visited[start]:
+            continue
+        chain = []
+        j = start
+        while j >= 0 and not visited[j]:
+            chain.append(j)
+            visited[j] = True
+            j = successor[j]
+        chains.append((chain, j == start))
+    return chains
+
+
+class ContourSet:
+    """等高线集合：折线坐标连续存放，附带每条折线的高程和外接矩形空间索引"""
+
+    def __init__(self, coords, offsets, levels, interval, base=0.0, geotransform=None):
+        """初始化
+
+        参数:
+            coords: (N, 2) float32 坐标数组(图像像素坐标)
+            offsets: (M+1,) 偏移量数组
+            levels: (M,) 每条折线的等值线编号
+            interval: 等高距
+            base: 基准高程
+            geotransform: 源图像的地理变换参数，没有时为None
+        """
+        self.coords = np.asarray(coords, dtype=np.float32).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.levels = np.asarray(levels, dtype=np.int64)
+        self.interval = interval
+        self.base = base
+        self.geotransform = geotransform
+        self._index = None
+
+    def __len__(self):
+        return len(self.levels)
+
+    def points(self, index):
+        """获取第 index 条折线的坐标数组(视图)"""
+        return self.coords[self.offsets[index]:self.offsets[index + 1]]
+
+    def elevation(self, index):
+        """获取第 index 条折线的高程"""
+        return self.base + int(self.levels[index]) * self.interval
+
+    def bounds(self):
+        """每条折线的外接矩形 (M, 4)"""
+        if not len(self):
+            return np.zeros((0, 4), dtype=np.float32)
+        starts = self.offsets[:-1]
+        return np.stack([np.minimum.reduceat(self.coords[:, 0], starts),
+                         np.minimum.reduceat(self.coords[:, 1], starts),
+                         np.maximum.reduceat(self.coords[:, 0], starts),
+                         np.maximum.reduceat(self.coords[:, 1], starts)], axis=1)
+
+    @property
+    def index(self):
+        """外接矩形空间索引(按需建立)"""
+        if self._index is None:
+            self._index = GridIndex(self.bounds())
+        return self._index
+
+    def query(self, rect):
+        """查询与矩形 (min_x, min_y, max_x, max_y) 相交的折线编号"""
+        return self.index.query(rect)
+
+    def nearest(self, x, y, max_distance):
+        """
+        查找离某点最近的等高线
+
+        参数:
+            x, y: 图像像素坐标
+            max_distance: 最大搜索距离
+
+        返回:
+            (折线编号, 距离)，范围内没有等高线时返回None
+        """
+        candidates = self.query((x - max_distance, y - max_distance, x + max_distance, y + max_distance))
+        best = None
+        for index in candidates:
+            points = self.points(index).astype(np.float64)
+            if len(points) < 2:
+                continue
+            a, b = points[:-1], points[1:]
+            ab = b - a
+            length_sq = np.maximum((ab * ab).sum(axis=1), 1e-12)
+            t = np.clip(((x - a[:, 0]) * ab[:, 0] + (y - a[:, 1]) * ab[:, 1]) / length_sq, 0, 1)
+            distance = float(np.hypot(a[:, 0] + t * ab[:, 0] - x, a[:, 1] + t * ab[:, 1] - y).min())
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (int(index), distance)
+        return best
+
+    def to_geojson(self, path):
+        """
+        导出为GeoJSON LineString要素，属性 elevation 为高程
+
+        有地理变换参数时坐标转换为源图像坐标系下的地图坐标，否则使用像素坐标。
+        """
+        features = []
+        for i in range(len(self)):
+            points = self.points(i).astype(np.float64)
+            if self.geotransform:
+                gt = self.geotransform
+                points = np.stack([gt[0] + points[:, 0] * gt[1] + points[:, 1] * gt[2],
+                                   gt[3] + points[:, 0] * gt[4] + points[:, 1] * gt[5]], axis=1)
+            features.append({
+                "type": "Feature",
+                "properties": {"elevation": self.elevation(i)},
+                "geometry": {"type": "LineString", "coordinates": np.round(points, 6).tolist()},
+            })
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+# 工作进程中的数据源
+_worker_source = None
+_worker_interval = None
+_worker_base = None
+
+
+def _init_worker(dem_path, interval, base):
+    """工作进程初始化"""
+    global _worker_source, _worker_interval, _worker_base
+    _worker_source = RasterSource(dem_path)
+    _worker_interval = interval
+    _worker_base = base
+
+
+def _contour_tile(tile):
+    """在工作进程中计算一个分块的等高线，并在分块内部拼接"""
+    source = _worker_source
+    # 分块覆盖的单元需要右侧和下方多读一个像素
+    read_width = min(tile.width + 1, source.width - tile.x)
+    read_height = min(tile.height + 1, source.height - tile.y)
+    z = source.read_band(1, tile.x, tile.y, read_width, read_height).astype(np.float64)
+    if source.nodata is not None:
+        z[z == source.nodata] = np.nan
+    keys, points, _ = contour_segments(z, _worker_interval, _worker_base, (tile.x, tile.y),
+                                       (source.width, source.height))
+    paths = []
+    for chain, _ in chain_paths(keys[:, 0], keys[:, 1]):
+        line = np.concatenate([points[chain, 0], points[chain[-1:], 1]])
+        paths.append((int(keys[chain[0], 0]), int(keys[chain[-1], 1]), line))
+    return paths
+
+
+def generate_contours(dem_path, interval, base=0.0, tile_size=1024, workers=None, progress=None):
+    """
+    逐块生成DEM的等高线
+
+    每个分块在工作进程中计算线段并拼接，分块边界上的开放端点在主进程中再按端点键拼接成完整折线。
+
+    参数:
+        dem_path: DEM文件路径(使用第1波段)
+        interval: 等高距
+        base: 基准高程
+        tile_size: 分块大小
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        ContourSet
+    """
+    if interval <= 0:
+        raise ValueError("等高距必须大于0")
+    source = RasterSource(dem_path)
+    width, height = source.width, source.height
+    geotransform = source.geotransform
+    source.close()
+    edge_count = 2 * width * height
+
+    # 分块按单元划分，单元数比像素数少一行一列
+    tiles = list(iter_tiles(max(width - 1, 1), max(height - 1, 1), tile_size))
+    closed, open_paths = [], []
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dem_path, interval, base)) as pool:
+        for done, paths in enumerate(pool.map(_contour_tile, tiles), start=1):
+            for path in paths:
+                (closed if path[0] == path[1] else open_paths).append(path)
+            if progress:
+                progress(done, len(tiles))
+
+    # 分块内拼接后剩下的开放折线端点都在分块边界或图像边界上
+    lines = [p[2] for p in closed]
+    levels = [p[0] // edge_count for p in closed]
+    for chain, _ in chain_paths([p[0] for p in open_paths], [p[1] for p in open_paths]):
+        lines.append(np.concatenate([open_paths[chain[0]][2]] + [open_paths[j][2][1:] for j in chain[1:]]))
+        levels.append(open_paths[chain[0]][0] // edge_count)
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in lines], out=offsets[1:])
+    coords = np.concatenate(lines) if lines else np.zeros((0, 2), dtype=np.float32)
+    return ContourSet(coords, offsets, levels, interval, base, geotransform)
@@ -0,0 +1,201 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.raster_io import RasterSource, PreviewBuilder, iter_tiles, tile_inner
+from utils.texture import box_sum, box_counts, quantize, glcm_features, GLCM_NAMES
+from utils.tile_cache import DiskTileCache, source_key, tile_key
+
+# 局部统计窗口半径，窗口大小为 2 * radius + 1
+DEFAULT_RADIUS = 2
+
+# 特征分块大小，分类和纹理显示使用相同的分块才能共用缓存
+FEATURE_TILE_SIZE = 512
+
+# 特征计算方式或缓存格式改变时递增，使旧的缓存失效
+FEATURE_VERSION = 3
+
+# 特征通道名称，与 pixel_features 的输出顺序一致
+FEATURE_NAMES = ("band1", "band2", "band3", "local_std", "gradient") + GLCM_NAMES
+
+
+def box_mean(array, radius):
+    """
+    使用积分图计算方形窗口内的均值，计算量与窗口大小无关
+
+    边界处只统计窗口内实际存在的像素。
+
+    参数:
+        array: (H, W) 数组
+        radius: 窗口半径
+
+    返回:
+        (H, W) float32 数组
+    """
+    array = np.asarray(array)
+    return (box_sum(array, radius) / box_counts(array.shape[0], array.shape[1], radius)).astype(np.float32)
+
+
+def feature_bands(band_count):
+    """
+    选择用于特征计算的三个波段，保证不同波段数的图像得到相同维度的特征
+
+    参数:
+        band_count: 图像波段数
+
+    返回:
+        波段编号列表(从1开始)
+    """
+    if band_count >= 3:
+        return [1, 2, 3]
+    return [1, 1, 1]
+
+
+def feature_gray_range(source):
+    """
+    纹理特征量化使用的灰度范围，整幅图像使用同一范围，保证各分块的特征一致
+
+    参数:
+        source: RasterSource
+
+    返回:
+        (min, max)
+    """
+    ranges = [source.band_range(band) for band in sorted(set(feature_bands(source.band_count)))]
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+def pixel_features(block, radius=DEFAULT_RADIUS, gray_range=(0, 255)):
+    """
+    计算每个像素的特征：各波段值、灰度的局部标准差、梯度幅值和GLCM纹理统计量
+
+    参数:
+        block: (H, W, C) 图像数组
+        radius: 局部统计窗口半径
+        gray_range: GLCM量化使用的灰度范围
+
+    返回:
+        (H, W, C + 2 + len(GLCM_NAMES)) float32 特征数组
+    """
+    bands = block.astype(np.float32)
+    gray = bands.mean(axis=2)
+
+    mean = box_mean(gray, radius)
+    mean_sq = box_mean(gray * gray, radius)
+    std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+
+    if min(gray.shape) > 1:
+        grad_y, grad_x = np.gradient(gray)
+        gradient = np.hypot(grad_x, grad_y).astype(np.float32)
+    else:
+        gradient = np.zeros_like(gray)
+
+    texture = glcm_features(quantize(gray, gray_range), radius)
+    return np.concatenate([bands, std[:, :, None], gradient[:, :, None], texture], axis=2)
+
+
+def feature_halo(radius=DEFAULT_RADIUS):
+    """分块计算特征时需要的重叠边宽度，保证分块结果与整幅计算一致"""
+    return radius + 1
+
+
+def feature_namespace(image_path, radius=DEFAULT_RADIUS):
+    """特征分块在磁盘缓存中的命名空间"""
+    return f"{source_key(image_path)}/features-v{FEATURE_VERSION}-r{radius}"
+
+
+def tile_features(source, tile, bands, gray_range, cache=None, namespace=None, channels=None):
+    """
+    计算一个分块内部区域的特征，有缓存时优先读取缓存
+
+    特征按通道分别缓存，只显示一个纹理通道时不会把全部通道写入磁盘。
+
+    参数:
+        source: RasterSource
+        tile: 带 feature_halo() 重叠边的 Tile
+        bands: 特征波段编号
+        gray_range: 灰度范围
+        cache: DiskTileCache，None表示不缓存
+        namespace: 缓存命名空间，见 feature_namespace
+        channels: 需要的特征通道下标，None表示全部
+
+    返回:
+        (tile.height, tile.width, len(channels)) float32 数组
+    """
+    if channels is None:
+        channels = range(len(FEATURE_NAMES))
+    channels = list(channels)
+    key = tile_key(tile)
+    if cache is not None:
+        cached = [cache.get(namespace, f"{key}_c{channel}") for channel in channels]
+        if all(layer is not None for layer in cached):
+            return np.stack(cached, axis=2)
+    block = source.read_window(tile.read_x, tile.read_y, tile.read_width, tile.read_height, bands)
+    features = np.ascontiguousarray(pixel_features(block, gray_range=gray_range)[tile_inner(tile)][:, :, channels])
+    if cache is not None:
+        for i, channel in enumerate(channels):
+            cache.put(namespace, f"{key}_c{channel}", np.ascontiguousarray(features[:, :, i]))
+    return features
+
+
+# 工作进程中的数据源和特征参数
+_worker_source = None
+_worker_bands = None
+_worker_gray_range = None
+_worker_cache = None
+_worker_namespace = None
+
+
+def _init_worker(image_path, gray_range, cache_root):
+    """工作进程初始化"""
+    global _worker_source, _worker_bands, _worker_gray_range, _worker_cache, _worker_namespace
+    _worker_source = RasterSource(image_path)
+    _worker_bands = feature_bands(_worker_source.band_count)
+    _worker_gray_range = gray_range
+    _worker_cache = DiskTileCache(cache_root) if cache_root else None
+    _worker_namespace = feature_namespace(image_path)
+
+
+def _feature_channel_tile(args):
+    """在工作进程中计算一个分块的一个特征通道"""
+    tile, channel = args
+    features = tile_features(_worker_source, tile, _worker_bands, _worker_gray_range,
+                             _worker_cache, _worker_namespace, channels=[channel])
+    return tile, features[:, :, 0]
+
+
+def feature_layer(image_path, name, cache_root=None, max_preview=4096, workers=None, progress=None):
+    """
+    逐块计算一个特征通道的预览，用于显示纹理特征
+
+    特征分块与分类使用相同的分块和缓存，分类时计算过的分块显示时直接读取；显示时只缓存所显示的通道。
+
+    参数:
+        image_path: 图像路径
+        name: 特征名称，见 FEATURE_NAMES
+        cache_root: 分块缓存目录，None表示不缓存
+        max_preview: 预览的最大边长
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        (H', W') float32 预览数组
+    """
+    channel = FEATURE_NAMES.index(name)
+    source = RasterSource(image_path)
+    width, height = source.width, source.height
+    gray_range = feature_gray_range(source)
+    source.close()
+
+    tiles = list(iter_tiles(width, height, FEATURE_TILE_SIZE, feature_halo()))
+    preview = PreviewBuilder(width, height, max_preview, dtype=np.float32, fill=np.nan)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(image_path, gray_range, cache_root)) as pool:
+        jobs = ((tile, channel) for tile in tiles)
+        for done, (tile, values) in enumerate(pool.map(_feature_channel_tile, jobs), start=1):
+            preview.add(tile.x, tile.y, values)
+            if progress:
+                progress(done, len(tiles))
+    return preview.array
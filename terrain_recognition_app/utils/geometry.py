@@ -0,0 +1,322 @@
+import numpy as np
+
+# 扫描线栅格化每次处理的行数
+RASTER_CHUNK_ROWS = 256
+
+
+def pack_polygons(polygons):
+    """
+    将多边形点列表打包为连续坐标数组和偏移量数组
+
+    参数:
+        polygons: 多边形点列表的序列，每个元素为 [(x, y), ...]
+
+    返回:
+        (coords, offsets): coords 为 (N, 2) 的 float64 数组，
+        offsets 为 (M+1,) 的 int64 数组，第 i 个多边形的点为 coords[offsets[i]:offsets[i+1]]
+    """
+    lengths = np.fromiter((len(p) for p in polygons), dtype=np.int64, count=len(polygons))
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.zeros((0, 2), dtype=np.float64), offsets
+    coords = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons if len(p)])
+    return coords, offsets
+
+
+def polygon_areas(coords, offsets):
+    """
+    使用向量化鞋带公式计算一组多边形的面积
+
+    参数:
+        coords: (N, 2) 坐标数组
+        offsets: (M+1,) 偏移量数组
+
+    返回:
+        (M,) float64 面积数组，点数少于3的多边形面积为0
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    count = len(offsets) - 1
+    areas = np.zeros(count, dtype=np.float64)
+    if count <= 0 or offsets[-1] == 0:
+        return areas
+
+    coords = np.asarray(coords, dtype=np.float64)
+    x = coords[:, 0]
+    y = coords[:, 1]
+    starts = offsets[:-1]
+    ends = offsets[1:]
+
+    # 每个点的下一个点索引，多边形最后一个点回到自身起点
+    nxt = np.arange(1, len(coords) + 1, dtype=np.int64)
+    non_empty = ends > starts
+    nxt[ends[non_empty] - 1] = starts[non_empty]
+
+    cross = x * y[nxt] - x[nxt] * y
+
+    # reduceat 对空区间会返回单个元素，因此只对非空多边形求和
+    sums = np.add.reduceat(cross, starts[non_empty])
+    areas[non_empty] = 0.5 * np.abs(sums)
+    areas[(ends - starts) < 3] = 0.0
+    return areas
+
+
+def polygon_area(points):
+    """
+    计算单个多边形的面积
+
+    参数:
+        points: 多边形点列表 [(x, y), ...]
+
+    返回:
+        面积(浮点数)
+    """
+    coords, offsets = pack_polygons([points])
+    return float(polygon_areas(coords, offsets)[0])
+
+
+def simplify_polyline(points, tolerance):
+    """
+    使用Douglas-Peucker算法简化折线
+
+    参数:
+        points: (N, 2) 坐标数组
+        tolerance: 允许的最大垂直距离(像素)，小于等于0时不简化
+
+    返回:
+        保留点的布尔掩码 (N,)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    keep = np.ones(count, dtype=bool)
+    if tolerance <= 0 or count < 3:
+        return keep
+
+    keep[1:-1] = False
+    # 使用显式栈代替递归，避免长折线超出递归深度
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[start + 1:end]
+        a = points[start]
+        b = points[end]
+        ab = b - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            dists = np.hypot(segment[:, 0] - a[0], segment[:, 1] - a[1])
+        else:
+            dists = np.abs(ab[0] * (segment[:, 1] - a[1]) - ab[1] * (segment[:, 0] - a[0])) / length
+        index = int(np.argmax(dists))
+        if dists[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify_polygon(points, tolerance):
+    """
+    简化闭合多边形，结果至少保留3个点
+
+    参数:
+        points: 多边形点列表或 (N, 2) 数组
+        tolerance: 允许的最大垂直距离(像素)
+
+    返回:
+        简化后的 (M, 2) 数组
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if tolerance <= 0 or len(points) <= 3:
+        return points
+
+    # 闭合多边形以离起点最远的点为界拆成两条折线分别简化
+    dists = np.hypot(points[:, 0] - points[0, 0], points[:, 1] - points[0, 1])
+    far = int(np.argmax(dists))
+    if far == 0:
+        return points[:3]
+    ring = np.vstack([points, points[:1]])
+    keep = np.concatenate([
+        simplify_polyline(ring[:far + 1], tolerance)[:-1],
+        simplify_polyline(ring[far:], tolerance)[:-1],
+    ])
+    if keep.sum() < 3:
+        return points
+    return points[keep]
+
+
+def _clip_edge(points, axis, bound, keep_greater):
+    """
+    Sutherland-Hodgman 的单条裁剪边，对所有顶点向量化计算
+
+    参数:
+        points: (N, 2) 坐标数组
+        axis: 0表示竖直裁剪线 x=bound，1表示水平裁剪线 y=bound
+        bound: 裁剪线位置
+        keep_greater: True 保留 >= bound 的一侧，False 保留 <= bound 的一侧
+
+    返回:
+        裁剪后的 (M, 2) 坐标数组
+    """
+    if len(points) == 0:
+        return points
+    values = points[:, axis]
+    inside = values >= bound if keep_greater else values <= bound
+    if inside.all():
+        return points
+
+    prev = np.roll(points, 1, axis=0)
+    prev_inside = np.roll(inside, 1)
+    crossing = inside != prev_inside
+
+    # 计算前一个点到当前点的边与裁剪线的交点(只有跨越裁剪线的边有效)
+    delta = points[:, axis] - prev[:, axis]
+    safe = np.where(crossing, delta, 1.0)
+    t = (bound - prev[:, axis]) / safe
+    intersections = prev + t[:, None] * (points - prev)
+    intersections[:, axis] = bound
+
+    # 每个顶点最多输出两个点：交点在前，顶点本身在后
+    candidates = np.stack([intersections, points], axis=1).reshape(-1, 2)
+    mask = np.stack([crossing, inside], axis=1).reshape(-1)
+    return candidates[mask]
+
+
+def clip_polygon_to_rect(points, rect):
+    """
+    使用Sutherland-Hodgman算法将多边形裁剪到轴对齐矩形内
+
+    参数:
+        points: 多边形点列表或 (N, 2) 数组
+        rect: (min_x, min_y, max_x, max_y)
+
+    返回:
+        裁剪后的 (M, 2) 数组，多边形完全在矩形外时为空数组
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    min_x, min_y, max_x, max_y = rect
+    points = _clip_edge(points, 0, min_x, True)
+    points = _clip_edge(points, 0, max_x, False)
+    points = _clip_edge(points, 1, min_y, True)
+    points = _clip_edge(points, 1, max_y, False)
+    if len(points) > 1:
+        # 去除顶点恰好落在裁剪线上时产生的连续重复点
+        distinct = np.any(points != np.roll(points, 1, axis=0), axis=1)
+        points = points[distinct]
+    return points
+
+
+def polygons_intersecting_rect(coords, offsets, rect):
+    """
+    用外接矩形快速筛选可能与矩形相交的多边形
+
+    参数:
+        coords: (N, 2) 坐标数组
+        offsets: (M+1,) 偏移量数组
+        rect: (min_x, min_y, max_x, max_y)
+
+    返回:
+        候选多边形索引数组
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = offsets[:-1]
+    non_empty = np.flatnonzero(offsets[1:] > starts)
+    if len(non_empty) == 0:
+        return non_empty
+    coords = np.asarray(coords)
+    min_xy = np.stack([np.minimum.reduceat(coords[:, 0], starts[non_empty]),
+                       np.minimum.reduceat(coords[:, 1], starts[non_empty])], axis=1)
+    max_xy = np.stack([np.maximum.reduceat(coords[:, 0], starts[non_empty]),
+                       np.maximum.reduceat(coords[:, 1], starts[non_empty])], axis=1)
+    hit = ((max_xy[:, 0] >= rect[0]) & (min_xy[:, 0] <= rect[2]) &
+           (max_xy[:, 1] >= rect[1]) & (min_xy[:, 1] <= rect[3]))
+    return non_empty[hit]
+
+
+def clip_polygons_to_rect(coords, offsets, rect, min_area=0.0):
+    """
+    将一组多边形裁剪到矩形内，并平移到矩形左上角为原点的坐标系
+
+    参数:
+        coords: (N, 2) 坐标数组
+        offsets: (M+1,) 偏移量数组
+        rect: (min_x, min_y, max_x, max_y)
+        min_area: 裁剪后面积不超过该值的多边形被丢弃
+
+    返回:
+        [(原多边形索引, 裁剪并平移后的 (K, 2) 数组), ...]
+    """
+    results = []
+    origin = np.array(rect[:2], dtype=np.float64)
+    for index in polygons_intersecting_rect(coords, offsets, rect):
+        clipped = clip_polygon_to_rect(coords[offsets[index]:offsets[index + 1]], rect)
+        if len(clipped) < 3 or polygon_area(clipped) <= min_area:
+            continue
+        results.append((int(index), clipped - origin))
+    return results
+
+
+def rasterize_polygon(points, height, width, origin=(0, 0)):
+    """
+    使用向量化扫描线将多边形栅格化为掩码(像素中心在多边形内即为True，奇偶规则)
+
+    参数:
+        points: 多边形点列表或 (N, 2) 数组(图像坐标)
+        height, width: 输出掩码大小
+        origin: 掩码左上角在图像坐标中的位置 (x, y)
+
+    返回:
+        (height, width) 布尔数组
+    """
+    mask = np.zeros((height, width), dtype=bool)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2) - np.asarray(origin, dtype=np.float64)
+    if len(points) < 3 or height <= 0 or width <= 0:
+        return mask
+
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    # 只处理非水平边，并只检查与边的y范围重叠的行
+    edges = y0 != y1
+    x0, y0, x1, y1 = x0[edges], y0[edges], x1[edges], y1[edges]
+    row_lo = max(0, int(np.floor(min(y0.min(), y1.min()))))
+    row_hi = min(height, int(np.ceil(max(y0.max(), y1.max()))) + 1)
+    if row_lo >= row_hi:
+        return mask
+
+    ylo = np.minimum(y0, y1)
+    yhi = np.maximum(y0, y1)
+    slope = (x1 - x0) / (y1 - y0)
+    # 按固定行数分块扫描，每块只使用y范围与之重叠的边，中间矩阵的大小不随掩码高度增长
+    for chunk_lo in range(row_lo, row_hi, RASTER_CHUNK_ROWS):
+        chunk_hi = min(chunk_lo + RASTER_CHUNK_ROWS, row_hi)
+        near = (ylo <= chunk_hi - 0.5) & (yhi > chunk_lo + 0.5)
+        if near.any():
+            mask[chunk_lo:chunk_hi] = _scanline_rows(
+                chunk_lo, chunk_hi, width, x0[near], y0[near], ylo[near], yhi[near], slope[near])
+    return mask
+
+
+def _scanline_rows(row_lo, row_hi, width, x0, y0, ylo, yhi, slope):
+    """按奇偶规则填充 [row_lo, row_hi) 行，返回 (行数, width) 布尔数组"""
+    ys = np.arange(row_lo, row_hi, dtype=np.float64) + 0.5
+    # (行, 边) 矩阵：扫描线是否穿过该边(半开区间避免顶点重复计数)
+    crosses = (ys[:, None] >= ylo[None, :]) & (ys[:, None] < yhi[None, :])
+    xs = x0[None, :] + (ys[:, None] - y0[None, :]) * slope[None, :]
+    xs = np.where(crosses, xs, np.inf)
+    xs.sort(axis=1)
+
+    # 交点两两配对为填充区间，用差分数组一次性累加
+    pairs = xs.shape[1] // 2
+    starts = xs[:, 0:2 * pairs:2]
+    ends = xs[:, 1:2 * pairs:2]
+    valid = np.isfinite(starts) & np.isfinite(ends)
+    rows = np.broadcast_to(np.arange(row_hi - row_lo)[:, None], starts.shape)[valid]
+    col_start = np.clip(np.ceil(starts[valid] - 0.5), 0, width).astype(np.int64)
+    col_end = np.clip(np.ceil(ends[valid] - 0.5), 0, width).astype(np.int64)
+
+    diff = np.zeros((row_hi - row_lo, width + 1), dtype=np.int32)
+    np.add.at(diff, (rows, col_start), 1)
+    np.add.at(diff, (rows, col_end), -1)
+    return np.cumsum(diff[:, :width], axis=1, dtype=np.int32) > 0
@@ -1,14 +1,7 @@
 import os
+import numpy as np
 from PyQt5.QtGui import QPixmap
 
-# 尝试导入PIL库，用于处理图像
-try:
-    from PIL import Image
-    import numpy as np
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-
 # 是否尝试使用GDAL
 GDAL_AVAILABLE = False
 
@@ -22,7 +15,10 @@ def load_image_with_pil(file_path):
     返回:
         (pixmap, temp_file): 加载好的QPixmap对象和临时文件路径(如果有的话)
     """
-    if not PIL_AVAILABLE:
+    # PIL在第一次使用时才导入，避免拖慢启动
+    try:
+        from PIL import Image
+    except ImportError:
         raise ImportError("未安装PIL库，无法进行高级图像处理")
         
     # 使用PIL打开图像文件
@@ -40,3 +36,83 @@ def load_image_with_pil(file_path):
     pixmap = QPixmap(temp_file)
     
     return pixmap, temp_file
+
+
+def index_overlay_image(indices, colors, width, height, alpha=110, skip_value=255):
+    """
+    将类别/聚类编号栅格转换为半透明彩色叠加图
+
+    参数:
+        indices: (H, W) uint8 编号数组
+        colors: 颜色列表，第 i 个颜色对应编号 i (颜色字符串，如 "#FF0000")
+        width, height: 叠加图大小(显示图像的尺寸)，按最近邻重采样
+        alpha: 叠加图不透明度 (0-255)
+        skip_value: 不着色(完全透明)的编号
+
+    返回:
+        QImage (Format_RGBA8888)
+    """
+    from PyQt5.QtGui import QImage, QColor
+
+    # 先按显示尺寸做最近邻采样，避免为整幅原始分辨率生成彩色图像
+    rows = np.minimum((np.arange(height) * indices.shape[0]) // max(height, 1), indices.shape[0] - 1)
+    cols = np.minimum((np.arange(width) * indices.shape[1]) // max(width, 1), indices.shape[1] - 1)
+    sampled = indices[rows][:, cols]
+
+    # 查找表着色
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    for i, color in enumerate(colors[:256]):
+        c = QColor(color)
+        lut[i] = (c.red(), c.green(), c.blue(), alpha)
+    lut[skip_value, 3] = 0
+    rgba = np.ascontiguousarray(lut[sampled])
+
+    image = QImage(rgba.data, width, height, 4 * width, QImage.Format_RGBA8888)
+    # 复制一份，使QImage不再引用numpy缓冲区
+    return image.copy()
+
+
+def array_to_qimage(array):
+    """
+    将 uint8 数组转换为QImage
+
+    参数:
+        array: (H, W) 灰度或 (H, W, 3) RGB 或 (H, W, 4) RGBA 的 uint8 数组
+
+    返回:
+        QImage(已复制，不引用numpy缓冲区)
+    """
+    from PyQt5.QtGui import QImage
+
+    array = np.ascontiguousarray(array)
+    height, width = array.shape[:2]
+    if array.ndim == 2:
+        image = QImage(array.data, width, height, width, QImage.Format_Grayscale8)
+    elif array.shape[2] == 4:
+        image = QImage(array.data, width, height, 4 * width, QImage.Format_RGBA8888)
+    else:
+        image = QImage(array.data, width, height, 3 * width, QImage.Format_RGB888)
+    return image.copy()
+
+
+def qimage_to_array(image):
+    """
+    将QImage或QPixmap转换为 (H, W, 3) 的 uint8 RGB 数组
+
+    参数:
+        image: QImage 或 QPixmap
+
+    返回:
+        (H, W, 3) uint8 数组(已复制，不引用Qt缓冲区)
+    """
+    from PyQt5.QtGui import QImage
+
+    if not isinstance(image, QImage):
+        image = image.toImage()
+    image = image.convertToFormat(QImage.Format_RGB888)
+    width, height = image.width(), image.height()
+    buffer = image.constBits()
+    buffer.setsize(image.bytesPerLine() * height)
+    # 每行可能有对齐填充，按 bytesPerLine 切出有效部分
+    array = np.frombuffer(buffer, dtype=np.uint8).reshape(height, image.bytesPerLine())
+    return array[:, :3 * width].reshape(height, width, 3).copy()
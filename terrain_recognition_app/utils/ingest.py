@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import select
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from utils.batch import stats_file
+from utils.chip_extractor import save_png
+from utils.raster_io import get_gdal
+from utils.render import render_display_array, write_cached_display, display_namespace
+from utils.tile_cache import DiskTileCache, source_key
+
+# 默认监视的扩展名
+INGEST_EXTENSIONS = ('.tif', '.tiff')
+
+# 缩略图最大边长
+THUMBNAIL_SIZE = 256
+
+# 生成金字塔的最小图像边长，更小的图像不需要金字塔
+OVERVIEW_MIN_SIZE = 2048
+
+# inotify 事件：写入完成、移入目录、新建
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+def _inotify_watch(directory):
+    """
+    用 inotify 监视目录(仅Linux，通过ctypes调用，不需要额外依赖)
+
+    返回:
+        inotify 文件描述符，不可用时返回None
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """监视目录中新到达的文件，文件大小和修改时间稳定一段时间后才认为写入完成
+
+    有 inotify 时用它唤醒扫描，否则按固定间隔轮询；两种方式都以扫描结果为准，事件只用于及时唤醒。
+    """
+
+    def __init__(self, directory, extensions=INGEST_EXTENSIONS, settle=5.0, use_inotify=True):
+        """初始化
+
+        参数:
+            directory: 监视的目录
+            extensions: 关注的扩展名
+            settle: 文件保持不变多少秒后认为写入完成
+            use_inotify: 是否尝试使用 inotify
+        """
+        self.directory = directory
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.settle = settle
+        self.seen = {}  # {路径: (大小, 修改时间, 首次观察到该状态的时间)}
+        self.emitted = {}  # {路径: 已交给调用方的 (大小, 修改时间)}
+        self.fd = _inotify_watch(directory) if use_inotify else None
+
+    @property
+    def mode(self):
+        """监视方式名称"""
+        return "inotify" if self.fd is not None else "polling"
+
+    def poll(self, now=None):
+        """
+        扫描目录
+
+        返回:
+            写入已完成且尚未交给调用方(或之后又被改写)的文件路径列表
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        current = set()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.lower().endswith(self.extensions):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            path = entry.path
+            current.add(path)
+            state = (stat.st_size, stat.st_mtime)
+            previous = self.seen.get(path)
+            if previous is None or previous[:2] != state:
+                self.seen[path] = state + (now,)
+                continue
+            if stat.st_size > 0 and now - previous[2] >= self.settle and self.emitted.get(path) != state:
+                self.emitted[path] = state
+                ready.append(path)
+        # 被删除的文件不再跟踪
+        for path in set(self.seen) - current:
+            del self.seen[path]
+            self.emitted.pop(path, None)
+        return sorted(ready)
+
+    def wait(self, timeout):
+        """等待目录变化或超时"""
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # 只需要唤醒，事件内容不重要
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        """停止监视"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def ingest_marker(cache, path):
+    """预处理完成标记的路径"""
+    return os.path.join(cache.root, source_key(path), "ingest.json")
+
+
+def is_ingested(cache, path):
+    """图像的当前版本是否已经预处理过"""
+    return os.path.exists(ingest_marker(cache, path))
+
+
+def build_overviews(path, levels=(2, 4, 8, 16, 32)):
+    """
+    用GDAL为大图像生成外部金字塔(.ovr)，之后的降采样读取只需要读金字塔
+
+    返回:
+        生成的金字塔级数，GDAL不可用或图像较小时为0
+    """
+    gdal = get_gdal()
+    if gdal is None:
+        return 0
+    dataset = gdal.Open(path, gdal.GA_ReadOnly)
+    if dataset is None:
+        return 0
+    size = max(dataset.RasterXSize, dataset.RasterYSize)
+    levels = [level for level in levels if size // level >= 256]
+    if size < OVERVIEW_MIN_SIZE or not levels or dataset.GetRasterBand(1).GetOverviewCount() > 0:
+        return 0
+    dataset.BuildOverviews('AVERAGE', levels)
+    dataset = None
+    return len(levels)
+
+
+def ingest_scene(path, cache_root, thumbnail_dir):
+    """
+    预处理一幅新到达的图像：金字塔、波段统计、显示分块和缩略图
+
+    显示分块与界面导入时的解码结果相同，打开图像时直接读取，不再重新解码和拉伸。
+
+    参数:
+        path: 图像路径
+        cache_root: 分块缓存目录(与界面共用)
+        thumbnail_dir: 缩略图目录
+
+    返回:
+        预处理结果字典
+    """
+    start = time.perf_counter()
+    cache = DiskTileCache(cache_root)
+    overviews = build_overviews(path)
+
+    stats = stats_file(path)
+    # 有GDAL时统计量同时写入 .aux.xml，其他程序读取时不需要重新统计
+    gdal = get_gdal()
+    if gdal is not None:
+        dataset = gdal.Open(path, gdal.GA_ReadOnly)
+        for band in stats['bands']:
+            if band['valid']:
+                dataset.GetRasterBand(band['band']).SetStatistics(band['min'], band['max'], band['mean'], band['std'])
+        dataset = None
+
+    rgb = render_display_array(path)
+    write_cached_display(cache, path, rgb)
+
+    from PIL import Image
+    thumbnail = Image.fromarray(rgb)
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    thumbnail_path = os.path.join(thumbnail_dir, f"{source_key(path)}.png")
+    save_png(np.asarray(thumbnail), thumbnail_path)
+
+    result = {
+        'image': os.path.abspath(path),
+        'overviews': overviews,
+        'stats': stats,
+        'display': display_namespace(path),
+        'display_size': list(rgb.shape[:2]),
+        'thumbnail': thumbnail_path,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    # 最后写入完成标记，中途失败的图像下次会重新处理
+    marker = ingest_marker(cache, path)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+def _ignore_interrupt():
+    """工作进程忽略 Ctrl+C，由主进程统一停止"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_ingest(directory, cache_root, thumbnail_dir, workers=2, settle=5.0, interval=2.0, once=False,
+               extensions=INGEST_EXTENSIONS, log=print):
+    """
+    持续监视目录并在有限大小的进程池中预处理新图像
+
+    参数:
+        directory: 监视的目录
+        cache_root: 分块缓存目录
+        thumbnail_dir: 缩略图目录
+        workers: 工作进程数
+        settle: 文件保持不变多少秒后开始处理
+        interval: 扫描间隔(秒)
+        once: 为True时处理完目录中已有的文件后退出
+        extensions: 关注的扩展名
+        log: 日志输出函数
+
+    返回:
+        (成功数, 失败数)
+    """
+    cache = DiskTileCache(cache_root)
+    watcher = DirectoryWatcher(directory, extensions, 0.0 if once else settle)
+    queue = deque()
+    pending = {}  # {future: 路径}
+    succeeded = failed = 0
+    log(f"开始监视 {directory} ({watcher.mode})，工作进程数 {workers}")
+
+    def collect(done):
+        nonlocal succeeded, failed
+        for future in done:
+            path = pending.pop(future)
+            try:
+                result = future.result()
+                succeeded += 1
+                log(f"完成 {os.path.basename(path)}: 显示大小 {result['display_size'][1]}x{result['display_size'][0]}，"
+                    f"耗时 {result['seconds']} 秒")
+            except Exception as e:
+                failed += 1
+                log(f"失败 {os.path.basename(path)}: {type(e).__name__}: {str(e)}")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupt) as pool:
+            first_scan = True
+            while True:
+                # 第一次扫描只记录文件状态，第二次扫描才能判断是否稳定
+                for path in watcher.poll():
+                    if is_ingested(cache, path):
+                        continue
+                    queue.append(path)
+                    log(f"发现新图像 {os.path.basename(path)}")
+                # 限制同时提交的任务数量，其余的在队列中等待
+                while queue and len(pending) < workers:
+                    path = queue.popleft()
+                    pending[pool.submit(ingest_scene, path, cache_root, thumbnail_dir)] = path
+                if pending:
+                    done, _ = wait(pending, timeout=None if once else interval, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if once and not first_scan and not queue and not pending:
+                    break
+                if not once and not pending:
+                    watcher.wait(interval)
+                first_scan = False
+    except KeyboardInterrupt:
+        log("已停止监视")
+    finally:
+        watcher.close()
+    return succeeded, failed
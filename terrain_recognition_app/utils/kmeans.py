@@ -0,0 +1,233 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.raster_io import RasterSource, RasterWriter, PreviewBuilder, iter_tiles
+
+# 抽样时每次读取的窗口大小
+SAMPLE_WINDOW = 64
+
+# 每批抽样最多读取的窗口数为需要窗口数的倍数，无数据值占多数时不会一直读下去
+SAMPLE_ATTEMPT_FACTOR = 20
+
+
+def sample_pixels(source, bands, count, rng, window=SAMPLE_WINDOW):
+    """
+    从随机窗口中抽样像素，每次只读取一个小窗口
+
+    参数:
+        source: RasterSource
+        bands: 波段编号列表
+        count: 抽样像素数量
+        rng: numpy 随机数生成器
+        window: 窗口大小
+
+    返回:
+        (N, len(bands)) float32 数组，N 一般等于 count；无数据值占多数、尝试次数用完时为已抽到的像素数
+
+    异常:
+        ValueError: 读取的窗口中全部是无数据值
+    """
+    window_w = min(window, source.width)
+    window_h = min(window, source.height)
+    per_window = max(1, min(window_w * window_h // 4, count))
+    max_attempts = SAMPLE_ATTEMPT_FACTOR * -(-count // per_window)
+    samples = []
+    collected = 0
+    attempts = 0
+    while collected < count and attempts < max_attempts:
+        attempts += 1
+        x = int(rng.integers(0, source.width - window_w + 1))
+        y = int(rng.integers(0, source.height - window_h + 1))
+        block = source.read_window(x, y, window_w, window_h, bands).reshape(-1, len(bands))
+        if source.nodata is not None:
+            block = block[block[:, 0] != source.nodata]
+            if len(block) == 0:
+                continue
+        take = min(per_window, count - collected, len(block))
+        samples.append(block[rng.choice(len(block), take, replace=False)].astype(np.float32))
+        collected += take
+    if not samples:
+        raise ValueError(f"抽样的 {attempts} 个窗口中全部是无数据值({source.nodata})，无法聚类")
+    return np.concatenate(samples)
+
+
+def assign_clusters(features, centroids):
+    """
+    向量化的最近聚类中心分配
+
+    参数:
+        features: (N, F) float32 数组
+        centroids: (K, F) float32 数组
+
+    返回:
+        (N,) 聚类编号数组
+    """
+    # |x - c|^2 = |x|^2 - 2 x·c + |c|^2，|x|^2 对所有中心相同，可以省略
+    distances = (centroids * centroids).sum(axis=1)[None, :] - 2.0 * (features @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+class MiniBatchKMeans:
+    """小批量 k-means (Sculley 2010)，每次只处理一小批样本"""
+
+    def __init__(self, clusters=6, batch_size=4096, iterations=100, seed=0):
+        """初始化
+
+        参数:
+            clusters: 聚类数
+            batch_size: 每批样本数
+            iterations: 迭代次数
+            seed: 随机种子
+        """
+        self.clusters = clusters
+        self.batch_size = batch_size
+        self.iterations = iterations
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.mean = None
+        self.scale = None
+
+    def _init_centroids(self, batch):
+        """k-means++ 初始化"""
+        centroids = [batch[self.rng.integers(len(batch))]]
+        for _ in range(1, self.clusters):
+            current = np.array(centroids)
+            distances = np.min(((batch[:, None, :] - current[None, :, :]) ** 2).sum(axis=2), axis=1)
+            total = distances.sum()
+            if total <= 0:
+                centroids.append(batch[self.rng.integers(len(batch))])
+            else:
+                centroids.append(batch[self.rng.choice(len(batch), p=distances / total)])
+        return np.array(centroids, dtype=np.float32)
+
+    def normalize(self, features):
+        """按训练样本的均值和标准差标准化特征"""
+        return (features.astype(np.float32) - self.mean) / self.scale
+
+    def fit(self, next_batch, progress=None):
+        """训练聚类中心
+
+        参数:
+            next_batch: 无参函数，每次调用返回一批 (batch_size, F) 样本
+            progress: 进度回调 progress(已完成迭代数, 总迭代数)
+
+        返回:
+            self
+        """
+        first = next_batch().astype(np.float32)
+        self.mean = first.mean(axis=0)
+        self.scale = np.maximum(first.std(axis=0), 1e-6)
+        first = self.normalize(first)
+        self.centroids = self._init_centroids(first[:min(len(first), 2048)])
+        counts = np.zeros(self.clusters, dtype=np.float64)
+
+        batch = first
+        for iteration in range(self.iterations):
+            if iteration > 0:
+                batch = self.normalize(next_batch())
+            labels = assign_clusters(batch, self.centroids)
+            # 每个中心的学习率为 1/累计样本数，批内一次性按组更新
+            batch_counts = np.bincount(labels, minlength=self.clusters).astype(np.float64)
+            sums = np.zeros_like(self.centroids, dtype=np.float64)
+            np.add.at(sums, labels, batch)
+            updated = batch_counts > 0
+            counts[updated] += batch_counts[updated]
+            rate = (batch_counts[updated] / counts[updated])[:, None]
+            batch_means = sums[updated] / batch_counts[updated][:, None]
+            self.centroids[updated] = ((1 - rate) * self.centroids[updated] + rate * batch_means).astype(np.float32)
+            if progress:
+                progress(iteration + 1, self.iterations)
+        return self
+
+    def predict(self, features):
+        """预测聚类编号
+
+        参数:
+            features: (..., F) 特征数组
+
+        返回:
+            (...) uint8 聚类编号数组
+        """
+        shape = features.shape[:-1]
+        flat = self.normalize(features.reshape(-1, features.shape[-1]))
+        return assign_clusters(flat, self.centroids).astype(np.uint8).reshape(shape)
+
+
+# 工作进程中的数据源和聚类模型
+_worker_source = None
+_worker_model = None
+_worker_bands = None
+
+
+def _init_worker(image_path, model, bands):
+    """工作进程初始化"""
+    global _worker_source, _worker_model, _worker_bands
+    _worker_source = RasterSource(image_path)
+    _worker_model = model
+    _worker_bands = bands
+
+
+def _cluster_tile(tile):
+    """在工作进程中对一个分块分配聚类"""
+    block = _worker_source.read_window(tile.x, tile.y, tile.width, tile.height, _worker_bands)
+    labels = _worker_model.predict(block)
+    if _worker_source.nodata is not None:
+        labels[block[:, :, 0] == _worker_source.nodata] = 255
+    return tile, labels
+
+
+def cluster_image(image_path, output_path, clusters=6, batch_size=4096, iterations=100,
+                  tile_size=512, workers=None, seed=0, progress=None):
+    """
+    对图像做无监督的小批量 k-means 预分割
+
+    参数:
+        image_path: 图像路径
+        output_path: 聚类栅格保存路径
+        clusters: 聚类数
+        batch_size: 每批样本数
+        iterations: 迭代次数
+        tile_size: 分块大小
+        workers: 工作进程数，默认为CPU核数
+        seed: 随机种子
+        progress: 进度回调 progress(已完成步骤, 总步骤)
+
+    返回:
+        {'output': 输出路径, 'preview': 预览数组, 'centroids': 聚类中心(原始波段值)}
+    """
+    source = RasterSource(image_path)
+    bands = list(range(1, min(source.band_count, 4) + 1))
+    # RGBA图像不使用透明通道
+    if source.band_count == 4 and source.geotransform is None:
+        bands = [1, 2, 3]
+    width, height = source.width, source.height
+    rng = np.random.default_rng(seed)
+    tiles = list(iter_tiles(width, height, tile_size))
+    total_steps = iterations + len(tiles)
+
+    try:
+        model = MiniBatchKMeans(clusters, batch_size, iterations, seed)
+        model.fit(lambda: sample_pixels(source, bands, batch_size, rng),
+                  progress=lambda done, _: progress(done, total_steps) if progress else None)
+    finally:
+        source.close()
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    writer = RasterWriter(output_path, width, height, reference_path=image_path, fill=255)
+    preview = PreviewBuilder(width, height, fill=255)
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(image_path, model, bands)) as pool:
+            for done, (tile, labels) in enumerate(pool.map(_cluster_tile, tiles, chunksize=4), start=1):
+                writer.write(tile.x, tile.y, labels)
+                preview.add(tile.x, tile.y, labels)
+                if progress:
+                    progress(iterations + done, total_steps)
+    finally:
+        writer.close()
+
+    centroids = model.centroids * model.scale + model.mean
+    return {'output': output_path, 'preview': preview.array, 'centroids': centroids}
@@ -0,0 +1,221 @@
+import os
+import json
+
+from utils.annotation_io import list_annotation_files, read_annotation
+from utils.geometry import pack_polygons, polygon_areas
+
+# 索引缓存文件名(以点开头，不会被当作图像标注文件)
+INDEX_FILE = ".label_index.json"
+INDEX_VERSION = 1
+
+
+class LabelIndex:
+    """标签倒排索引：标签 → 图像、多边形数量、总面积和每幅图像的覆盖率
+
+    索引以每个标注文件为单位增量维护，文件未变化(mtime和大小相同)时不会重新解析。
+    """
+
+    def __init__(self, annotations_dir, images_dir=None):
+        """初始化标签索引
+
+        参数:
+            annotations_dir: 标注目录
+            images_dir: 图像目录，标注文件中没有记录图像尺寸时用于读取图像头
+        """
+        self.annotations_dir = annotations_dir
+        self.images_dir = images_dir
+        self.index_path = os.path.join(annotations_dir, INDEX_FILE)
+        self.files = {}  # {标注文件名: 文件条目}
+        self.labels = {}  # {标签: {'images': {图像: 覆盖率}, 'polygons': 数量, 'area': 面积}}
+
+    def refresh(self):
+        """根据磁盘上的标注文件增量更新索引
+
+        返回:
+            重新解析的文件数量
+        """
+        if not self.files:
+            self._load_cache()
+
+        changed = 0
+        current = set(list_annotation_files(self.annotations_dir))
+        for name in list(self.files):
+            if name not in current:
+                self.remove_file(name, persist=False)
+                changed += 1
+
+        for name in current:
+            anno_path = os.path.join(self.annotations_dir, name)
+            try:
+                stat = os.stat(anno_path)
+            except OSError:
+                continue
+            entry = self.files.get(name)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            try:
+                data = read_annotation(anno_path)
+            except Exception as e:
+                print(f"索引标注文件出错 {name}: {str(e)}")
+                continue
+            self._set_entry(name, self._build_entry(data, stat))
+            changed += 1
+
+        if changed:
+            self._save_cache()
+        return changed
+
+    def update_file(self, anno_path, data=None):
+        """更新单个标注文件的索引(保存标注后调用)
+
+        参数:
+            anno_path: 标注文件路径
+            data: 已在内存中的标注数据，为None时从文件读取
+        """
+        name = os.path.basename(anno_path)
+        if data is None:
+            data = read_annotation(anno_path)
+        self._set_entry(name, self._build_entry(data, os.stat(anno_path)))
+        self._save_cache()
+
+    def remove_file(self, name, persist=True):
+        """从索引中移除标注文件
+
+        参数:
+            name: 标注文件名
+            persist: 是否立即写回缓存文件
+        """
+        entry = self.files.pop(name, None)
+        if entry:
+            self._apply(entry, -1)
+            if persist:
+                self._save_cache()
+
+    def label_stats(self):
+        """获取每个标签的统计信息
+
+        返回:
+            统计字典列表，按标签名排序
+        """
+        stats = []
+        for label in sorted(self.labels):
+            agg = self.labels[label]
+            coverage = agg['images']
+            known = [c for c in coverage.values() if c is not None]
+            stats.append({
+                'label': label,
+                'images': len(coverage),
+                'polygons': agg['polygons'],
+                'area': agg['area'],
+                'mean_coverage': sum(known) / len(known) if known else None,
+                'coverage': dict(coverage),
+            })
+        return stats
+
+    def images_for_label(self, label):
+        """获取包含指定标签的图像列表"""
+        return sorted(self.labels.get(label, {}).get('images', {}))
+
+    def _build_entry(self, data, stat):
+        """从标注数据构建文件条目"""
+        polygons = data.get('polygons', [])
+        names = [poly.get('label', 'unknown') for poly in polygons]
+        coords, offsets = pack_polygons([poly.get('points', []) for poly in polygons])
+        areas = polygon_areas(coords, offsets)
+
+        labels = {}
+        for name, area in zip(names, areas):
+            count, total = labels.get(name, (0, 0.0))
+            labels[name] = (count + 1, total + float(area))
+
+        image = data.get('image', '')
+        return {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'image': image,
+            'image_area': self._image_area(data, image),
+            'labels': {name: list(value) for name, value in labels.items()},
+        }
+
+    def _image_area(self, data, image):
+        """获取图像面积(像素)，优先使用标注中记录的尺寸"""
+        size = data.get('image_size')
+        if not size and self.images_dir and image:
+            image_path = os.path.join(self.images_dir, image)
+            if os.path.exists(image_path):
+                try:
+                    from PIL import Image
+                    # 只读取文件头，不解码像素
+                    with Image.open(image_path) as img:
+                        size = img.size
+                except Exception:
+                    size = None
+        if size:
+            return float(size[0]) * float(size[1])
+        return None
+
+    def _set_entry(self, name, entry):
+        """替换文件条目并更新聚合结果"""
+        old = self.files.get(name)
+        if old:
+            self._apply(old, -1)
+        self.files[name] = entry
+        self._apply(entry, 1)
+
+    def _apply(self, entry, sign):
+        """将文件条目的贡献加到(或从)聚合结果中"""
+        image = entry['image']
+        image_area = entry['image_area']
+        for label, (count, area) in entry['labels'].items():
+            agg = self.labels.setdefault(label, {'images': {}, 'polygons': 0, 'area': 0.0})
+            agg['polygons'] += sign * count
+            agg['area'] += sign * area
+            if sign > 0:
+                agg['images'][image] = min(1.0, area / image_area) if image_area else None
+            else:
+                agg['images'].pop(image, None)
+            if agg['polygons'] <= 0 and not agg['images']:
+                del self.labels[label]
+
+    def _load_cache(self):
+        """加载索引缓存"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('version') != INDEX_VERSION:
+                return
+            for name, entry in cache.get('files', {}).items():
+                self._set_entry(name, entry)
+        except Exception as e:
+            print(f"加载标签索引出错: {str(e)}")
+            self.files = {}
+            self.labels = {}
+
+    def _save_cache(self):
+        """保存索引缓存"""
+        try:
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'files': self.files}, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except Exception as e:
+            print(f"保存标签索引出错: {str(e)}")
+
+
+def load_label_index(annotations_dir, images_dir=None, progress=None):
+    """
+    创建并刷新标签索引(供后台任务调用)
+
+    参数:
+        annotations_dir: 标注目录
+        images_dir: 图像目录
+        progress: 进度回调，未使用
+
+    返回:
+        LabelIndex 实例
+    """
+    index = LabelIndex(annotations_dir, images_dir)
+    index.refresh()
+    return index
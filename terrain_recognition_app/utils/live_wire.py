@@ -0,0 +1,196 @@
+import heapq
+import math
+
+import numpy as np
+
+from utils.geometry import simplify_polyline
+
+# 代价图分块大小
+COST_TILE_SIZE = 256
+
+# 梯度达到该值时代价减半
+GRADIENT_SCALE = 16.0
+
+
+def gradient_cost(block):
+    """
+    根据灰度梯度计算边缘代价，梯度越大代价越小
+
+    代价只取决于局部梯度(不按分块最大值归一化)，各分块独立计算也不会出现接缝。
+
+    参数:
+        block: (H + 2, W + 2, C) 或 (H + 2, W + 2) 带一个像素重叠边的图像数组
+
+    返回:
+        (H, W) float32 代价，取值 (0, 1]
+    """
+    gray = np.asarray(block, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2)
+    # Sobel 算子
+    gx = (gray[:-2, 2:] + 2 * gray[1:-1, 2:] + gray[2:, 2:]) - (gray[:-2, :-2] + 2 * gray[1:-1, :-2] + gray[2:, :-2])
+    gy = (gray[2:, :-2] + 2 * gray[2:, 1:-1] + gray[2:, 2:]) - (gray[:-2, :-2] + 2 * gray[:-2, 1:-1] + gray[:-2, 2:])
+    magnitude = np.hypot(gx, gy) / 8
+    return (GRADIENT_SCALE / (magnitude + GRADIENT_SCALE)).astype(np.float32)
+
+
+class CostMap:
+    """按分块懒计算并缓存的边缘代价图"""
+
+    def __init__(self, image, tile_size=COST_TILE_SIZE):
+        """初始化
+
+        参数:
+            image: (H, W, C) 图像数组
+            tile_size: 分块大小
+        """
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.tile_size = tile_size
+        self.tiles = {}  # {(分块列, 分块行): 代价数组}
+
+    def tile(self, col, row):
+        """获取一个分块的代价(缓存)"""
+        cost = self.tiles.get((col, row))
+        if cost is None:
+            size = self.tile_size
+            x0, y0 = col * size, row * size
+            x1, y1 = min(self.width, x0 + size), min(self.height, y0 + size)
+            # 读取带一个像素重叠边的区域，图像边界处用边缘值补齐
+            read_x0, read_y0 = max(0, x0 - 1), max(0, y0 - 1)
+            read_x1, read_y1 = min(self.width, x1 + 1), min(self.height, y1 + 1)
+            block = self.image[read_y0:read_y1, read_x0:read_x1]
+            pad = ((1 - (y0 - read_y0), 1 - (read_y1 - y1)), (1 - (x0 - read_x0), 1 - (read_x1 - x1)))
+            if block.ndim == 3:
+                pad += ((0, 0),)
+            cost = gradient_cost(np.pad(block, pad, mode='edge'))
+            self.tiles[(col, row)] = cost
+        return cost
+
+    def window(self, x0, y0, x1, y1):
+        """
+        获取窗口内的代价，只计算与窗口相交的分块
+
+        返回:
+            (y1 - y0, x1 - x0) float32 数组
+        """
+        size = self.tile_size
+        result = np.empty((y1 - y0, x1 - x0), dtype=np.float32)
+        for row in range(y0 // size, (y1 - 1) // size + 1):
+            for col in range(x0 // size, (x1 - 1) // size + 1):
+                cost = self.tile(col, row)
+                tx, ty = col * size, row * size
+                sx0, sy0 = max(x0, tx), max(y0, ty)
+                sx1, sy1 = min(x1, tx + cost.shape[1]), min(y1, ty + cost.shape[0])
+                result[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = cost[sy0 - ty:sy1 - ty, sx0 - tx:sx1 - tx]
+        return result
+
+
+class LiveWire:
+    """从种子点出发的最小代价路径(智能剪刀)
+
+    在以种子为中心的有限窗口内运行Dijkstra(8邻域)。搜索是增量的：每次查询只扩展到目标点被确定为止，
+    之后的查询继续使用已有结果，鼠标移动时只需要回溯路径。
+    """
+
+    def __init__(self, cost_map, seed, radius=256):
+        """初始化
+
+        参数:
+            cost_map: CostMap
+            seed: 种子点 (x, y)
+            radius: 搜索窗口半径
+        """
+        x, y = int(seed[0]), int(seed[1])
+        self.x0, self.y0 = max(0, x - radius), max(0, y - radius)
+        self.x1, self.y1 = min(cost_map.width, x + radius + 1), min(cost_map.height, y + radius + 1)
+        cost = cost_map.window(self.x0, self.y0, self.x1, self.y1)
+
+        # 四周补一圈不可通过的像素，扩展邻居时不需要判断越界
+        self.stride = cost.shape[1] + 2
+        padded = np.full((cost.shape[0] + 2, self.stride), np.inf, dtype=np.float64)
+        padded[1:-1, 1:-1] = cost
+        self.cost = padded.ravel().tolist()
+        count = len(self.cost)
+        self.dist = [math.inf] * count
+        self.prev = [-1] * count
+        self.done = bytearray(count)
+
+        start = self.index(x, y)
+        self.seed = (x, y)
+        self.dist[start] = 0.0
+        self.heap = [(0.0, start)]
+        s = self.stride
+        diagonal = math.sqrt(2)
+        self.neighbors = ((-1, 1.0), (1, 1.0), (-s, 1.0), (s, 1.0),
+                          (-s - 1, diagonal), (-s + 1, diagonal), (s - 1, diagonal), (s + 1, diagonal))
+
+    def index(self, x, y):
+        """图像坐标对应的扁平索引"""
+        return (y - self.y0 + 1) * self.stride + (x - self.x0 + 1)
+
+    def contains(self, x, y):
+        """点是否在搜索窗口内"""
+        return self.x0 <= x < self.x1 and self.y0 <= y < self.y1
+
+    def _expand_until(self, target, budget=None):
+        """
+        继续Dijkstra扩展，直到目标点的最短距离确定
+
+        参数:
+            target: 目标点扁平索引
+            budget: 本次最多确定的像素数，None表示不限
+
+        返回:
+            目标点是否已确定
+        """
+        heap, dist, prev, done, cost = self.heap, self.dist, self.prev, self.done, self.cost
+        neighbors = self.neighbors
+        while heap and not done[target]:
+            if budget is not None:
+                if budget <= 0:
+                    break
+                budget -= 1
+            d, node = heapq.heappop(heap)
+            if done[node]:
+                continue
+            done[node] = 1
+            for offset, length in neighbors:
+                neighbor = node + offset
+                if done[neighbor]:
+                    continue
+                candidate = d + cost[neighbor] * length
+                if candidate < dist[neighbor]:
+                    dist[neighbor] = candidate
+                    prev[neighbor] = node
+                    heapq.heappush(heap, (candidate, neighbor))
+        return bool(done[target])
+
+    def path_to(self, x, y, tolerance=0.7, budget=None):
+        """
+        从种子到 (x, y) 的最小代价路径
+
+        参数:
+            x, y: 目标点
+            tolerance: 路径的Douglas-Peucker简化容差，0表示不简化
+            budget: 本次查询最多扩展的像素数，鼠标移动时限制单次耗时，None表示扩展到目标为止
+
+        返回:
+            [(x, y), ...] 从种子到目标的路径(含两端)，目标在窗口外或本次未扩展到目标时返回None
+        """
+        x, y = int(x), int(y)
+        if not self.contains(x, y):
+            return None
+        target = self.index(x, y)
+        if not self._expand_until(target, budget):
+            return None
+        nodes = []
+        node = target
+        while node != -1:
+            nodes.append(node)
+            node = self.prev[node]
+        nodes = np.array(nodes[::-1], dtype=np.int64)
+        rows, cols = np.divmod(nodes, self.stride)
+        points = np.stack([cols - 1 + self.x0, rows - 1 + self.y0], axis=1)
+        points = points[simplify_polyline(points, tolerance)]
+        return [(int(px), int(py)) for px, py in points]
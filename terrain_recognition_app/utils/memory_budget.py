@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+
+# 优先级：数值越小越先淘汰，PRIORITY_PINNED 的条目只计数、不淘汰
+PRIORITY_HISTORY = 10  # 历史记录：转存到磁盘
+PRIORITY_SPILL = 20  # 暂时不显示的图像(原图、查看原图前的当前图)：转存到磁盘
+PRIORITY_CACHE = 30  # 可重新读取或计算的缓存(显示波段、像素数组)
+PRIORITY_DERIVED = 50  # 可重新绘制的合成图
+PRIORITY_PINNED = 100  # 正在显示或编辑的图像
+
+
+def default_budget_bytes():
+    """
+    默认内存预算：环境变量 TERRAIN_MEMORY_MB，未设置时为物理内存的四分之一，最多4GB
+
+    返回:
+        字节数
+    """
+    value = os.environ.get("TERRAIN_MEMORY_MB")
+    if value:
+        return int(float(value) * 1024 * 1024)
+    try:
+        physical = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        # Windows 上没有 sysconf
+        physical = 8 * 1024 ** 3
+    return min(physical // 4, 4 * 1024 ** 3)
+
+
+class _Entry:
+    """一块缓冲区：字节数、各持有者的 {分组: (优先级, 释放函数)}、最近使用时间"""
+
+    __slots__ = ('nbytes', 'holders', 'last_used')
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.holders = {}
+        self.last_used = time.monotonic()
+
+    @property
+    def priority(self):
+        return max(priority for priority, _ in self.holders.values())
+
+    @property
+    def group(self):
+        """优先级最高的持有者，共享的缓冲区只计入该分组"""
+        return max(self.holders.items(), key=lambda item: item[1][0])[0]
+
+    def evictable(self):
+        return self.priority < PRIORITY_PINNED and all(release is not None for _, release in self.holders.values())
+
+
+class MemoryBudget:
+    """全局内存预算：登记持有的图像缓冲区和缓存条目的字节数，超出预算时按优先级淘汰或转存
+
+    同一块缓冲区(如隐式共享的 QPixmap，键相同)被多个持有者引用时只计一次，
+    只有所有持有者都可以释放时才会被淘汰。可以从任意线程登记，enforce() 由界面线程调用。
+    """
+
+    def __init__(self, limit_bytes):
+        """初始化
+
+        参数:
+            limit_bytes: 预算(字节)
+        """
+        self.limit = limit_bytes
+        self.evictions = 0  # 已淘汰或转存的条目数
+        self.evicted_bytes = 0
+        self._entries = {}  # {键: _Entry}
+        self._lock = threading.Lock()
+
+    def register(self, key, nbytes, group, priority=PRIORITY_CACHE, release=None):
+        """
+        登记一个缓冲区
+
+        参数:
+            key: 缓冲区标识，同一块内存使用相同的键
+            nbytes: 字节数
+            group: 持有者分组(状态栏中按分组显示)
+            priority: 优先级
+            release: 释放函数，在界面线程中调用；为None表示不能淘汰
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(int(nbytes))
+            entry.holders[group] = (priority, release)
+            entry.last_used = time.monotonic()
+
+    def unregister(self, key, group=None):
+        """移除一个持有者，group为None时移除整个缓冲区"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if group is not None:
+                entry.holders.pop(group, None)
+            if group is None or not entry.holders:
+                del self._entries[key]
+
+    def touch(self, key):
+        """标记缓冲区刚被使用"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+
+    def replace_group(self, group, items):
+        """
+        用持有者当前引用的全部缓冲区替换该分组的登记
+
+        参数:
+            group: 分组
+            items: [(键, 字节数, 优先级, 释放函数), ...]
+        """
+        current = {item[0] for item in items}
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if group in entry.holders and key not in current:
+                    del entry.holders[group]
+                    if not entry.holders:
+                        del self._entries[key]
+        for key, nbytes, priority, release in items:
+            self.register(key, nbytes, group, priority, release)
+
+    def usage(self):
+        """
+        当前用量
+
+        返回:
+            (总字节数, {分组: 字节数})
+        """
+        groups = {}
+        with self._lock:
+            for entry in self._entries.values():
+                group = entry.group
+                groups[group] = groups.get(group, 0) + entry.nbytes
+        return sum(groups.values()), groups
+
+    def enforce(self):
+        """
+        超出预算时按优先级从低到高、同优先级先淘汰最久未使用的缓冲区
+
+        返回:
+            释放的字节数
+        """
+        with self._lock:
+            total = sum(entry.nbytes for entry in self._entries.values())
+            if total <= self.limit:
+                return 0
+            candidates = sorted((entry.priority, entry.last_used, key) for key, entry in self._entries.items()
+                                if entry.evictable())
+            victims = []
+            for _, _, key in candidates:
+                if total <= self.limit:
+                    break
+                entry = self._entries.pop(key)
+                total -= entry.nbytes
+                victims.append(entry)
+        freed = 0
+        for entry in victims:
+            for _, release in entry.holders.values():
+                try:
+                    release()
+                except Exception as e:
+                    print(f"释放缓冲区出错: {str(e)}")
+            freed += entry.nbytes
+        self.evictions += len(victims)
+        self.evicted_bytes += freed
+        return freed
+
+
+def format_bytes(nbytes):
+    """格式化字节数，如 1.25 GB、320 MB"""
+    if nbytes >= 1024 ** 3:
+        return f"{nbytes / 1024 ** 3:.2f} GB"
+    return f"{nbytes / 1024 ** 2:.0f} MB"
+
+
+# 全局内存预算
+memory_budget = MemoryBudget(default_budget_bytes())
@@ -0,0 +1,454 @@
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# GDAL 只在第一次需要时导入，导入失败的结果也会缓存
+_gdal_module = None
+_gdal_checked = False
+_gdal_lock = threading.Lock()  # 启动时会在后台线程中预先导入
+
+
+def get_gdal():
+    """
+    获取GDAL模块(延迟导入)
+
+    返回:
+        osgeo.gdal 模块，不可用时返回None
+    """
+    global _gdal_module, _gdal_checked
+    if not _gdal_checked:
+        with _gdal_lock:
+            if not _gdal_checked:
+                try:
+                    from osgeo import gdal
+                    gdal.AllRegister()
+                    _gdal_module = gdal
+                except ImportError:
+                    _gdal_module = None
+                _gdal_checked = True
+    return _gdal_module
+
+
+def to_uint8(array, min_val, max_val):
+    """
+    将数组按给定范围线性拉伸到0-255
+
+    参数:
+        array: 任意数值类型的数组
+        min_val: 映射到0的值
+        max_val: 映射到255的值
+
+    返回:
+        uint8 数组
+    """
+    if array.dtype == np.uint8 and min_val == 0 and max_val == 255:
+        return array
+    if max_val <= min_val:
+        return np.full(array.shape, 128, dtype=np.uint8)
+    scaled = (array.astype(np.float32) - np.float32(min_val)) * np.float32(255.0 / (max_val - min_val))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+# 分块：(x, y, width, height) 为输出区域，read_* 为包含重叠边(halo)的读取区域
+Tile = namedtuple('Tile', 'x y width height read_x read_y read_width read_height')
+
+
+def iter_tiles(width, height, tile_size, halo=0):
+    """
+    将图像划分为分块，每块可带有重叠边
+
+    参数:
+        width, height: 图像大小
+        tile_size: 分块大小
+        halo: 四周重叠的像素数(在图像边界处截断)
+
+    返回:
+        Tile 生成器
+    """
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            w = min(tile_size, width - x)
+            h = min(tile_size, height - y)
+            read_x = max(0, x - halo)
+            read_y = max(0, y - halo)
+            read_w = min(width, x + w + halo) - read_x
+            read_h = min(height, y + h + halo) - read_y
+            yield Tile(x, y, w, h, read_x, read_y, read_w, read_h)
+
+
+def tile_inner(tile):
+    """
+    获取分块输出区域在读取区域中的切片
+
+    参数:
+        tile: Tile
+
+    返回:
+        (行切片, 列切片)
+    """
+    top = tile.y - tile.read_y
+    left = tile.x - tile.read_x
+    return slice(top, top + tile.height), slice(left, left + tile.width)
+
+
+class RasterSource:
+    """栅格数据源，支持按窗口读取波段
+
+    优先使用GDAL(只读取需要的窗口)，GDAL不可用时使用PIL打开并在第一次读取时解码整幅图像。
+    波段编号与GDAL一致，从1开始。
+    """
+
+    def __init__(self, path):
+        """打开栅格文件
+
+        参数:
+            path: 图像文件路径
+        """
+        self.path = path
+        self.geotransform = None
+        self.nodata = None
+        self._dataset = None
+        self._image = None
+        self._array = None
+
+        gdal = get_gdal()
+        if gdal is not None:
+            self._dataset = gdal.Open(path, gdal.GA_ReadOnly)
+
+        if self._dataset is not None:
+            self.width = self._dataset.RasterXSize
+            self.height = self._dataset.RasterYSize
+            self.band_count = self._dataset.RasterCount
+            self.geotransform = self._dataset.GetGeoTransform()
+            self.nodata = self._dataset.GetRasterBand(1).GetNoDataValue()
+            self.dtype = self._dataset.GetRasterBand(1).ReadAsArray(0, 0, 1, 1).dtype
+        else:
+            from PIL import Image
+            image = Image.open(path)
+            # 调色板和二值图像转换为可直接读取数值的模式
+            if image.mode == 'P':
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            elif image.mode == '1':
+                image = image.convert('L')
+            self._image = image
+            self.width, self.height = image.size
+            self.band_count = len(image.getbands())
+            self.dtype = None
+
+    @property
+    def pixel_size(self):
+        """像素尺寸 (x方向, y方向)，没有地理参考时为 (1, 1)"""
+        if self.geotransform:
+            return abs(self.geotransform[1]), abs(self.geotransform[5])
+        return 1.0, 1.0
+
+    def _pil_array(self):
+        """PIL 方式下的整幅图像数组 (H, W, C)"""
+        if self._array is None:
+            array = np.asarray(self._image)
+            if array.ndim == 2:
+                array = array[:, :, None]
+            self._array = array
+            self.dtype = array.dtype
+        return self._array
+
+    def read_band(self, band, x=0, y=0, width=None, height=None):
+        """
+        读取单个波段的窗口
+
+        参数:
+            band: 波段编号(从1开始)
+            x, y: 窗口左上角
+            width, height: 窗口大小，默认到图像边界
+
+        返回:
+            (height, width) 数组
+        """
+        if width is None:
+            width = self.width - x
+        if height is None:
+            height = self.height - y
+        if self._dataset is not None:
+            return self._dataset.GetRasterBand(band).ReadAsArray(int(x), int(y), int(width), int(height))
+        return self._pil_array()[y:y + height, x:x + width, band - 1]
+
+    def read_window(self, x, y, width, height, bands=None):
+        """
+        读取多个波段的窗口
+
+        参数:
+            x, y: 窗口左上角
+            width, height: 窗口大小
+            bands: 波段编号列表，默认全部波段
+
+        返回:
+            (height, width, len(bands)) 数组
+        """
+        if bands is None:
+            bands = range(1, self.band_count + 1)
+        if self._dataset is None:
+            indices = [b - 1 for b in bands]
+            return self._pil_array()[y:y + height, x:x + width][:, :, indices]
+        return np.stack([self.read_band(b, x, y, width, height) for b in bands], axis=2)
+
+    def band_range(self, band):
+        """
+        获取波段的取值范围
+
+        参数:
+            band: 波段编号(从1开始)
+
+        返回:
+            (min, max)
+        """
+        if self._dataset is not None:
+            # 允许使用概略统计(基于金字塔或抽样)，避免读取整幅图像
+            min_val, max_val = self._dataset.GetRasterBand(band).ComputeRasterMinMax(True)
+            return float(min_val), float(max_val)
+        data = self._pil_array()[:, :, band - 1]
+        return float(data.min()), float(data.max())
+
+    def color_table(self):
+        """
+        获取第1波段的调色板
+
+        返回:
+            (N, 3) uint8 数组，没有调色板时返回None(PIL方式下调色板图像在打开时已转换为RGB)
+        """
+        if self._dataset is None:
+            return None
+        table = self._dataset.GetRasterBand(1).GetColorTable()
+        if table is None:
+            return None
+        return np.array([table.GetColorEntry(i)[:3] for i in range(table.GetCount())], dtype=np.uint8)
+
+    def interpreted_rgb_bands(self):
+        """
+        按颜色解释标记为红、绿、蓝的波段
+
+        返回:
+            (red, green, blue) 波段编号，没有完整的红绿蓝颜色解释时返回None；
+            PIL方式下RGB/RGBA图像为 (1, 2, 3)
+        """
+        if self._dataset is not None:
+            gdal = get_gdal()
+            wanted = [gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]
+            interpretations = [self._dataset.GetRasterBand(i).GetColorInterpretation()
+                               for i in range(1, self.band_count + 1)]
+            if all(value in interpretations for value in wanted):
+                return tuple(interpretations.index(value) + 1 for value in wanted)
+            return None
+        if self._image is not None and self._image.mode in ('RGB', 'RGBA'):
+            return 1, 2, 3
+        return None
+
+    def rgb_bands(self):
+        """
+        根据波段的颜色解释选择用于显示的红、绿、蓝波段
+
+        返回:
+            (red, green, blue) 波段编号，没有颜色解释时为 (1, 2, 3)
+        """
+        return self.interpreted_rgb_bands() or (1, 2, 3)
+
+    def close(self):
+        """关闭数据源"""
+        self._dataset = None
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+        self._array = None
+
+
+def find_image(image_name, search_dirs, recorded_path=None):
+    """
+    在若干目录中查找图像文件
+
+    参数:
+        image_name: 图像文件名
+        search_dirs: 目录列表
+        recorded_path: 标注中记录的图像完整路径，存在时优先使用
+
+    返回:
+        图像完整路径，找不到时返回None
+    """
+    if recorded_path and os.path.exists(recorded_path):
+        return recorded_path
+    for directory in search_dirs:
+        path = os.path.join(directory, image_name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# 不使用GDAL时写入其他格式(需要PIL整幅编码)的最大字节数
+MAX_PIL_OUTPUT_BYTES = 512 * 1024 * 1024
+
+# 不使用GDAL时写入TIFF的图像数据偏移：8字节文件头，补齐到16字节对齐
+_TIFF_DATA_OFFSET = 16
+_TIFF_ROWS_PER_STRIP = 64
+_TIFF_SAMPLE_FORMATS = {'u': 1, 'i': 2, 'f': 3}
+
+
+def _tiff_ifd(width, height, dtype, data_offset, ifd_offset, rows_per_strip=_TIFF_ROWS_PER_STRIP):
+    """
+    生成未压缩单波段TIFF的图像文件目录(IFD)，图像数据按条带连续存放在 data_offset 处
+
+    返回:
+        bytes，写在 ifd_offset 处
+    """
+    dtype = np.dtype(dtype)
+    row_bytes = width * dtype.itemsize
+    strips = -(-height // rows_per_strip)
+    offsets = np.array([data_offset + i * rows_per_strip * row_bytes for i in range(strips)], dtype='<u4')
+    counts = np.array([min(rows_per_strip, height - i * rows_per_strip) * row_bytes for i in range(strips)],
+                      dtype='<u4')
+    entries = [
+        (256, 4, 1, width),  # ImageWidth
+        (257, 4, 1, height),  # ImageLength
+        (258, 3, 1, dtype.itemsize * 8),  # BitsPerSample
+        (259, 3, 1, 1),  # Compression: 无
+        (262, 3, 1, 1),  # PhotometricInterpretation: BlackIsZero
+        (273, 4, strips, offsets),  # StripOffsets
+        (277, 3, 1, 1),  # SamplesPerPixel
+        (278, 4, 1, rows_per_strip),  # RowsPerStrip
+        (279, 4, strips, counts),  # StripByteCounts
+        (284, 3, 1, 1),  # PlanarConfiguration
+        (339, 3, 1, _TIFF_SAMPLE_FORMATS[dtype.kind]),  # SampleFormat
+    ]
+    # 条带数多于1时数组值放在目录之后
+    extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+    directory, extra = [np.array([len(entries)], dtype='<u2').tobytes()], []
+    for tag, field_type, count, value in entries:
+        head = np.array([tag, field_type], dtype='<u2').tobytes() + np.array([count], dtype='<u4').tobytes()
+        if isinstance(value, np.ndarray) and count > 1:
+            directory.append(head + np.array([extra_offset], dtype='<u4').tobytes())
+            extra.append(value.tobytes())
+            extra_offset += value.nbytes
+            continue
+        if isinstance(value, np.ndarray):
+            value = value[0]
+        if field_type == 3:
+            directory.append(head + np.array([int(value), 0], dtype='<u2').tobytes())
+        else:
+            directory.append(head + np.array([int(value)], dtype='<u4').tobytes())
+    directory.append(np.array([0], dtype='<u4').tobytes())  # 没有下一个目录
+    return b''.join(directory + extra)
+
+
+class RasterWriter:
+    """逐块写入单波段栅格，内存占用与图像大小无关
+
+    使用GDAL时直接写入分块GeoTIFF；否则TIFF输出直接内存映射文件中的图像数据区逐块写入，
+    关闭时在末尾写入文件目录(不带地理参考，最大4GB)；其他格式先写入磁盘上的内存映射数组，
+    关闭时用PIL整幅编码保存，限制为 MAX_PIL_OUTPUT_BYTES。
+    """
+
+    def __init__(self, path, width, height, dtype=np.uint8, reference_path=None, fill=0):
+        """创建输出栅格
+
+        参数:
+            path: 输出路径
+            width, height: 栅格大小
+            dtype: 数据类型
+            reference_path: 提供地理参考的源图像路径
+            fill: 初始填充值
+        """
+        self.path = path
+        self.width = width
+        self.height = height
+        self._dataset = None
+        self._memmap = None
+        self._memmap_path = None
+        self._tiff = False
+
+        gdal = get_gdal()
+        if gdal is not None and path.lower().endswith(('.tif', '.tiff')):
+            from osgeo import gdal_array
+            driver = gdal.GetDriverByName('GTiff')
+            type_code = gdal_array.NumericTypeCodeToGDALTypeCode(np.dtype(dtype))
+            self._dataset = driver.Create(path, width, height, 1, type_code,
+                                          options=['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER'])
+            if reference_path:
+                reference = gdal.Open(reference_path, gdal.GA_ReadOnly)
+                if reference is not None:
+                    self._dataset.SetGeoTransform(reference.GetGeoTransform())
+                    self._dataset.SetProjection(reference.GetProjection())
+                    reference = None
+            self._dataset.GetRasterBand(1).Fill(fill)
+        elif path.lower().endswith(('.tif', '.tiff')):
+            nbytes = width * height * np.dtype(dtype).itemsize
+            if _TIFF_DATA_OFFSET + nbytes + 64 * 1024 * 1024 >= 2 ** 32:
+                raise ValueError("输出超过4GB，没有GDAL时无法写入，请安装GDAL")
+            self._tiff = True
+            with open(path, 'wb') as f:
+                f.write(b'II*\x00' + np.array([0], dtype='<u4').tobytes())  # 目录偏移在关闭时写入
+                f.truncate(_TIFF_DATA_OFFSET + nbytes)
+            self._memmap = np.memmap(path, dtype=np.dtype(dtype).newbyteorder('<'), mode='r+',
+                                     offset=_TIFF_DATA_OFFSET, shape=(height, width))
+            self._memmap[:] = fill
+        else:
+            if width * height * np.dtype(dtype).itemsize > MAX_PIL_OUTPUT_BYTES:
+                raise ValueError(f"没有GDAL时 {os.path.splitext(path)[1]} 格式的输出最大 "
+                                 f"{MAX_PIL_OUTPUT_BYTES // 1024 ** 2} MB，请输出为TIFF或安装GDAL")
+            self._memmap_path = path + ".tmp.npy"
+            self._memmap = np.lib.format.open_memmap(self._memmap_path, mode='w+', dtype=dtype,
+                                                     shape=(height, width))
+            self._memmap[:] = fill
+
+    def write(self, x, y, array):
+        """写入一个分块"""
+        if self._dataset is not None:
+            self._dataset.GetRasterBand(1).WriteArray(array, int(x), int(y))
+        else:
+            self._memmap[y:y + array.shape[0], x:x + array.shape[1]] = array
+
+    def close(self):
+        """完成写入"""
+        if self._dataset is not None:
+            self._dataset.FlushCache()
+            self._dataset = None
+        elif self._tiff:
+            dtype = self._memmap.dtype
+            self._memmap.flush()
+            self._memmap = None
+            ifd_offset = _TIFF_DATA_OFFSET + self.width * self.height * dtype.itemsize
+            ifd_offset += ifd_offset % 2  # 目录需要按字对齐
+            with open(self.path, 'r+b') as f:
+                f.seek(ifd_offset)
+                f.write(_tiff_ifd(self.width, self.height, dtype, _TIFF_DATA_OFFSET, ifd_offset))
+                f.seek(4)
+                f.write(np.array([ifd_offset], dtype='<u4').tobytes())
+            self._tiff = False
+        elif self._memmap is not None:
+            from PIL import Image
+            Image.fromarray(np.asarray(self._memmap)).save(self.path)
+            self._memmap = None
+            os.remove(self._memmap_path)
+
+
+class PreviewBuilder:
+    """从逐块结果中按固定步长抽样，组装出有限大小的预览数组"""
+
+    def __init__(self, width, height, max_size=2048, dtype=np.uint8, fill=0):
+        """初始化预览
+
+        参数:
+            width, height: 原始栅格大小
+            max_size: 预览的最大边长
+            dtype: 数据类型
+            fill: 初始填充值
+        """
+        self.step = max(1, -(-max(width, height) // max_size))
+        self.array = np.full((-(-height // self.step), -(-width // self.step)), fill, dtype=dtype)
+
+    def add(self, x, y, block):
+        """加入一个分块的结果"""
+        first_row = (-y) % self.step
+        first_col = (-x) % self.step
+        sampled = block[first_row::self.step, first_col::self.step]
+        row = (y + first_row) // self.step
+        col = (x + first_col) // self.step
+        self.array[row:row + sampled.shape[0], col:col + sampled.shape[1]] = sampled
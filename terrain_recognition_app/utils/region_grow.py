@@ -0,0 +1,162 @@
+import numpy as np
+
+from utils.contours import contour_segments, chain_paths
+
+
+def grow_region(passable, seeds, known=None):
+    """
+    向量化的队列式区域生长(4连通)
+
+    每一轮把整个前沿的邻居一次性检查并加入下一轮前沿，循环次数只与区域的测地半径有关。
+
+    参数:
+        passable: (H, W) 布尔数组，可以生长到的像素
+        seeds: 种子像素的 (rows, cols) 数组，不可通过的种子会被忽略
+        known: 已知属于区域的像素掩码，只从其边缘的种子向外生长，内部不再逐轮遍历
+
+    返回:
+        (H, W) 布尔掩码
+    """
+    height, width = passable.shape
+    # 四周补一圈不可通过的像素，邻居计算不需要判断越界
+    grid = np.zeros((height + 2, width + 2), dtype=bool)
+    grid[1:-1, 1:-1] = passable
+    stride = width + 2
+    flat = grid.ravel()
+    visited = np.zeros_like(flat)
+    if known is not None:
+        visited.reshape(height + 2, width + 2)[1:-1, 1:-1] = known & passable
+
+    rows, cols = seeds
+    frontier = (np.asarray(rows) + 1) * stride + np.asarray(cols) + 1
+    frontier = frontier[flat[frontier]]
+    visited[frontier] = True
+    offsets = np.array([-1, 1, -stride, stride])
+    while frontier.size:
+        neighbors = (frontier[:, None] + offsets[None, :]).ravel()
+        neighbors = neighbors[flat[neighbors] & ~visited[neighbors]]
+        frontier = np.unique(neighbors)
+        visited[frontier] = True
+    return visited.reshape(height + 2, width + 2)[1:-1, 1:-1]
+
+
+def _block_mean(array, factor):
+    """按 factor x factor 块求均值(舍去不满一块的边缘)"""
+    height, width = array.shape[0] // factor, array.shape[1] // factor
+    blocks = array[:height * factor, :width * factor].reshape(height, factor, width, factor, *array.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+
+def _dilate(mask):
+    """4连通膨胀一个像素"""
+    padded = np.pad(mask, 1)
+    return mask | padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+
+
+def _erode(mask):
+    """4连通腐蚀一个像素(图像边界外视为背景)"""
+    padded = np.pad(mask, 1)
+    return mask & padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+
+
+def _upsample(coarse, factor, shape, fill=False):
+    """把粗网格掩码放大到完整分辨率，不满一个粗单元的边缘用 fill 填充"""
+    full = np.full(shape, fill, dtype=bool)
+    full[:coarse.shape[0] * factor, :coarse.shape[1] * factor] = coarse.repeat(factor, axis=0).repeat(factor, axis=1)
+    return full
+
+
+def magic_wand(image, seed, tolerance, window=1024, coarse_factor=4):
+    """
+    从种子像素出发按颜色容差生长区域
+
+    先在降采样的图像上生长得到大致区域，再只在该区域(外扩一个粗单元)内按完整分辨率细化；
+    粗区域内部的相似像素直接视为区域内，细化只从内部边缘向外生长，循环只覆盖边界附近的几个像素。
+
+    参数:
+        image: (H, W, C) 图像数组
+        seed: 种子像素 (x, y)
+        tolerance: 与种子颜色的最大欧氏距离
+        window: 生长范围的窗口大小(以种子为中心)
+        coarse_factor: 粗生长的降采样倍数
+
+    返回:
+        (mask, (x0, y0))：窗口内的布尔掩码及窗口左上角位置
+    """
+    x, y = int(seed[0]), int(seed[1])
+    half = window // 2
+    x0, y0 = max(0, x - half), max(0, y - half)
+    x1, y1 = min(image.shape[1], x + half), min(image.shape[0], y + half)
+    sub = image[y0:y1, x0:x1].astype(np.float32)
+    if sub.ndim == 2:
+        sub = sub[:, :, None]
+    sx, sy = x - x0, y - y0
+
+    # 种子颜色取 3x3 邻域均值，减少噪声影响
+    reference = sub[max(0, sy - 1):sy + 2, max(0, sx - 1):sx + 2].reshape(-1, sub.shape[2]).mean(axis=0)
+    difference = sub - reference
+    similar = np.einsum('ijk,ijk->ij', difference, difference) <= tolerance * tolerance
+
+    factor = coarse_factor
+    height, width = similar.shape
+    if factor > 1 and height // factor > 2 and width // factor > 2 and sy // factor < height // factor \
+            and sx // factor < width // factor:
+        coarse = grow_region(_block_mean(similar, factor) >= 0.5,
+                             (np.array([sy // factor]), np.array([sx // factor])))
+        if coarse.any():
+            # 允许范围为粗区域外扩一个单元，粗区域内缩一个单元后的相似像素直接视为区域内部
+            shrunk = _erode(coarse)
+            passable = similar & _upsample(_dilate(coarse), factor, similar.shape, fill=True)
+            interior = _upsample(shrunk, factor, similar.shape)
+            # 只从与外部相邻的内部粗单元出发向外生长
+            edge = _upsample(shrunk & ~_erode(shrunk), factor, similar.shape)
+            rows, cols = np.nonzero(edge & passable)
+            rows = np.append(rows, sy)
+            cols = np.append(cols, sx)
+            return grow_region(passable, (rows, cols), known=interior), (x0, y0)
+
+    return grow_region(similar, (np.array([sy]), np.array([sx]))), (x0, y0)
+
+
+def trace_outlines(mask, origin=(0, 0)):
+    """
+    提取掩码中所有区域的外轮廓(忽略孔洞)
+
+    参数:
+        mask: (H, W) 布尔数组
+        origin: 掩码左上角在图像中的位置 (x, y)
+
+    返回:
+        [(K, 2) float 多边形顶点(不重复首点), ...]，按面积从大到小排列
+    """
+    # 四周补零，保证轮廓闭合
+    padded = np.pad(mask.astype(np.float32), 1)
+    keys, points, _ = contour_segments(padded, 1.0, -0.5, (origin[0] - 1, origin[1] - 1))
+    outlines = []
+    for chain, closed in chain_paths(keys[:, 0], keys[:, 1]):
+        if not closed:
+            continue
+        outline = points[chain, 0].astype(np.float64)
+        x, y = outline[:, 0], outline[:, 1]
+        # 有向面积为正的是外轮廓，为负的是孔洞
+        area = 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+        if area > 0:
+            outlines.append((area, outline))
+    outlines.sort(key=lambda item: -item[0])
+    # 0.5 等值线位于内外像素中心之间，即像素边界上，与标注使用的像素左上角坐标系一致
+    return [outline for _, outline in outlines]
+
+
+def trace_outline(mask, origin=(0, 0)):
+    """
+    提取掩码中面积最大的区域的外轮廓
+
+    参数:
+        mask: (H, W) 布尔数组
+        origin: 掩码左上角在图像中的位置 (x, y)
+
+    返回:
+        (K, 2) float 多边形顶点(不重复首点)，掩码为空时返回空数组
+    """
+    outlines = trace_outlines(mask, origin)
+    return outlines[0] if outlines else np.zeros((0, 2))
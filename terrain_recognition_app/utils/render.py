@@ -0,0 +1,419 @@
+from collections import namedtuple
+
+import numpy as np
+
+from utils.band_cache import display_band_cache, display_step
+from utils.raster_io import RasterSource, to_uint8
+from utils.tile_cache import source_key
+from utils.trace import tracer
+
+# 显示图像在磁盘缓存中的分块大小
+DISPLAY_TILE_SIZE = 1024
+
+
+def apply_colormap_jet(gray_image):
+    """
+    将灰度图像转换为伪彩色图像（使用jet颜色映射）
+
+    参数:
+        gray_image: (H, W) uint8 灰度数组
+
+    返回:
+        (H, W, 3) uint8 RGB数组
+    """
+    height, width = gray_image.shape
+    rgb_image = np.zeros((height, width, 3), dtype=np.uint8)
+    v = gray_image.astype(np.float32) / 255.0
+    rgb_image[..., 0] = np.clip(np.minimum(4 * v - 1.5, -4 * v + 4.5) * 255, 0, 255).astype(np.uint8)
+    rgb_image[..., 1] = np.clip(np.minimum(4 * v - 0.5, -4 * v + 3.5) * 255, 0, 255).astype(np.uint8)
+    rgb_image[..., 2] = np.clip(np.minimum(4 * v + 0.5, -4 * v + 2.5) * 255, 0, 255).astype(np.uint8)
+    return rgb_image
+
+
+def display_bands(source):
+    """
+    用于显示的波段
+
+    参数:
+        source: RasterSource
+
+    返回:
+        3个以上波段时为 (红, 绿, 蓝) 波段编号，否则为 (1,)
+    """
+    return source.rgb_bands() if source.band_count >= 3 else (1,)
+
+
+def render_display_array(path, progress=None):
+    """
+    将栅格图像解码并拉伸为显示用的RGB数组，不依赖Qt
+
+    单波段带调色板的图像按调色板着色；3个以上波段的图像按颜色解释组合红绿蓝波段；
+    其余单波段图像线性拉伸为单通道灰度(不再复制为三个相同的通道)。大图像按 display_step 降采样。
+
+    参数:
+        path: 图像路径
+        progress: 进度回调 progress(已完成波段数, 波段总数)
+
+    返回:
+        (H, W, 3) uint8 RGB数组，或单波段灰度图像的 (H, W) uint8 数组
+    """
+    source = RasterSource(path)
+    try:
+        step = display_step(source.width, source.height)
+        colormap = source.color_table() if source.band_count == 1 else None
+        if colormap is not None:
+            # 调色板编号不能求均值，降采样时直接抽样
+            indices = source.read_band(1)[::step, ::step][:source.height // step, :source.width // step]
+            rgb = colormap[np.clip(indices, 0, len(colormap) - 1).astype(np.intp)]
+        elif source.band_count >= 3:
+            return display_band_cache.composite(path, display_bands(source), progress)
+        else:
+            rgb = display_band_cache.band(source, 1, step)
+    finally:
+        source.close()
+    if progress:
+        progress(1, 1)
+    return rgb
+
+
+def read_raw_band(source, band, step, strip_rows=512):
+    """
+    逐条带读取一个波段的原始数值，按步长做均值降采样
+
+    参数:
+        source: RasterSource
+        band: 波段编号
+        step: 降采样步长
+        strip_rows: 每次读取的输出行数
+
+    返回:
+        (height // step, width // step) 数组，数据类型与源图像相同(整数类型的均值四舍五入)
+    """
+    if step == 1:
+        return source.read_band(band)
+    out_width = source.width // step
+    out_height = source.height // step
+    result = None
+    for row in range(0, out_height, strip_rows):
+        rows = min(strip_rows, out_height - row)
+        block = source.read_band(band, 0, row * step, out_width * step, rows * step)
+        if result is None:
+            result = np.empty((out_height, out_width), dtype=block.dtype)
+        mean = block.reshape(rows, step, out_width, step).mean(axis=(1, 3), dtype=np.float32)
+        result[row:row + rows] = np.rint(mean) if np.issubdtype(block.dtype, np.integer) else mean
+    return result
+
+
+def read_display_raw(path, bands=None, max_bytes=None, progress=None):
+    """
+    读取显示波段的原始数值，保留16位等原始精度，调整拉伸时不需要重新读取文件
+
+    参数:
+        path: 图像路径
+        bands: 显示波段编号，默认为 display_bands 的结果(单波段或红绿蓝三个波段)
+        max_bytes: 原始数值的字节数上限，超过时不读取
+        progress: 进度回调 progress(已读取波段数, 波段总数)
+
+    返回:
+        ([各波段的原始数值数组], [各波段的默认窗口 (下限, 上限)], 无数据值)，默认窗口与
+        render_display_array 的拉伸一致，没有无数据值时为None；调色板图像或超过字节数上限时返回None
+    """
+    source = RasterSource(path)
+    try:
+        if source.band_count == 1 and source.color_table() is not None:
+            return None
+        if bands is None:
+            bands = display_bands(source)
+        step = display_step(source.width, source.height)
+        if max_bytes is not None:
+            itemsize = source.dtype.itemsize if source.dtype is not None else 1
+            if (source.width // step) * (source.height // step) * itemsize * len(bands) > max_bytes:
+                return None
+        raws, windows = [], []
+        for band in bands:
+            with tracer.span("raster.read_raw", band=band):
+                raw = read_raw_band(source, band, step)
+            raws.append(raw)
+            windows.append((0.0, 255.0) if raw.dtype == np.uint8 else source.band_range(band))
+            if progress:
+                progress(len(raws), len(bands))
+        nodata = source.nodata
+    finally:
+        source.close()
+    return raws, windows, nodata
+
+
+# 按查找表映射的整数类型：查找表最多65536项
+LUT_DTYPES = (np.uint8, np.int8, np.uint16, np.int16)
+
+
+def stretch(values, low, high, gamma=1.0):
+    """
+    按窗口线性拉伸到0-255，再做伽马校正
+
+    参数:
+        values: 任意数值类型的数组
+        low, high: 映射到0和255的值
+        gamma: 伽马值，大于1时提亮暗部
+
+    返回:
+        uint8 数组
+    """
+    if gamma == 1.0 or high <= low:
+        return to_uint8(values, low, high)
+    scaled = np.clip((values.astype(np.float32) - np.float32(low)) / np.float32(high - low), 0, 1)
+    return (scaled ** np.float32(1.0 / gamma) * 255).astype(np.uint8)
+
+
+def window_lut(dtype, low, high, gamma=1.0):
+    """
+    8/16位整数类型的显示查找表
+
+    返回:
+        uint8 数组，以原始数值的无符号表示为下标(有符号类型已循环移位)
+    """
+    info = np.iinfo(dtype)
+    lut = stretch(np.arange(info.min, info.max + 1, dtype=np.float32), low, high, gamma)
+    if info.min < 0:
+        # 有符号数按无符号视图查表：无符号值 u 对应 lut[u - min (mod 2^n)]
+        lut = np.roll(lut, info.min)
+    return lut
+
+
+def apply_window(raw, low, high, gamma=1.0):
+    """
+    按窗宽窗位将原始数值映射为 uint8 灰度
+
+    8/16位整数用一次查表完成，不产生浮点中间数组；其他类型直接计算。
+
+    参数:
+        raw: read_display_raw 返回的原始数值
+        low, high: 窗口下限和上限
+        gamma: 伽马值
+
+    返回:
+        与 raw 形状相同的 uint8 数组
+    """
+    if raw.dtype.type in LUT_DTYPES:
+        lut = window_lut(raw.dtype, low, high, gamma)
+        index = raw.view(np.dtype(raw.dtype.str.replace('i', 'u')))
+        return np.take(lut, index)
+    return stretch(raw, low, high, gamma)
+
+
+def apply_windows(raws, windows, gamma=1.0):
+    """
+    按各波段的窗口将原始数值映射为显示用的 uint8 数组
+
+    参数:
+        raws: 各波段的原始数值数组(可以是同一区域的切片)
+        windows: 各波段的 (下限, 上限)
+        gamma: 伽马值
+
+    返回:
+        单波段为 (H, W) 灰度，多波段为 (H, W, 3) RGB
+    """
+    if len(raws) == 1:
+        return apply_window(raws[0], *windows[0], gamma)
+    out = np.empty(raws[0].shape + (len(raws),), dtype=np.uint8)
+    for i, (raw, (low, high)) in enumerate(zip(raws, windows)):
+        out[..., i] = apply_window(raw, low, high, gamma)
+    return out
+
+
+# 直方图：counts[i] 为 [start + i * bin_width, start + (i + 1) * bin_width) 内的像素数
+Histogram = namedtuple('Histogram', 'counts start bin_width')
+
+
+def sample_blocks(raw, block_size=64, max_samples=1000000):
+    """
+    分层分块抽样：图像分为 count x count 个网格，每格中心取一块
+
+    每块连续读取，比逐像素跳跃抽样访存更连续，也不会与周期性纹理对齐。
+
+    返回:
+        一维数组，图像不大于 max_samples 时为全部像素
+    """
+    if raw.size <= max_samples:
+        return raw.ravel()
+    height, width = raw.shape
+    count = max(1, int(np.sqrt(max_samples / block_size ** 2)))
+    ys = np.unique(np.clip(((np.arange(count) + 0.5) * height / count - block_size / 2).astype(int),
+                           0, max(0, height - block_size)))
+    xs = np.unique(np.clip(((np.arange(count) + 0.5) * width / count - block_size / 2).astype(int),
+                           0, max(0, width - block_size)))
+    return np.concatenate([raw[y:y + block_size, x:x + block_size].ravel() for y in ys for x in xs])
+
+
+@tracer.traced("histogram")
+def block_histogram(raw, nodata=None, block_size=64, max_samples=1000000, bins=1024):
+    """
+    分块抽样计算原始数值的直方图
+
+    8/16位整数每个数值一个区间，其他类型在抽样的取值范围内分为 bins 个区间。
+    无数据值(如DEM的 -9999 填充)不计入，否则横轴会被拉到填充值、自动拉伸的百分位数也会落在填充值上。
+
+    参数:
+        raw: 原始数值数组
+        nodata: 无数据值，None 表示没有
+
+    返回:
+        Histogram，两端没有像素的区间已去掉
+    """
+    sample = sample_blocks(raw, block_size, max_samples)
+    if nodata is not None and not np.isnan(nodata):
+        sample = sample[sample != nodata]
+        if sample.size == 0:
+            return Histogram(np.zeros(1, dtype=np.int64), 0.0, 1.0)
+    if sample.dtype.type in LUT_DTYPES:
+        offset = np.iinfo(sample.dtype).min
+        counts = np.bincount((sample.astype(np.int32) - offset).ravel())
+        start, bin_width = float(offset), 1.0
+    else:
+        sample = sample[np.isfinite(sample)] if np.issubdtype(sample.dtype, np.floating) else sample
+        if sample.size == 0:
+            return Histogram(np.zeros(1, dtype=np.int64), 0.0, 1.0)
+        low, high = float(sample.min()), float(sample.max())
+        bin_width = (high - low) / bins if high > low else 1.0
+        counts, _ = np.histogram(sample, bins=bins, range=(low, low + bin_width * bins))
+        start = low
+    nonzero = np.flatnonzero(counts)
+    if nonzero.size == 0:
+        return Histogram(np.zeros(1, dtype=np.int64), start, bin_width)
+    return Histogram(counts[nonzero[0]:nonzero[-1] + 1], start + nonzero[0] * bin_width, bin_width)
+
+
+def histogram_window(histogram, low_percent=2.0, high_percent=98.0):
+    """
+    按直方图的百分位数计算窗口(自动拉伸)
+
+    返回:
+        (下限, 上限)
+    """
+    cumulative = np.cumsum(histogram.counts)
+    total = cumulative[-1]
+    if total == 0:
+        return histogram.start, histogram.start + histogram.bin_width
+    low_index = int(np.searchsorted(cumulative, total * low_percent / 100.0))
+    high_index = int(np.searchsorted(cumulative, total * high_percent / 100.0))
+    low = histogram.start + low_index * histogram.bin_width
+    high = histogram.start + high_index * histogram.bin_width
+    if high <= low:
+        high = low + histogram.bin_width
+    return low, high
+
+
+def display_namespace(path):
+    """显示图像在磁盘缓存中的命名空间，文件变化后自动失效"""
+    return f"{source_key(path)}/display"
+
+
+def write_cached_display(cache, path, rgb, tile_size=DISPLAY_TILE_SIZE):
+    """
+    将显示用的RGB数组按分块写入磁盘缓存
+
+    参数:
+        cache: DiskTileCache
+        path: 源图像路径
+        rgb: render_display_array 的结果(RGB或单通道灰度)
+        tile_size: 分块大小
+    """
+    namespace = display_namespace(path)
+    height, width = rgb.shape[:2]
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            cache.put(namespace, f"{x}_{y}", np.ascontiguousarray(rgb[y:y + tile_size, x:x + tile_size]))
+    # 最后写入大小，读取时以它判断缓存是否完整
+    cache.put(namespace, "shape", np.array([height, width, tile_size], dtype=np.int64))
+
+
+def read_cached_display(cache, path):
+    """
+    从磁盘缓存读取显示用的RGB数组
+
+    参数:
+        cache: DiskTileCache
+        path: 源图像路径
+
+    返回:
+        (H, W, 3) 或单通道灰度的 (H, W) uint8 数组，缓存不存在或不完整时返回None
+    """
+    namespace = display_namespace(path)
+    shape = cache.get(namespace, "shape")
+    if shape is None:
+        return None
+    height, width, tile_size = (int(v) for v in shape)
+    rgb = None
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            tile = cache.get(namespace, f"{x}_{y}")
+            if tile is None:
+                return None
+            if rgb is None:
+                rgb = np.empty((height, width) + tile.shape[2:], dtype=np.uint8)
+            rgb[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+    return rgb
+
+
+def read_display_window(source, x, y, width, height, ranges=None):
+    """
+    读取一个窗口并拉伸为显示用的 uint8 数组
+
+    参数:
+        source: RasterSource
+        x, y, width, height: 窗口
+        ranges: 各显示波段的 (min, max)，默认为整幅图像的取值范围，保证各窗口拉伸一致
+
+    返回:
+        (height, width, 3) uint8 数组
+    """
+    bands = display_bands(source)
+    if ranges is None:
+        ranges = [source.band_range(band) for band in bands]
+    channels = []
+    for band, (low, high) in zip(bands, ranges):
+        block = source.read_band(band, x, y, width, height)
+        channels.append(block if block.dtype == np.uint8 else to_uint8(block, low, high))
+    if len(channels) == 1:
+        channels = channels * 3
+    return np.stack(channels, axis=2)
+
+
+def read_display_level(source, x, y, width, height, step, ranges, colormap=None):
+    """
+    读取一个窗口并按步长降采样为显示用的 uint8 数组
+
+    与 read_display_band 一致：先在原始数值上求均值，再按整幅图像的取值范围拉伸；
+    调色板图像直接抽样。窗口大小不是步长整数倍时，边缘按最后一个像素补齐。
+
+    参数:
+        source: RasterSource
+        x, y, width, height: 原始分辨率下的窗口(需在图像范围内)
+        step: 降采样步长
+        ranges: 各显示波段的 (min, max)
+        colormap: 单波段调色板，(N, 3) uint8 数组
+
+    返回:
+        (ceil(height / step), ceil(width / step), 3) uint8 数组
+    """
+    out_height, out_width = -(-height // step), -(-width // step)
+    if colormap is not None:
+        indices = source.read_band(1, x, y, width, height)[::step, ::step]
+        return colormap[np.clip(indices, 0, len(colormap) - 1).astype(np.intp)]
+    channels = []
+    for band, (low, high) in zip(display_bands(source), ranges):
+        block = source.read_band(band, x, y, width, height)
+        if block.dtype == np.uint8:
+            if step == 1:
+                channels.append(block)
+                continue
+            low, high = 0, 255
+        if step > 1:
+            pad = ((0, out_height * step - height), (0, out_width * step - width))
+            if any(after for _, after in pad):
+                block = np.pad(block, pad, mode='edge')
+            block = block.reshape(out_height, step, out_width, step).mean(axis=(1, 3), dtype=np.float32)
+        channels.append(to_uint8(block, low, high))
+    if len(channels) == 1:
+        channels = channels * 3
+    return np.stack(channels, axis=2)
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class GridIndex:
+    """均匀网格空间索引
+
+    每个对象按外接矩形登记到所覆盖的网格单元中，单元内的对象编号连续存放；
+    查询时只检查与查询矩形相交的单元中的对象。
+    """
+
+    def __init__(self, bounds, cell_size=None):
+        """建立索引
+
+        参数:
+            bounds: (M, 4) 数组，每行为 (min_x, min_y, max_x, max_y)
+            cell_size: 网格单元大小，默认使每个单元平均约有一个对象
+        """
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        count = len(self.bounds)
+        if count:
+            self.origin = self.bounds[:, :2].min(axis=0)
+            extent = self.bounds[:, 2:].max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.ones(2)
+        if cell_size is None:
+            cell_size = max(float(extent.max()) / max(1.0, np.sqrt(count)), 1.0)
+        self.cell_size = float(cell_size)
+        self.cols = int(extent[0] // self.cell_size) + 1
+        self.rows = int(extent[1] // self.cell_size) + 1
+
+        # 每个对象覆盖的单元范围
+        x0, y0 = self._cell(self.bounds[:, 0], self.bounds[:, 1])
+        x1, y1 = self._cell(self.bounds[:, 2], self.bounds[:, 3])
+        span_x = x1 - x0 + 1
+        counts = span_x * (y1 - y0 + 1)
+
+        # 展开为 (对象, 单元) 对，按单元编号排序
+        items = np.repeat(np.arange(count, dtype=np.int64), counts)
+        local = np.arange(len(items), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = ((y0[items] + local // span_x[items]) * self.cols +
+                 x0[items] + local % span_x[items])
+        order = np.argsort(cells, kind='stable')
+        self.items = items[order]
+        self.cell_offsets = np.zeros(self.rows * self.cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.rows * self.cols), out=self.cell_offsets[1:])
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def _cell(self, x, y):
+        """坐标所在的网格单元(限制在网格范围内)"""
+        col = np.clip(((np.asarray(x) - self.origin[0]) // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        row = np.clip(((np.asarray(y) - self.origin[1]) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return col, row
+
+    def query(self, rect):
+        """
+        查询外接矩形与给定矩形相交的对象
+
+        参数:
+            rect: (min_x, min_y, max_x, max_y)
+
+        返回:
+            升序排列的对象编号数组
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        x0, y0 = self._cell(rect[0], rect[1])
+        x1, y1 = self._cell(rect[2], rect[3])
+        rows = np.arange(int(y0), int(y1) + 1)
+        starts = self.cell_offsets[rows * self.cols + int(x0)]
+        ends = self.cell_offsets[rows * self.cols + int(x1) + 1]
+        candidates = np.unique(np.concatenate([self.items[s:e] for s, e in zip(starts, ends)]))
+        bounds = self.bounds[candidates]
+        hit = ((bounds[:, 2] >= rect[0]) & (bounds[:, 0] <= rect[2]) &
+               (bounds[:, 3] >= rect[1]) & (bounds[:, 1] <= rect[3]))
+        return candidates[hit]
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque, namedtuple
+
+# 一次界面卡顿：开始时间(time.time())、时长(秒)、处理函数、{折叠栈: 秒数}
+StallEpisode = namedtuple('StallEpisode', 'started duration handler stacks')
+
+
+def frame_label(frame):
+    """栈帧的显示名称，如 file_operations.py:FileOperations.load_image"""
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def collapse_stack(frame):
+    """
+    将栈帧折叠为一行(从最外层到最内层，用分号连接)
+
+    返回:
+        (折叠栈字符串, 栈帧名称列表)
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels), labels
+
+
+def handler_label(labels, base_depth):
+    """
+    卡顿栈中事件循环直接调用的处理函数
+
+    参数:
+        labels: 栈帧名称列表(从最外层开始)
+        base_depth: 事件循环下方的栈帧数
+
+    返回:
+        处理函数名称，跳过按钮信号连接的 lambda
+    """
+    for label in labels[base_depth:]:
+        if not label.endswith('<lambda>'):
+            return label
+    return labels[-1]
+
+
+class StallDetector:
+    """界面线程卡顿检测
+
+    界面线程通过定时器周期性调用 heartbeat()；看门狗线程发现心跳超过阈值没有更新时，
+    用 sys._current_frames() 周期性采样界面线程的调用栈，卡顿结束后按采样比例把卡顿时长分配给各调用栈，
+    并按事件循环直接调用的处理函数汇总。
+
+    心跳时记录事件循环下方的栈深度(嵌套的对话框事件循环深度不同)，
+    卡顿栈中该深度处的栈帧就是事件循环调用的处理函数。
+    """
+
+    def __init__(self, threshold=0.25, heartbeat_interval=0.05, sample_interval=0.01, log_path=None,
+                 max_episodes=500):
+        """初始化
+
+        参数:
+            threshold: 心跳超过多少秒没有更新视为卡顿
+            heartbeat_interval: 界面线程调用 heartbeat() 的间隔(秒)
+            sample_interval: 卡顿期间的采样间隔(秒)
+            log_path: 卡顿日志文件，每次卡顿追加一段折叠栈，None表示不写日志
+            max_episodes: 保留的卡顿记录数
+        """
+        self.threshold = threshold
+        self.heartbeat_interval = heartbeat_interval
+        self.sample_interval = sample_interval
+        self.log_path = log_path
+        self.main_thread_id = threading.main_thread().ident
+        self.episodes = deque(maxlen=max_episodes)
+        self.stacks = Counter()  # 整个会话：{折叠栈: 卡顿秒数}
+        self.handlers = {}  # 整个会话：{处理函数: [卡顿次数, 总秒数, 最长秒数]}
+        self.listeners = []  # 卡顿结束时在看门狗线程中调用 listener(StallEpisode)
+        self._last_beat = time.monotonic()
+        self._base_depth = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self):
+        """由界面线程的定时器调用"""
+        depth = 0
+        frame = sys._getframe(1)
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        self._base_depth = depth
+        self._last_beat = time.monotonic()
+
+    def start(self):
+        """启动看门狗线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._last_beat = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="StallWatchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止看门狗线程"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def sample(self):
+        """
+        采样界面线程的调用栈
+
+        返回:
+            (折叠栈字符串, 栈帧名称列表)，界面线程不存在时返回None
+        """
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return None
+        return collapse_stack(frame)
+
+    def _run(self):
+        """看门狗循环"""
+        samples = None  # 当前卡顿的 {折叠栈: 采样数}
+        handlers = None  # 当前卡顿的 {处理函数: 采样数}
+        started = None
+        while not self._stop.is_set():
+            last_beat = self._last_beat
+            if time.monotonic() - last_beat > self.threshold:
+                if samples is None:
+                    samples, handlers, started = Counter(), Counter(), last_beat
+                    base_depth = self._base_depth
+                result = self.sample()
+                if result is not None:
+                    stack, labels = result
+                    samples[stack] += 1
+                    handlers[handler_label(labels, base_depth)] += 1
+                self._stop.wait(self.sample_interval)
+                continue
+            if samples is not None:
+                # 卡顿结束：两次心跳的间隔减去正常的心跳间隔即卡顿时长
+                duration = max(0.0, last_beat - started - self.heartbeat_interval)
+                self._finish(duration, samples, handlers)
+                samples = handlers = None
+            self._stop.wait(self.heartbeat_interval / 2)
+
+    def _finish(self, duration, samples, handlers):
+        """记录一次卡顿"""
+        total = sum(samples.values())
+        if not total:
+            return
+        stacks = {stack: duration * count / total for stack, count in samples.most_common()}
+        handler = handlers.most_common(1)[0][0]
+        episode = StallEpisode(time.time() - duration, duration, handler, stacks)
+        with self._lock:
+            self.episodes.append(episode)
+            self.stacks.update(stacks)
+            for name, count in handlers.items():
+                entry = self.handlers.setdefault(name, [0, 0.0, 0.0])
+                seconds = duration * count / total
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+        if self.log_path:
+            try:
+                self._write_log(episode)
+            except OSError:
+                pass
+        for listener in list(self.listeners):
+            listener(episode)
+
+    def _write_log(self, episode):
+        """追加一次卡顿的折叠栈到日志"""
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(episode.started))
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(f"# {started} 卡顿 {episode.duration * 1000:.0f}ms 处理函数 {episode.handler}\n")
+            for stack, seconds in episode.stacks.items():
+                f.write(f"{stack} {max(1, round(seconds * 1000))}\n")
+
+    def handler_summary(self):
+        """
+        按卡顿总时长排序的处理函数统计
+
+        返回:
+            [(处理函数, 卡顿次数, 总秒数, 最长秒数), ...]
+        """
+        with self._lock:
+            rows = [(name, count, total, longest) for name, (count, total, longest) in self.handlers.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def export_collapsed(self, path):
+        """
+        导出整个会话的折叠栈(flamegraph.pl、speedscope、inferno 等工具可直接读取)
+
+        每行为 "栈帧;栈帧;... 毫秒数"。
+
+        返回:
+            导出的栈数
+        """
+        with self._lock:
+            stacks = list(self.stacks.items())
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, seconds in sorted(stacks, key=lambda item: -item[1]):
+                f.write(f"{stack} {max(1, round(seconds * 1000))}\n")
+        return len(stacks)
+
+    def clear(self):
+        """清空会话统计"""
+        with self._lock:
+            self.episodes.clear()
+            self.stacks.clear()
+            self.handlers.clear()
@@ -0,0 +1,96 @@
+import sys
+import time
+import importlib
+
+# 首次绘制后在后台预先导入的模块，用户第一次导入图像时不再等待
+PRELOAD_MODULES = ("PIL.Image", "PIL.PngImagePlugin", "PIL.TiffImagePlugin")
+
+
+class StartupTimer:
+    """启动耗时记录：各阶段完成时距计时起点(命令行入口模块导入时)的时间
+
+    首次绘制后启动的后台阶段用 begin()/end() 登记，全部结束后调用监听者。
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.marks = []  # [(阶段, 距起点的秒数)]
+        self.pending = set()  # 尚未结束的后台阶段
+        self.listeners = []  # 后台阶段全部结束时调用 listener(StartupTimer)
+
+    def mark(self, name):
+        """记录一个阶段完成"""
+        self.marks.append((name, time.perf_counter() - self.origin))
+
+    def begin(self, name):
+        """登记一个后台阶段"""
+        self.pending.add(name)
+
+    def end(self, name):
+        """后台阶段结束(成功或失败)，全部结束后通知监听者"""
+        if name not in self.pending:
+            return
+        self.pending.discard(name)
+        self.mark(name)
+        if not self.pending:
+            for listener in list(self.listeners):
+                listener(self)
+
+    def elapsed(self, name):
+        """阶段完成时距起点的秒数，没有记录时返回None"""
+        for mark, seconds in self.marks:
+            if mark == name:
+                return seconds
+        return None
+
+    def report(self):
+        """
+        格式化各阶段耗时
+
+        返回:
+            多行文字，每行为 阶段、距起点的毫秒数、距上一阶段的毫秒数
+        """
+        lines = ["启动耗时(从入口模块导入开始计):"]
+        previous = 0.0
+        for name, seconds in sorted(self.marks, key=lambda mark: mark[1]):
+            # 中文字符按两列宽度对齐
+            padding = " " * max(0, 12 - sum(2 if ord(char) > 0x2E80 else 1 for char in name))
+            lines.append(f"  {name}{padding} {seconds * 1000:8.1f} ms  (+{(seconds - previous) * 1000:.1f})")
+            previous = seconds
+        lines.append(f"  已加载模块 {len(sys.modules)} 个")
+        return "\n".join(lines)
+
+
+def preload_modules(names=PRELOAD_MODULES, progress=None):
+    """
+    在后台线程中导入较慢的模块和GDAL
+
+    参数:
+        names: 模块名列表
+        progress: 进度回调 (已完成, 总数)
+
+    返回:
+        {模块名: 导入秒数}，不可用的模块为None
+    """
+    from utils.raster_io import get_gdal
+
+    timings = {}
+    total = len(names) + 1
+    for i, name in enumerate(names):
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            timings[name] = time.perf_counter() - start
+        except ImportError:
+            timings[name] = None
+        if progress:
+            progress(i + 1, total)
+    start = time.perf_counter()
+    timings["osgeo.gdal"] = time.perf_counter() - start if get_gdal() is not None else None
+    if progress:
+        progress(total, total)
+    return timings
+
+
+# 全局启动计时器，命令行入口最先导入本模块
+startup = StartupTimer()
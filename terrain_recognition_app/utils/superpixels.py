@@ -0,0 +1,315 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.features import feature_bands, feature_gray_range
+from utils.raster_io import RasterSource, iter_tiles
+
+# 超像素分块大小，超像素不跨越分块边界
+SUPERPIXEL_TILE_SIZE = 512
+
+# 默认的超像素步长(像素)
+DEFAULT_STEP = 24
+
+
+def grid_shape(height, width, step):
+    """
+    分块内超像素初始网格的行列数
+
+    参数:
+        height, width: 分块大小
+        step: 超像素步长
+
+    返回:
+        (rows, cols)
+    """
+    return max(1, int(round(height / step))), max(1, int(round(width / step)))
+
+
+def slic(image, step=DEFAULT_STEP, compactness=30.0, iterations=5):
+    """
+    SLIC超像素分割(NumPy实现)
+
+    每个像素只与其所在网格单元及相邻8个单元的聚类中心比较，按候选偏移逐个向量化计算距离，
+    聚类中心用 bincount 一次性更新。
+
+    参数:
+        image: (H, W, C) 图像数组，各波段已拉伸到0-255
+        step: 超像素步长(初始网格间距)
+        compactness: 紧凑度，越大超像素越规则
+        iterations: 迭代次数
+
+    返回:
+        (H, W) int32 超像素编号，取值 0 .. rows * cols - 1
+    """
+    image = np.asarray(image, dtype=np.float32)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    height, width, channels = image.shape
+    rows, cols = grid_shape(height, width, step)
+    count = rows * cols
+
+    # 初始中心位于每个网格单元的中心
+    center_y = np.repeat((np.arange(rows) + 0.5) * height / rows, cols).astype(np.float32)
+    center_x = np.tile((np.arange(cols) + 0.5) * width / cols, rows).astype(np.float32)
+    center_color = image[center_y.astype(np.int64), center_x.astype(np.int64)]
+
+    ys = np.arange(height, dtype=np.float32)[:, None]
+    xs = np.arange(width, dtype=np.float32)[None, :]
+    cell_y = np.minimum(np.arange(height) * rows // height, rows - 1)[:, None]
+    cell_x = np.minimum(np.arange(width) * cols // width, cols - 1)[None, :]
+    spatial_weight = np.float32((compactness / step) ** 2)
+    flat = image.reshape(-1, channels)
+
+    labels = np.zeros((height, width), dtype=np.int32)
+    for _ in range(iterations):
+        best = np.full((height, width), np.inf, dtype=np.float32)
+        for dy in (-1, 0, 1):
+            candidate_y = np.clip(cell_y + dy, 0, rows - 1)
+            for dx in (-1, 0, 1):
+                candidate = (candidate_y * cols + np.clip(cell_x + dx, 0, cols - 1)).astype(np.int32)
+                difference = image - center_color[candidate]
+                distance = np.einsum('ijk,ijk->ij', difference, difference)
+                distance += spatial_weight * ((ys - center_y[candidate]) ** 2 + (xs - center_x[candidate]) ** 2)
+                closer = distance < best
+                best[closer] = distance[closer]
+                labels[closer] = candidate[closer]
+
+        # 更新聚类中心，没有分到像素的中心保持不变
+        ids = labels.ravel()
+        sizes = np.bincount(ids, minlength=count)
+        used = sizes > 0
+        center_y[used] = (np.bincount(ids, np.broadcast_to(ys, labels.shape).ravel(), count) / np.maximum(sizes, 1))[used]
+        center_x[used] = (np.bincount(ids, np.broadcast_to(xs, labels.shape).ravel(), count) / np.maximum(sizes, 1))[used]
+        for k in range(channels):
+            center_color[used, k] = (np.bincount(ids, flat[:, k], count) / np.maximum(sizes, 1))[used]
+    return labels
+
+
+def enforce_connectivity(labels):
+    """
+    保证每个编号只有一个4连通区域：保留每个编号最大的连通块，其余碎片并入相邻的超像素
+
+    连通块用向量化的最小编号传播加指针跳跃求出，碎片再逐轮从相邻像素继承编号。
+
+    参数:
+        labels: (H, W) 编号数组
+
+    返回:
+        (H, W) int32 编号数组
+    """
+    labels = np.asarray(labels, dtype=np.int32)
+    height, width = labels.shape
+    same_x = labels[:, 1:] == labels[:, :-1]
+    same_y = labels[1:, :] == labels[:-1, :]
+
+    # 每个像素所在连通块的根(块内最小的扁平索引)
+    root = np.arange(height * width, dtype=np.int64).reshape(height, width)
+    while True:
+        merged = root.copy()
+        np.minimum(merged[:, 1:], np.where(same_x, root[:, :-1], merged[:, 1:]), out=merged[:, 1:])
+        np.minimum(merged[:, :-1], np.where(same_x, root[:, 1:], merged[:, :-1]), out=merged[:, :-1])
+        np.minimum(merged[1:, :], np.where(same_y, root[:-1, :], merged[1:, :]), out=merged[1:, :])
+        np.minimum(merged[:-1, :], np.where(same_y, root[1:, :], merged[:-1, :]), out=merged[:-1, :])
+        merged = merged.ravel()[merged].reshape(height, width)
+        if np.array_equal(merged, root):
+            break
+        root = merged
+
+    # 每个编号保留最大的连通块(面积相同时取根较大的)
+    sizes = np.bincount(root.ravel(), minlength=height * width)
+    key = sizes[root] * (height * width) + root
+    best = np.zeros(int(labels.max()) + 1, dtype=np.int64)
+    np.maximum.at(best, labels.ravel(), key.ravel())
+    result = np.where(key == best[labels], labels, -1).astype(np.int32)
+
+    # 碎片逐轮从上下左右的已定编号像素继承编号
+    while True:
+        orphan = result < 0
+        if not orphan.any():
+            return result
+        fill = result.copy()
+        for target, neighbor in ((np.s_[:, 1:], np.s_[:, :-1]), (np.s_[:, :-1], np.s_[:, 1:]),
+                                 (np.s_[1:, :], np.s_[:-1, :]), (np.s_[:-1, :], np.s_[1:, :])):
+            take = (fill[target] < 0) & (result[neighbor] >= 0)
+            fill[target][take] = result[neighbor][take]
+        result = fill
+
+
+def label_bounds(labels, count, origin=(0, 0)):
+    """
+    计算每个编号的外接矩形
+
+    参数:
+        labels: (H, W) 编号数组，取值 0 .. count - 1
+        count: 编号总数
+        origin: 数组左上角在图像中的位置 (x, y)
+
+    返回:
+        (count, 4) int32 数组 [x0, y0, x1, y1]，x1、y1 不包含；没有像素的编号为全0
+    """
+    height, width = labels.shape
+    ids = labels.ravel()
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    rows, cols = np.divmod(order, width)
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    present = sorted_ids[starts]
+
+    bounds = np.zeros((count, 4), dtype=np.int32)
+    bounds[present, 0] = np.minimum.reduceat(cols, starts) + origin[0]
+    bounds[present, 1] = np.minimum.reduceat(rows, starts) + origin[1]
+    bounds[present, 2] = np.maximum.reduceat(cols, starts) + origin[0] + 1
+    bounds[present, 3] = np.maximum.reduceat(rows, starts) + origin[1] + 1
+    return bounds
+
+
+def superpixel_paths(image_path, step=DEFAULT_STEP):
+    """
+    超像素缓存文件路径，与图像保存在同一目录
+
+    返回:
+        (编号文件路径, 外接矩形文件路径)
+    """
+    stem = os.path.splitext(image_path)[0]
+    return f"{stem}.sp{step}.npy", f"{stem}.sp{step}.bounds.npy"
+
+
+# 工作进程中的数据源
+_worker_source = None
+_worker_bands = None
+_worker_gray_range = None
+
+
+def _init_worker(image_path, gray_range):
+    """工作进程初始化"""
+    global _worker_source, _worker_bands, _worker_gray_range
+    _worker_source = RasterSource(image_path)
+    _worker_bands = feature_bands(_worker_source.band_count)
+    _worker_gray_range = gray_range
+
+
+def _segment_tile(args):
+    """在工作进程中对一个分块做超像素分割"""
+    tile, step, compactness = args
+    block = _worker_source.read_window(tile.x, tile.y, tile.width, tile.height, _worker_bands)
+    low, high = _worker_gray_range
+    scale = np.float32(255.0 / (high - low)) if high > low else np.float32(1.0)
+    block = (block.astype(np.float32) - np.float32(low)) * scale
+    return tile, enforce_connectivity(slic(block, step, compactness))
+
+
+def compute_superpixels(image_path, step=DEFAULT_STEP, compactness=30.0, tile_size=SUPERPIXEL_TILE_SIZE,
+                        workers=None, progress=None):
+    """
+    逐块并行计算整幅图像的超像素，结果缓存到图像旁边
+
+    各分块独立分割并保证每个超像素连通，编号按分块顺序偏移后全局唯一；超像素不会跨越分块边界。
+    编号以内存映射的 .npy 文件逐块写入，整幅结果不需要同时驻留内存。
+
+    参数:
+        image_path: 图像路径
+        step: 超像素步长
+        compactness: 紧凑度
+        tile_size: 分块大小
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        编号文件路径
+    """
+    source = RasterSource(image_path)
+    width, height = source.width, source.height
+    gray_range = feature_gray_range(source)
+    source.close()
+
+    tiles = list(iter_tiles(width, height, tile_size))
+    sizes = [np.prod(grid_shape(tile.height, tile.width, step)) for tile in tiles]
+    offsets = dict(zip(tiles, np.concatenate([[0], np.cumsum(sizes)[:-1]]).tolist()))
+    labels_path, bounds_path = superpixel_paths(image_path, step)
+    temp_labels = f"{labels_path}.{os.getpid()}.tmp.npy"
+    labels = np.lib.format.open_memmap(temp_labels, mode='w+', dtype=np.int32, shape=(height, width))
+    bounds = np.zeros((int(sum(sizes)), 4), dtype=np.int32)
+    workers = workers or os.cpu_count() or 1
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(image_path, gray_range)) as pool:
+            jobs = ((tile, step, compactness) for tile in tiles)
+            for done, (tile, result) in enumerate(pool.map(_segment_tile, jobs), start=1):
+                offset = offsets[tile]
+                count = int(result.max()) + 1
+                labels[tile.y:tile.y + tile.height, tile.x:tile.x + tile.width] = result + offset
+                bounds[offset:offset + count] = label_bounds(result, count, (tile.x, tile.y))
+                if progress:
+                    progress(done, len(tiles))
+        labels.flush()
+        del labels
+        np.save(f"{bounds_path}.{os.getpid()}.tmp.npy", bounds)
+        os.replace(f"{bounds_path}.{os.getpid()}.tmp.npy", bounds_path)
+        os.replace(temp_labels, labels_path)
+    finally:
+        if os.path.exists(temp_labels):
+            os.remove(temp_labels)
+    return labels_path
+
+
+class SuperpixelMap:
+    """只读的超像素编号图，编号以内存映射方式读取"""
+
+    def __init__(self, labels_path, bounds_path):
+        """打开超像素缓存
+
+        参数:
+            labels_path, bounds_path: 见 superpixel_paths
+        """
+        self.labels = np.load(labels_path, mmap_mode='r')
+        self.bounds = np.load(bounds_path)
+        self.height, self.width = self.labels.shape
+
+    @classmethod
+    def open_cached(cls, image_path, step=DEFAULT_STEP):
+        """
+        打开图像旁边的超像素缓存
+
+        返回:
+            SuperpixelMap，缓存不存在、早于图像或大小不一致时返回None
+        """
+        labels_path, bounds_path = superpixel_paths(image_path, step)
+        if not (os.path.exists(labels_path) and os.path.exists(bounds_path)):
+            return None
+        if os.path.getmtime(labels_path) < os.path.getmtime(image_path):
+            return None
+        try:
+            superpixels = cls(labels_path, bounds_path)
+        except Exception:
+            return None
+        source = RasterSource(image_path)
+        size = (source.width, source.height)
+        source.close()
+        return superpixels if size == (superpixels.width, superpixels.height) else None
+
+    def label_at(self, x, y):
+        """像素 (x, y) 所在超像素的编号，超出图像时返回None"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.labels[int(y), int(x)])
+        return None
+
+    def mask(self, ids):
+        """
+        一组超像素的并集掩码
+
+        参数:
+            ids: 超像素编号序列
+
+        返回:
+            (mask, (x0, y0))：并集外接矩形内的布尔掩码及其左上角位置，ids 为空时返回 (None, None)
+        """
+        ids = np.fromiter(ids, dtype=np.int32)
+        if not len(ids):
+            return None, None
+        bounds = self.bounds[ids]
+        x0, y0 = bounds[:, 0].min(), bounds[:, 1].min()
+        x1, y1 = bounds[:, 2].max(), bounds[:, 3].max()
+        return np.isin(self.labels[y0:y1, x0:x1], ids), (int(x0), int(y0))
@@ -0,0 +1,192 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.annotation_io import list_annotation_files, read_annotation, annotation_scale
+from utils.classifier import GaussianNaiveBayes
+from utils.features import (pixel_features, feature_bands, feature_halo, feature_gray_range, feature_namespace,
+                            tile_features, FEATURE_NAMES, FEATURE_TILE_SIZE)
+from utils.geometry import rasterize_polygon
+from utils.raster_io import RasterSource, RasterWriter, PreviewBuilder, find_image, iter_tiles
+from utils.tile_cache import DiskTileCache
+
+# 分类结果中表示"无类别"的值
+NO_CLASS = 255
+
+
+def collect_training_samples(annotations_dir, image_dirs, max_per_class=20000, seed=0, progress=None):
+    """
+    从标注多边形中采样训练像素
+
+    参数:
+        annotations_dir: 标注目录
+        image_dirs: 查找源图像的目录列表
+        max_per_class: 每个类别最多保留的样本数
+        seed: 随机种子
+        progress: 进度回调 progress(已完成的标注文件数, 标注文件总数)
+
+    返回:
+        (features, labels, class_names): (N, F) 特征、(N,) 类别编号和类别名称列表
+    """
+    rng = np.random.default_rng(seed)
+    halo = feature_halo()
+    samples = {}  # {类别名: [特征数组, ...]}
+    names = list_annotation_files(annotations_dir)
+
+    for done, name in enumerate(names, start=1):
+        try:
+            data = read_annotation(os.path.join(annotations_dir, name))
+            image_path = find_image(data.get('image', ''), image_dirs, data.get('image_path'))
+            if not image_path or not data.get('polygons'):
+                continue
+            source = RasterSource(image_path)
+            bands = feature_bands(source.band_count)
+            gray_range = feature_gray_range(source)
+            scale = np.array(annotation_scale(data, source.width, source.height))
+            for poly in data['polygons']:
+                # 标注坐标换算为源图像像素
+                points = np.asarray(poly.get('points', []), dtype=np.float64).reshape(-1, 2) * scale
+                if len(points) < 3:
+                    continue
+                # 读取多边形外接矩形(加重叠边)并计算特征
+                x0 = max(0, int(np.floor(points[:, 0].min())) - halo)
+                y0 = max(0, int(np.floor(points[:, 1].min())) - halo)
+                x1 = min(source.width, int(np.ceil(points[:, 0].max())) + halo + 1)
+                y1 = min(source.height, int(np.ceil(points[:, 1].max())) + halo + 1)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                features = pixel_features(source.read_window(x0, y0, x1 - x0, y1 - y0, bands),
+                                          gray_range=gray_range)
+                mask = rasterize_polygon(points, y1 - y0, x1 - x0, origin=(x0, y0))
+                selected = features[mask]
+                if len(selected) > max_per_class:
+                    selected = selected[rng.choice(len(selected), max_per_class, replace=False)]
+                samples.setdefault(poly.get('label', 'unknown'), []).append(selected)
+            source.close()
+        except Exception as e:
+            print(f"采样训练数据出错 {name}: {str(e)}")
+        if progress:
+            progress(done, len(names))
+
+    class_names = sorted(samples)
+    features = []
+    labels = []
+    for k, class_name in enumerate(class_names):
+        selected = np.concatenate(samples[class_name])
+        if len(selected) > max_per_class:
+            selected = selected[rng.choice(len(selected), max_per_class, replace=False)]
+        features.append(selected)
+        labels.append(np.full(len(selected), k, dtype=np.int32))
+    if not features:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int32), []
+    return np.concatenate(features), np.concatenate(labels), class_names
+
+
+def train_classifier(annotations_dir, image_dirs, model_path, label_colors=None, max_per_class=20000,
+                     progress=None):
+    """
+    用标注多边形训练分类器并保存
+
+    参数:
+        annotations_dir: 标注目录
+        image_dirs: 查找源图像的目录列表
+        model_path: 模型保存路径(.npz)
+        label_colors: 标签颜色字典 {label_name: color}
+        max_per_class: 每个类别最多使用的样本数
+        progress: 进度回调
+
+    返回:
+        {'model': 模型路径, 'classes': 类别名称列表, 'samples': 每类样本数}
+    """
+    features, labels, class_names = collect_training_samples(
+        annotations_dir, image_dirs, max_per_class, progress=progress)
+    if len(class_names) < 2:
+        raise ValueError("至少需要两个标签的标注才能训练分类器")
+
+    label_colors = label_colors or {}
+    colors = [label_colors.get(name, "#FF0000") for name in class_names]
+    model = GaussianNaiveBayes().fit(features, labels, class_names, colors)
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    model.save(model_path)
+    counts = np.bincount(labels, minlength=len(class_names))
+    return {'model': model_path, 'classes': class_names,
+            'samples': dict(zip(class_names, counts.tolist()))}
+
+
+# 工作进程中的数据源和模型，每个进程只打开一次
+_worker_source = None
+_worker_model = None
+_worker_bands = None
+_worker_gray_range = None
+_worker_cache = None
+_worker_namespace = None
+
+
+def _init_worker(image_path, model_path, gray_range, cache_root):
+    """工作进程初始化"""
+    global _worker_source, _worker_model, _worker_bands, _worker_gray_range, _worker_cache, _worker_namespace
+    _worker_source = RasterSource(image_path)
+    _worker_model = GaussianNaiveBayes.load(model_path)
+    _worker_bands = feature_bands(_worker_source.band_count)
+    _worker_gray_range = gray_range
+    _worker_cache = DiskTileCache(cache_root) if cache_root else None
+    _worker_namespace = feature_namespace(image_path)
+
+
+def _classify_tile(tile):
+    """在工作进程中对一个分块分类，特征优先从缓存读取"""
+    features = tile_features(_worker_source, tile, _worker_bands, _worker_gray_range,
+                             _worker_cache, _worker_namespace)
+    classes = _worker_model.predict(features)
+    if _worker_source.nodata is not None:
+        band = _worker_source.read_band(_worker_bands[0], tile.x, tile.y, tile.width, tile.height)
+        classes[band == _worker_source.nodata] = NO_CLASS
+    return tile, classes
+
+
+def classify_image(image_path, model_path, output_path, tile_size=FEATURE_TILE_SIZE, cache_root=None,
+                   workers=None, progress=None):
+    """
+    对整幅图像逐块分类，并保存类别栅格
+
+    参数:
+        image_path: 图像路径
+        model_path: 模型路径(.npz)
+        output_path: 类别栅格保存路径(.tif 或 .png)
+        tile_size: 分块大小，与 FEATURE_TILE_SIZE 相同时可以与纹理显示共用特征缓存
+        cache_root: 特征分块缓存目录，None表示不缓存
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        {'output': 输出路径, 'preview': 类别栅格预览, 'class_names': 类别名称, 'class_colors': 类别颜色}
+    """
+    model = GaussianNaiveBayes.load(model_path)
+    if model.means.shape[1] != len(FEATURE_NAMES):
+        raise ValueError("分类器使用的特征与当前版本不一致，请重新训练分类器")
+    source = RasterSource(image_path)
+    width, height = source.width, source.height
+    gray_range = feature_gray_range(source)
+    source.close()
+
+    tiles = list(iter_tiles(width, height, tile_size, feature_halo()))
+    workers = workers or os.cpu_count() or 1
+
+    # 结果逐块写入磁盘，内存中只保留有限大小的预览
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    writer = RasterWriter(output_path, width, height, reference_path=image_path, fill=NO_CLASS)
+    preview = PreviewBuilder(width, height, fill=NO_CLASS)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(image_path, model_path, gray_range, cache_root)) as pool:
+            for done, (tile, result) in enumerate(pool.map(_classify_tile, tiles, chunksize=4), start=1):
+                writer.write(tile.x, tile.y, result)
+                preview.add(tile.x, tile.y, result)
+                if progress:
+                    progress(done, len(tiles))
+    finally:
+        writer.close()
+
+    return {'output': output_path, 'preview': preview.array,
+            'class_names': model.class_names, 'class_colors': model.class_colors}
@@ -0,0 +1,172 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.raster_io import RasterSource, PreviewBuilder, iter_tiles
+from utils.tile_cache import DiskTileCache, source_key, tile_key
+
+# 支持的地形派生图层
+LAYERS = ("hillshade", "slope", "aspect", "curvature")
+
+# 3x3 差分只需要一个像素的重叠边
+HALO = 1
+
+
+def pad_to_halo(block, tile, halo=HALO):
+    """
+    在图像边界处用边缘值补齐重叠边，使每个分块都带有完整的 halo
+
+    参数:
+        block: 读取区域的数组
+        tile: Tile
+        halo: 重叠边宽度
+
+    返回:
+        补齐后的数组，大小为 (tile.height + 2 * halo, tile.width + 2 * halo)
+    """
+    top = halo - (tile.y - tile.read_y)
+    left = halo - (tile.x - tile.read_x)
+    bottom = halo - (tile.read_y + tile.read_height - tile.y - tile.height)
+    right = halo - (tile.read_x + tile.read_width - tile.x - tile.width)
+    if top or left or bottom or right:
+        block = np.pad(block, ((top, bottom), (left, right)), mode='edge')
+    return block
+
+
+def horn_gradient(z, cell_x, cell_y):
+    """
+    使用Horn方法计算带一个像素重叠边的高程块的梯度
+
+    参数:
+        z: (H + 2, W + 2) 高程数组
+        cell_x, cell_y: 像素尺寸
+
+    返回:
+        (dz_dx, dz_dy): (H, W) 数组，y 方向以北(行号减小)为正
+    """
+    # 3x3 邻域:  a b c / d e f / g h i
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cell_x)
+    dz_dy = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * cell_y)
+    return dz_dx, dz_dy
+
+
+def compute_layer(z, layer, cell_x, cell_y, azimuth=315.0, altitude=45.0, z_factor=1.0):
+    """
+    计算一个地形派生图层
+
+    参数:
+        z: (H + 2, W + 2) float32 高程数组(带一个像素重叠边)，无效值为NaN
+        layer: 图层名称，见 LAYERS
+        cell_x, cell_y: 像素尺寸
+        azimuth, altitude: 山体阴影的光源方位角和高度角(度)
+        z_factor: 高程缩放系数
+
+    返回:
+        (H, W) 数组：hillshade 为 uint8，其余为 float32(坡度和坡向单位为度)
+    """
+    z = z * np.float32(z_factor)
+    if layer == "curvature":
+        center = z[1:-1, 1:-1]
+        d2x = (z[1:-1, :-2] + z[1:-1, 2:] - 2 * center) / (cell_x * cell_x)
+        d2y = (z[:-2, 1:-1] + z[2:, 1:-1] - 2 * center) / (cell_y * cell_y)
+        # 与ArcGIS一致：正值为凸起，单位为 1/100 高程单位
+        return (-(d2x + d2y) * 100).astype(np.float32)
+
+    dz_dx, dz_dy = horn_gradient(z, cell_x, cell_y)
+    if layer == "slope":
+        return np.degrees(np.arctan(np.hypot(dz_dx, dz_dy))).astype(np.float32)
+    if layer == "aspect":
+        # 坡向为下坡方向，北为0度，顺时针
+        aspect = np.degrees(np.arctan2(-dz_dx, -dz_dy))
+        return np.mod(aspect, 360).astype(np.float32)
+    if layer == "hillshade":
+        slope = np.arctan(np.hypot(dz_dx, dz_dy))
+        aspect = np.arctan2(-dz_dx, -dz_dy)
+        zenith = np.radians(90.0 - altitude)
+        azimuth_rad = np.radians(azimuth)
+        shade = (np.cos(zenith) * np.cos(slope) +
+                 np.sin(zenith) * np.sin(slope) * np.cos(azimuth_rad - aspect))
+        shade = np.clip(shade * 255, 0, 255)
+        return np.nan_to_num(shade, nan=0).astype(np.uint8)
+    raise ValueError(f"未知的地形图层: {layer}")
+
+
+# 工作进程中的数据源
+_worker_source = None
+_worker_cache = None
+_worker_namespace = None
+
+
+def _init_worker(dem_path, cache_root, namespace):
+    """工作进程初始化"""
+    global _worker_source, _worker_cache, _worker_namespace
+    _worker_source = RasterSource(dem_path)
+    _worker_cache = DiskTileCache(cache_root) if cache_root else None
+    _worker_namespace = namespace
+
+
+def _derive_tile(args):
+    """在工作进程中计算一个分块，优先使用缓存"""
+    tile, layer = args
+    if _worker_cache is not None:
+        cached = _worker_cache.get(_worker_namespace, tile_key(tile))
+        if cached is not None:
+            return tile, cached
+
+    source = _worker_source
+    block = source.read_band(1, tile.read_x, tile.read_y, tile.read_width, tile.read_height)
+    z = pad_to_halo(block.astype(np.float32), tile)
+    if source.nodata is not None:
+        z[z == np.float32(source.nodata)] = np.nan
+    cell_x, cell_y = source.pixel_size
+    result = compute_layer(z, layer, cell_x, cell_y)
+
+    if _worker_cache is not None:
+        _worker_cache.put(_worker_namespace, tile_key(tile), result)
+    return tile, result
+
+
+def derive_layer(dem_path, layer, cache_root=None, tile_size=1024, max_preview=4096,
+                 workers=None, progress=None):
+    """
+    逐块计算DEM的地形派生图层，生成显示用的预览
+
+    分块带有一个像素的重叠边，结果与整幅计算一致、没有接缝；
+    整幅结果不会同时驻留内存，每个分块的完整分辨率结果缓存在磁盘上。
+
+    参数:
+        dem_path: DEM文件路径(使用第1波段)
+        layer: 图层名称，见 LAYERS
+        cache_root: 分块缓存目录，None表示不缓存
+        tile_size: 分块大小
+        max_preview: 预览的最大边长
+        workers: 工作进程数，默认为CPU核数
+        progress: 进度回调 progress(已完成分块数, 分块总数)
+
+    返回:
+        (H', W') 预览数组：hillshade 为 uint8，其余为 float32(无效值为NaN)
+    """
+    if layer not in LAYERS:
+        raise ValueError(f"未知的地形图层: {layer}")
+    source = RasterSource(dem_path)
+    width, height = source.width, source.height
+    source.close()
+
+    namespace = f"{source_key(dem_path)}/{layer}"
+    tiles = list(iter_tiles(width, height, tile_size, HALO))
+    dtype = np.uint8 if layer == "hillshade" else np.float32
+    preview = PreviewBuilder(width, height, max_preview, dtype=dtype, fill=0 if dtype == np.uint8 else np.nan)
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dem_path, cache_root, namespace)) as pool:
+        jobs = ((tile, layer) for tile in tiles)
+        for done, (tile, result) in enumerate(pool.map(_derive_tile, jobs, chunksize=2), start=1):
+            preview.add(tile.x, tile.y, result)
+            if progress:
+                progress(done, len(tiles))
+    return preview.array
@@ -0,0 +1,134 @@
+import numpy as np
+
+# GLCM 灰度量化级数
+GLCM_LEVELS = 8
+
+# GLCM 纹理特征名称，与 glcm_features 的输出通道顺序一致
+GLCM_NAMES = ("contrast", "homogeneity", "correlation", "energy", "entropy")
+
+
+def box_sum(array, radius):
+    """
+    使用积分图计算方形窗口内的和，计算量与窗口大小无关
+
+    积分图按边缘值补齐后，窗口四角的取值都是补齐数组的切片视图，不需要按索引复制；
+    边界处窗口裁剪到图像内。
+
+    参数:
+        array: (H, W) 数组
+        radius: 窗口半径
+
+    返回:
+        (H, W) float64 数组
+    """
+    array = np.asarray(array, dtype=np.float64)
+    height, width = array.shape
+    integral = np.zeros((height + 1, width + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(array, axis=0), axis=1, out=integral[1:, 1:])
+    # padded[k] 对应 integral[clip(k - radius, 0, H)]
+    padded = np.pad(integral, ((radius, radius + 1), (radius, radius + 1)), mode='edge')
+    size = 2 * radius + 1
+    return (padded[size:size + height, size:size + width] - padded[:height, size:size + width]
+            - padded[size:size + height, :width] + padded[:height, :width])
+
+
+def box_counts(height, width, radius):
+    """每个像素的窗口裁剪到图像内之后包含的像素数 (H, W)"""
+    rows = np.arange(height)
+    cols = np.arange(width)
+    row_counts = np.minimum(rows + radius + 1, height) - np.maximum(rows - radius, 0)
+    col_counts = np.minimum(cols + radius + 1, width) - np.maximum(cols - radius, 0)
+    return row_counts[:, None] * col_counts[None, :]
+
+
+def quantize(gray, gray_range, levels=GLCM_LEVELS):
+    """
+    将灰度按固定范围量化为 0..levels-1
+
+    参数:
+        gray: 灰度数组
+        gray_range: (min, max) 灰度范围，整幅图像使用同一范围保证分块之间一致
+        levels: 量化级数
+
+    返回:
+        int16 数组
+    """
+    low, high = gray_range
+    scale = levels / max(float(high) - float(low), 1e-12)
+    return np.clip(((gray - low) * scale).astype(np.int64), 0, levels - 1).astype(np.int16)
+
+
+def _pair_maps(quantized):
+    """水平和竖直方向(距离1)的相邻像素对，不存在的对用 -1 标记"""
+    height, width = quantized.shape
+    pairs = []
+    for dy, dx in ((0, 1), (1, 0)):
+        first = np.full((height, width), -1, dtype=np.int16)
+        second = np.full((height, width), -1, dtype=np.int16)
+        first[:height - dy, :width - dx] = quantized[:height - dy, :width - dx]
+        second[:height - dy, :width - dx] = quantized[dy:, dx:]
+        pairs.append((first, second))
+    return pairs
+
+
+def glcm_features(quantized, radius, levels=GLCM_LEVELS):
+    """
+    计算滑动窗口内的对称GLCM统计量
+
+    窗口内的灰度共生矩阵合并水平和竖直两个方向(距离1)。每个统计量都由若干张
+    逐像素的对值图做窗口求和得到：对比度、同质性和相关性只需要几次窗口求和，
+    能量和熵对每个无序灰度对做一次窗口求和，计算量都与窗口大小无关。
+
+    参数:
+        quantized: (H, W) 量化后的灰度，取值 0..levels-1
+        radius: 窗口半径
+        levels: 量化级数
+
+    返回:
+        (H, W, 5) float32 数组，通道顺序见 GLCM_NAMES
+    """
+    height, width = quantized.shape
+    pairs = _pair_maps(quantized)
+
+    def pair_sum(func):
+        """对所有有效像素对的 func(i, j) 做窗口求和"""
+        total = np.zeros((height, width), dtype=np.float64)
+        for first, second in pairs:
+            valid = first >= 0
+            values = np.where(valid, func(first.astype(np.float64), second.astype(np.float64)), 0.0)
+            total += box_sum(values, radius)
+        return total
+
+    count = pair_sum(lambda i, j: np.ones_like(i))
+    count = np.maximum(count, 1.0)
+    contrast = pair_sum(lambda i, j: (i - j) ** 2) / count
+    homogeneity = pair_sum(lambda i, j: 1.0 / (1.0 + (i - j) ** 2)) / count
+
+    # 对称GLCM的边缘分布相同：均值和方差由 i、j 两侧合并计算
+    mean = pair_sum(lambda i, j: i + j) / (2 * count)
+    variance = pair_sum(lambda i, j: i * i + j * j) / (2 * count) - mean * mean
+    cross = pair_sum(lambda i, j: i * j) / count
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.where(variance > 1e-9, (cross - mean * mean) / variance, 1.0)
+
+    # 能量和熵：无序灰度对 {a, b} 在窗口中的次数 U，
+    # 对称GLCM中 P(a, a) = U / n，P(a, b) = P(b, a) = U / 2n (a < b)
+    codes = [np.where(first >= 0, np.minimum(first, second) * levels + np.maximum(first, second), -1)
+             for first, second in pairs]
+    energy = np.zeros((height, width), dtype=np.float64)
+    entropy = np.zeros((height, width), dtype=np.float64)
+    present = np.unique(np.concatenate([code.ravel() for code in codes]))
+    for code in present[present >= 0].tolist():
+        a, b = divmod(code, levels)
+        occurrences = sum(box_sum(c == code, radius) for c in codes)
+        if a == b:
+            p = occurrences / count
+            energy += p * p
+        else:
+            p = occurrences / (2 * count)
+            energy += 2 * p * p
+        with np.errstate(divide='ignore', invalid='ignore'):
+            term = np.where(p > 0, p * np.log(p), 0.0)
+        entropy -= term if a == b else 2 * term
+
+    return np.stack([contrast, homogeneity, correlation, energy, entropy], axis=2).astype(np.float32)
@@ -0,0 +1,169 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+
+def source_key(path):
+    """
+    根据文件路径、修改时间和大小生成数据源标识，文件变化后缓存自动失效
+
+    参数:
+        path: 源文件路径
+
+    返回:
+        16位十六进制字符串
+    """
+    stat = os.stat(path)
+    text = f"{os.path.abspath(path)}|{stat.st_mtime}|{stat.st_size}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def default_cache_bytes():
+    """
+    磁盘分块缓存的默认大小上限：环境变量 TERRAIN_TILE_CACHE_MB，未设置时为4GB
+
+    返回:
+        字节数
+    """
+    value = os.environ.get("TERRAIN_TILE_CACHE_MB")
+    if value:
+        return int(float(value) * 1024 * 1024)
+    return 4 * 1024 ** 3
+
+
+class DiskTileCache:
+    """磁盘分块缓存，每个分块保存为一个 .npy 文件
+
+    总大小超过上限时按最近使用顺序删除分块：读取时更新文件的修改时间，写入一定数量后扫描缓存目录，
+    删除修改时间最早的文件。多个进程共用同一目录时各自检查，被删除的分块读取时视为不存在。
+    """
+
+    CHECK_FRACTION = 16  # 每写入上限的 1/16 检查一次总大小
+    EVICT_TO = 0.9  # 超出上限时删除到上限的这个比例，避免每次写入都触发
+
+    def __init__(self, root, max_bytes=None):
+        """初始化缓存
+
+        参数:
+            root: 缓存根目录
+            max_bytes: 缓存总大小上限(字节)，默认见 default_cache_bytes
+        """
+        self.root = root
+        self.max_bytes = default_cache_bytes() if max_bytes is None else max_bytes
+        self._unchecked = None  # 上次检查后写入的字节数，None表示本实例还没有检查过
+
+    def path(self, namespace, key, suffix=".npy"):
+        """分块文件路径"""
+        return os.path.join(self.root, namespace, f"{key}{suffix}")
+
+    def get(self, namespace, key):
+        """
+        读取分块
+
+        参数:
+            namespace: 命名空间(如 "<数据源标识>/hillshade")
+            key: 分块键(如 "x_y_w_h")
+
+        返回:
+            数组，不存在时返回None
+        """
+        path = self.path(namespace, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            array = np.load(path)
+        except Exception:
+            return None
+        self._touch(path)
+        return array
+
+    def put(self, namespace, key, array):
+        """原子地写入分块"""
+        self._write(self.path(namespace, key), lambda f: np.save(f, array))
+
+    def get_bytes(self, namespace, key, suffix):
+        """
+        读取已编码的分块(如PNG)
+
+        返回:
+            bytes，不存在时返回None
+        """
+        path = self.path(namespace, key, suffix)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(path)
+        return data
+
+    def put_bytes(self, namespace, key, suffix, data):
+        """原子地写入已编码的分块"""
+        self._write(self.path(namespace, key, suffix), lambda f: f.write(data))
+
+    @staticmethod
+    def _touch(path):
+        """标记分块刚被使用"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _write(self, path, write):
+        """先写临时文件再替换，并发读取时不会读到写了一半的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            write(f)
+            nbytes = f.tell()
+        os.replace(temp_path, path)
+        self._wrote(nbytes)
+
+    def _wrote(self, nbytes):
+        """累计写入的字节数，本实例第一次写入和之后每写入上限的 1/CHECK_FRACTION 时检查总大小"""
+        if self._unchecked is not None:
+            self._unchecked += nbytes
+            if self._unchecked < self.max_bytes // self.CHECK_FRACTION:
+                return
+        self._unchecked = 0
+        self.evict()
+
+    def evict(self):
+        """
+        总大小超过上限时删除最久未使用的分块
+
+        返回:
+            删除的字节数
+        """
+        files = []
+        total = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+        freed = 0
+        for _, size, path in sorted(files):
+            if total - freed <= self.max_bytes * self.EVICT_TO:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
+
+
+def tile_key(tile):
+    """分块在缓存中的键"""
+    return f"{tile.x}_{tile.y}_{tile.width}_{tile.height}"
@@ -0,0 +1,513 @@
+import io
+import os
+import json
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import numpy as np
+
+from utils.batch import list_rasters, load_image_annotation, stem
+from utils.geometry import polygons_intersecting_rect
+from utils.raster_io import RasterSource
+from utils.render import display_bands, read_display_level
+from utils.annotation_io import annotation_path
+from utils.tile_cache import DiskTileCache, source_key
+
+# 瓦片大小(像素)
+TILE_SIZE = 256
+
+# 降采样步长不超过该值时直接从原图读取，更粗的级别由下一级的4个瓦片合成
+DIRECT_READ_STEP = 8
+
+# 瓦片服务提供的图像扩展名(导入的GeoTIFF和裁剪得到的PNG)
+SERVE_EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg')
+
+
+def encode_png(array):
+    """将 (H, W, 4) uint8 数组编码为PNG"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    # 瓦片很小，低压缩级别编码更快，文件大小差别不大
+    Image.fromarray(np.ascontiguousarray(array), 'RGBA').save(buffer, 'PNG', compress_level=3)
+    return buffer.getvalue()
+
+
+def decode_png(data):
+    """将PNG解码为 (H, W, 4) uint8 数组"""
+    from PIL import Image
+    return np.asarray(Image.open(io.BytesIO(data)).convert('RGBA'))
+
+
+def finish_tile(tile, width, height):
+    """
+    设置瓦片的透明度：图像覆盖的 (width, height) 区域不透明，其余透明
+
+    透明区域的颜色用边缘像素补齐，上一级合成时图像边缘不会混入黑色。
+    """
+    tile[:height, width:, :3] = tile[:height, width - 1:width, :3]
+    tile[height:, :, :3] = tile[height - 1:height, :, :3]
+    tile[:, :, 3] = 0
+    tile[:height, :width, 3] = 255
+    return tile
+
+
+class MemoryTileCache:
+    """线程安全的内存瓦片缓存，按最近使用顺序淘汰，总大小不超过上限"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """初始化
+
+        参数:
+            max_bytes: 缓存总大小上限(字节)
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles = OrderedDict()  # {键: bytes}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """读取瓦片，不存在时返回None"""
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        """写入瓦片"""
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self.nbytes -= len(previous)
+            self._tiles[key] = data
+            self.nbytes += len(data)
+            while len(self._tiles) > 1 and self.nbytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+
+class Scene:
+    """提供瓦片的一幅图像
+
+    级别 max_zoom 为原始分辨率，每降低一级分辨率减半；瓦片坐标以图像左上角为原点(像素坐标系，不做地图投影)。
+    数据源保持打开，读取时加锁(GDAL数据集不能被多个线程同时读取)。
+    """
+
+    def __init__(self, name, path):
+        """打开图像
+
+        参数:
+            name: 场景名称(URL中使用)
+            path: 图像路径
+        """
+        self.name = name
+        self.path = path
+        self.key = source_key(path)
+        self.source = RasterSource(path)
+        self.width, self.height = self.source.width, self.source.height
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.width, self.height) / TILE_SIZE)))
+        # 与界面显示一致：按整幅图像的取值范围拉伸，单波段调色板图像按调色板着色
+        self.colormap = self.source.color_table() if self.source.band_count == 1 else None
+        self.ranges = [self.source.band_range(band) for band in display_bands(self.source)]
+        self.lock = threading.Lock()
+
+    def step(self, z):
+        """级别 z 相对原始分辨率的降采样步长"""
+        return 2 ** (self.max_zoom - z)
+
+    def level_size(self, z):
+        """级别 z 下图像的 (宽, 高)"""
+        step = self.step(z)
+        return -(-self.width // step), -(-self.height // step)
+
+    def contains(self, z, x, y):
+        """瓦片是否在图像范围内"""
+        if not 0 <= z <= self.max_zoom:
+            return False
+        width, height = self.level_size(z)
+        return 0 <= x < -(-width // TILE_SIZE) and 0 <= y < -(-height // TILE_SIZE)
+
+    def valid_size(self, z, x, y):
+        """瓦片中图像覆盖的 (宽, 高)，其余部分透明"""
+        width, height = self.level_size(z)
+        return min(TILE_SIZE, width - x * TILE_SIZE), min(TILE_SIZE, height - y * TILE_SIZE)
+
+    def read_tile(self, z, x, y):
+        """
+        直接从原图读取一个瓦片
+
+        返回:
+            (TILE_SIZE, TILE_SIZE, 4) uint8 数组
+        """
+        step = self.step(z)
+        x0, y0 = x * TILE_SIZE * step, y * TILE_SIZE * step
+        width = min(TILE_SIZE * step, self.width - x0)
+        height = min(TILE_SIZE * step, self.height - y0)
+        with self.lock:
+            rgb = read_display_level(self.source, x0, y0, width, height, step, self.ranges, self.colormap)
+        tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        tile[:rgb.shape[0], :rgb.shape[1], :3] = rgb
+        return finish_tile(tile, rgb.shape[1], rgb.shape[0])
+
+    def compose_tile(self, z, x, y, children):
+        """
+        由下一级的4个瓦片合成一个瓦片(2x2均值)
+
+        参数:
+            children: {(dx, dy): (TILE_SIZE, TILE_SIZE, 4) 数组}，图像范围外的子瓦片可以缺省
+
+        返回:
+            (TILE_SIZE, TILE_SIZE, 4) uint8 数组
+        """
+        mosaic = np.zeros((TILE_SIZE * 2, TILE_SIZE * 2, 3), dtype=np.float32)
+        for (dx, dy), child in children.items():
+            mosaic[dy * TILE_SIZE:(dy + 1) * TILE_SIZE, dx * TILE_SIZE:(dx + 1) * TILE_SIZE] = child[:, :, :3]
+        tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        tile[:, :, :3] = np.rint(mosaic.reshape(TILE_SIZE, 2, TILE_SIZE, 2, 3).mean(axis=(1, 3)))
+        return finish_tile(tile, *self.valid_size(z, x, y))
+
+    def close(self):
+        """关闭数据源"""
+        with self.lock:
+            self.source.close()
+
+
+class TileRenderer:
+    """生成并缓存瓦片
+
+    瓦片依次从内存缓存、磁盘缓存读取，都没有时生成；同一瓦片同时被多个请求需要时只生成一次。
+    影像瓦片写入磁盘缓存(命名空间包含数据源标识，文件变化后自动失效)；标注叠加层生成很快，只缓存在内存中。
+    """
+
+    def __init__(self, paths, annotations_dir=None, cache_root=None, memory_bytes=256 * 1024 * 1024,
+                 extensions=SERVE_EXTENSIONS):
+        """初始化
+
+        参数:
+            paths: 图像文件或目录列表，目录中的图像在请求时重新扫描
+            annotations_dir: 标注目录，None表示不提供标注叠加层
+            cache_root: 磁盘瓦片缓存目录，None表示只使用内存缓存
+            memory_bytes: 内存缓存大小上限(字节)
+            extensions: 目录中要提供的图像扩展名
+        """
+        self.paths = list(paths)
+        self.annotations_dir = annotations_dir
+        self.disk = DiskTileCache(cache_root) if cache_root else None
+        self.memory = MemoryTileCache(memory_bytes)
+        self.extensions = extensions
+        self.scenes = {}  # {名称: Scene}
+        self._names = {}  # {名称: 路径}
+        self._annotations = {}  # {标注文件路径: (标注文件标识, 打包的标注)}
+        self._inflight = {}  # {瓦片键: Future}
+        self._lock = threading.Lock()
+        self._scene_lock = threading.Lock()  # 打开场景需要统计取值范围，单独加锁，不阻塞其他瓦片请求
+        self.rescan()
+
+    def rescan(self):
+        """重新扫描图像列表，文件名(不含扩展名)相同时依次加序号"""
+        names = {}
+        for path in self.paths:
+            for file_path in list_rasters(path, self.extensions) if os.path.isdir(path) else [path]:
+                name = base = stem(file_path)
+                suffix = 2
+                while name in names:
+                    name = f"{base}-{suffix}"
+                    suffix += 1
+                names[name] = os.path.abspath(file_path)
+        with self._lock:
+            self._names = names
+        return names
+
+    def scene(self, name):
+        """
+        获取场景，文件变化后重新打开
+
+        返回:
+            Scene，不存在时返回None
+        """
+        path = self._names.get(name)
+        if path is None or not os.path.exists(path):
+            # 可能是新裁剪的图像，重新扫描一次
+            path = self.rescan().get(name)
+            if path is None or not os.path.exists(path):
+                return None
+        with self._scene_lock:
+            scene = self.scenes.get(name)
+            if scene is not None and scene.path == path and scene.key == source_key(path):
+                return scene
+            if scene is not None:
+                scene.close()
+            scene = self.scenes[name] = Scene(name, path)
+            return scene
+
+    def index(self):
+        """场景列表(用于 / 请求)"""
+        scenes = []
+        for name in sorted(self.rescan()):
+            try:
+                scene = self.scene(name)
+            except Exception:
+                continue
+            if scene is None:
+                continue
+            entry = {
+                'name': name,
+                'path': scene.path,
+                'width': scene.width,
+                'height': scene.height,
+                'minzoom': 0,
+                'maxzoom': scene.max_zoom,
+                'tile_size': TILE_SIZE,
+                'tiles': f"/{quote(name)}/{{z}}/{{x}}/{{y}}.png",
+            }
+            if self.annotations_dir:
+                entry['annotations'] = f"/{quote(name)}/annotations/{{z}}/{{x}}/{{y}}.png"
+            scenes.append(entry)
+        return {'scenes': scenes}
+
+    def _cached(self, key, produce):
+        """从内存缓存读取瓦片，没有时调用 produce() 生成，同一键的并发请求共享一次生成"""
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            data = produce()
+            self.memory.put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def image_etag(self, scene, z, x, y):
+        """影像瓦片的ETag，数据源变化后改变"""
+        return f'"{scene.key}-{z}-{x}-{y}"'
+
+    def image_tile(self, scene, z, x, y):
+        """
+        获取影像瓦片的PNG
+
+        参数:
+            scene: Scene
+            z, x, y: 瓦片坐标(需在图像范围内)
+        """
+        namespace = f"{scene.key}/xyz"
+        tile_key = f"{z}_{x}_{y}"
+
+        def produce():
+            if self.disk is not None:
+                data = self.disk.get_bytes(namespace, tile_key, ".png")
+                if data is not None:
+                    return data
+            if scene.step(z) <= DIRECT_READ_STEP:
+                tile = scene.read_tile(z, x, y)
+            else:
+                children = {}
+                for dy in (0, 1):
+                    for dx in (0, 1):
+                        cx, cy = x * 2 + dx, y * 2 + dy
+                        if scene.contains(z + 1, cx, cy):
+                            children[(dx, dy)] = decode_png(self.image_tile(scene, z + 1, cx, cy))
+                tile = scene.compose_tile(z, x, y, children)
+            data = encode_png(tile)
+            if self.disk is not None:
+                self.disk.put_bytes(namespace, tile_key, ".png", data)
+            return data
+
+        return self._cached((scene.key, 'image', z, x, y), produce)
+
+    def annotation(self, scene):
+        """
+        获取场景的标注(标注文件变化后重新读取)，坐标已换算为源图像像素
+
+        返回:
+            (标注文件标识, (coords, offsets, labels, colors))，没有标注时为 (None, None)
+        """
+        if not self.annotations_dir:
+            return None, None
+        path = annotation_path(self.annotations_dir, scene.path)
+        if not os.path.exists(path):
+            return None, None
+        key = source_key(path)
+        cached = self._annotations.get(path)
+        if cached is None or cached[0] != key:
+            cached = self._annotations[path] = (key, load_image_annotation(
+                self.annotations_dir, scene.path, (scene.width, scene.height)))
+        return cached
+
+    def annotation_etag(self, scene, z, x, y):
+        """标注叠加层瓦片的ETag，图像或标注文件变化后改变"""
+        key, _ = self.annotation(scene)
+        return f'"{scene.key}-{key or "none"}-a{z}-{x}-{y}"'
+
+    def annotation_tile(self, scene, z, x, y):
+        """获取标注叠加层瓦片的PNG(透明背景，绘制多边形轮廓)"""
+        key, annotation = self.annotation(scene)
+
+        def produce():
+            from PIL import Image, ImageDraw
+            image = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+            if annotation is not None:
+                coords, offsets, _, colors = annotation
+                step = scene.step(z)
+                x0, y0 = x * TILE_SIZE * step, y * TILE_SIZE * step
+                # 外扩一个线宽，跨瓦片的轮廓在边缘处也能画完整
+                margin = 2 * step
+                rect = (x0 - margin, y0 - margin, x0 + TILE_SIZE * step + margin, y0 + TILE_SIZE * step + margin)
+                draw = ImageDraw.Draw(image)
+                for index in sorted(polygons_intersecting_rect(coords, offsets, rect)):
+                    points = (coords[offsets[index]:offsets[index + 1]] - (x0, y0)) / step
+                    outline = [tuple(point) for point in points.tolist()]
+                    draw.line(outline + outline[:1], fill=colors[index], width=2)
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG', compress_level=3)
+            return buffer.getvalue()
+
+        return self._cached((scene.key, 'annotations', key, z, x, y), produce)
+
+    def close(self):
+        """关闭所有数据源"""
+        with self._scene_lock:
+            for scene in self.scenes.values():
+                scene.close()
+            self.scenes.clear()
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """瓦片请求处理
+
+    路由:
+        /                               场景列表(JSON)
+        /{场景}/{z}/{x}/{y}.png           影像瓦片
+        /{场景}/annotations/{z}/{x}/{y}.png 标注叠加层瓦片
+        /{z}/{x}/{y}.png                 只有一个场景时的简写
+    """
+
+    server_version = "TerrainTileServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_tile_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_tile_request(send_body=False)
+
+    def handle_tile_request(self, send_body):
+        """解析请求路径并返回瓦片或场景列表"""
+        renderer = self.server.renderer
+        parts = [unquote(part) for part in urlsplit(self.path).path.split('/') if part]
+        try:
+            if not parts:
+                body = json.dumps(renderer.index(), ensure_ascii=False, indent=2).encode('utf-8')
+                self.send_bytes(body, "application/json; charset=utf-8", None, send_body)
+                return
+            if len(parts) == 3:
+                names = renderer.rescan()
+                if len(names) != 1:
+                    self.send_error(404, explain="有多个场景时需要在路径中指定场景名称")
+                    return
+                parts = list(names) + parts
+            layer = 'image'
+            if len(parts) == 5 and parts[1] == 'annotations':
+                layer = 'annotations'
+                parts = [parts[0]] + parts[2:]
+            if len(parts) != 4 or not parts[3].endswith('.png'):
+                self.send_error(404, explain="无效的瓦片路径")
+                return
+            try:
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+            except ValueError:
+                self.send_error(404, explain="无效的瓦片坐标")
+                return
+            scene = renderer.scene(parts[0])
+            if scene is None:
+                self.send_error(404, explain=f"没有找到场景: {parts[0]}")
+                return
+            if not scene.contains(z, x, y):
+                self.send_error(404, explain="瓦片超出图像范围")
+                return
+            if layer == 'annotations':
+                etag = renderer.annotation_etag(scene, z, x, y)
+            else:
+                etag = renderer.image_etag(scene, z, x, y)
+            # 客户端缓存的瓦片仍然有效时不重新生成
+            if self.etag_matches(etag):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                return
+            if layer == 'annotations':
+                body = renderer.annotation_tile(scene, z, x, y)
+            else:
+                body = renderer.image_tile(scene, z, x, y)
+            self.send_bytes(body, "image/png", etag, send_body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.log_error("生成瓦片失败 %s: %s", self.path, f"{type(e).__name__}: {str(e)}")
+            self.send_error(500, explain="生成瓦片失败")
+
+    def etag_matches(self, etag):
+        """If-None-Match 中是否包含该ETag"""
+        header = self.headers.get("If-None-Match")
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+    def send_bytes(self, body, content_type, etag, send_body):
+        """发送响应"""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if etag:
+            self.send_header("ETag", etag)
+            # 每次都向服务器确认，文件变化后客户端能立即看到新瓦片；未变化时只返回304
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        """只在详细模式下记录每个请求"""
+        if self.server.verbose:
+            super().log_request(code, size)
+
+
+class TileServer(ThreadingHTTPServer):
+    """多线程瓦片服务器，每个连接一个线程"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, renderer, verbose=False):
+        """初始化
+
+        参数:
+            address: (主机, 端口)
+            renderer: TileRenderer
+            verbose: 是否记录每个请求
+        """
+        self.renderer = renderer
+        self.verbose = verbose
+        super().__init__(address, TileRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.renderer.close()
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+
+class _NullSpan:
+    """跟踪关闭时使用的空跨度，进入和退出都不做任何事"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """一个计时跨度，结束时记录为 Chrome trace 的完整事件(ph='X')"""
+
+    __slots__ = ('tracer', 'name', 'args', 'start', 'child_time', 'children')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.child_time = 0.0  # 直接子跨度的总耗时
+        self.children = {}  # 顶层跨度：{后代跨度名称: 累计自身耗时(不含其子跨度)}
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        stack = self.tracer._stack()
+        stack.pop()
+        duration = end - self.start
+        if stack:
+            # 按自身耗时汇总到顶层跨度，各阶段的耗时之和等于顶层跨度的总耗时
+            stack[-1].child_time += duration
+            root = stack[0]
+            self_time = duration - self.child_time
+            root.children[self.name] = root.children.get(self.name, 0.0) + self_time
+        self.tracer._finish(self, duration, not stack)
+        return False
+
+    def set(self, **args):
+        """添加跨度参数(如文件名、像素数)"""
+        self.args = dict(self.args or {}, **args)
+
+
+class Tracer:
+    """轻量的跨度和计数器记录器，可导出为 Chrome trace-event JSON(chrome://tracing、Perfetto)
+
+    关闭时 span() 直接返回共享的空跨度，开销只有一次属性判断。
+    事件保存在有上限的队列中，长时间运行也不会无限增长。
+    """
+
+    def __init__(self, max_events=200000):
+        """初始化
+
+        参数:
+            max_events: 保留的最大事件数，超过后丢弃最早的事件
+        """
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.listeners = []  # 主线程的顶层跨度结束时调用 listener(名称, 秒数, {后代跨度: 自身秒数})
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._main_thread = threading.main_thread()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        """当前线程的未结束跨度栈"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _timestamp(self, seconds):
+        """相对起点的微秒数"""
+        return (seconds - self._origin) * 1e6
+
+    def span(self, name, **args):
+        """
+        计时一段代码
+
+        用法:
+            with tracer.span("gdal.read", band=1):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args or None)
+
+    def traced(self, name=None):
+        """函数装饰器形式的 span()，默认以函数名作为跨度名称"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, span_name, None):
+                    return func(*args, **kwargs)
+
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        """累加计数器，记录为 Chrome trace 的计数事件(ph='C')"""
+        if not self.enabled:
+            return
+        with self._lock:
+            total = self._counters[name] = self._counters.get(name, 0) + value
+        self.events.append({'name': name, 'ph': 'C', 'ts': self._timestamp(time.perf_counter()),
+                            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': {name: total}})
+
+    def _finish(self, span, duration, is_root):
+        """记录结束的跨度，主线程的顶层跨度通知监听者"""
+        event = {'name': span.name, 'ph': 'X', 'ts': self._timestamp(span.start), 'dur': duration * 1e6,
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if span.args:
+            event['args'] = span.args
+        self.events.append(event)
+        if is_root and threading.current_thread() is self._main_thread:
+            for listener in list(self.listeners):
+                listener(span.name, duration, dict(span.children))
+
+    def set_enabled(self, enabled):
+        """开启或关闭跟踪"""
+        self.enabled = bool(enabled)
+
+    def clear(self):
+        """清空已记录的事件和计数器"""
+        self.events.clear()
+        with self._lock:
+            self._counters.clear()
+
+    def stage_totals(self):
+        """
+        按名称汇总已记录跨度的耗时
+
+        返回:
+            {名称: (次数, 总秒数)}，按总耗时从大到小排序
+        """
+        totals = {}
+        for event in list(self.events):
+            if event['ph'] != 'X':
+                continue
+            count, total = totals.get(event['name'], (0, 0.0))
+            totals[event['name']] = (count + 1, total + event['dur'] / 1e6)
+        return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
+
+    def export_chrome_trace(self, path):
+        """
+        导出为 Chrome trace-event JSON
+
+        参数:
+            path: 输出文件路径
+
+        返回:
+            导出的事件数
+        """
+        events = list(self.events)
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': "terrain_recognition_app"}}]
+        for thread in threading.enumerate():
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+                             'args': {'name': thread.name}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return len(events)
+
+
+def format_breakdown(name, duration, children, limit=5):
+    """
+    将顶层跨度的耗时拆分格式化为一行文字，"其他"为顶层跨度自身(不属于任何子阶段)的耗时
+
+    返回:
+        如 "load_image 1150ms: png_roundtrip 900 · display_image 200 · 其他 50"
+    """
+    parts = sorted(children.items(), key=lambda item: -item[1])
+    text = f"{name} {duration * 1000:.0f}ms"
+    if not parts:
+        return text
+    shown = [f"{child} {seconds * 1000:.0f}" for child, seconds in parts[:limit]]
+    other = duration - sum(children.values())
+    if other * 1000 >= 1:
+        shown.append(f"其他 {other * 1000:.0f}")
+    return f"{text}: " + " · ".join(shown)
+
+
+# 全局跟踪器，设置环境变量 TERRAIN_TRACE=1 时启动即开启
+tracer = Tracer()
+tracer.set_enabled(os.environ.get("TERRAIN_TRACE", "") not in ("", "0"))
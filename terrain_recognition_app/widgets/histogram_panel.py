@@ -0,0 +1,187 @@
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QColor, QPen, QPolygonF, QBrush
+from PyQt5.QtCore import Qt, QPointF, QRectF, pyqtSignal
+
+
+class HistogramPanel(QWidget):
+    """原始数值直方图，拖动黑点(窗口下限)和白点(窗口上限)调整拉伸
+
+    拖动黑点或白点时移动该端，在两点之间拖动时整体平移窗口。直方图按对数高度绘制，
+    叠加显示当前窗口和伽马对应的映射曲线。
+    """
+
+    windowChanged = pyqtSignal(float, float)  # 拖动中窗口变化 (下限, 上限)
+    windowCommitted = pyqtSignal()  # 松开鼠标，调整结束
+
+    MARGIN = 6  # 左右留白，端点拖到两端时仍可见
+    HANDLE_PICK = 6  # 距离端点多少像素以内可以拖动该端点
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(90)
+        self.histograms = []  # [(Histogram, QColor)]
+        self.value_range = (0.0, 255.0)  # 横轴范围
+        self.window = (0.0, 255.0)
+        self.gamma = 1.0
+        self.dragging = None  # 'low'、'high'、'both' 或 None
+        self.drag_origin = None  # 开始平移时的 (横坐标, 窗口)
+        self._polygons = None  # 按当前宽度计算的直方图轮廓缓存
+        self._polygon_key = None
+
+    def set_histograms(self, histograms, colors, value_range):
+        """
+        设置要显示的直方图
+
+        参数:
+            histograms: Histogram 列表
+            colors: 各直方图的 QColor
+            value_range: 横轴的 (最小值, 最大值)
+        """
+        self.histograms = list(zip(histograms, colors))
+        low, high = value_range
+        self.value_range = (low, high) if high > low else (low, low + 1.0)
+        self._polygons = None
+        self.update()
+
+    def set_window(self, low, high, gamma):
+        """设置端点位置和伽马值(不发出信号)"""
+        self.window = (low, high)
+        self.gamma = gamma
+        self.update()
+
+    def value_to_x(self, value):
+        low, high = self.value_range
+        return self.MARGIN + (value - low) / (high - low) * (self.width() - 2 * self.MARGIN)
+
+    def x_to_value(self, x):
+        low, high = self.value_range
+        span = max(1, self.width() - 2 * self.MARGIN)
+        return low + (x - self.MARGIN) / span * (high - low)
+
+    def column_heights(self, histogram, columns):
+        """
+        每个像素列对应数值区间内每个直方图区间的平均像素数
+
+        参数:
+            histogram: Histogram
+            columns: 列数
+
+        返回:
+            (columns,) float 数组
+        """
+        counts = histogram.counts
+        edges = np.array([self.x_to_value(self.MARGIN + i) for i in range(columns + 1)])
+        index = (edges - histogram.start) / histogram.bin_width
+        lower = np.floor(index[:-1]).astype(np.int64)
+        upper = np.maximum(np.ceil(index[1:]).astype(np.int64), lower + 1)
+        inside = (upper > 0) & (lower < len(counts))
+        lower = np.clip(lower, 0, len(counts) - 1)
+        upper = np.clip(upper, lower + 1, len(counts))
+        cumulative = np.concatenate([[0], np.cumsum(counts, dtype=np.float64)])
+        heights = (cumulative[upper] - cumulative[lower]) / (upper - lower)
+        return np.where(inside, heights, 0.0)
+
+    def polygons(self):
+        """按当前大小计算各直方图的填充轮廓，大小和数据不变时使用缓存"""
+        key = (self.width(), self.height())
+        if self._polygons is not None and self._polygon_key == key:
+            return self._polygons
+        columns = max(1, self.width() - 2 * self.MARGIN)
+        bottom = self.height() - 1
+        heights = [np.log1p(self.column_heights(histogram, columns)) for histogram, _ in self.histograms]
+        peak = max([h.max() for h in heights] + [1e-9])
+        self._polygons = []
+        for (_, color), height in zip(self.histograms, heights):
+            points = [QPointF(self.MARGIN, bottom)]
+            for i, value in enumerate(height):
+                points.append(QPointF(self.MARGIN + i + 0.5, bottom - value / peak * (bottom - 4)))
+            points.append(QPointF(self.MARGIN + columns, bottom))
+            self._polygons.append((QPolygonF(points), color))
+        self._polygon_key = key
+        return self._polygons
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(250, 250, 250) if self.isEnabled() else QColor(235, 235, 235))
+        if not self.histograms:
+            painter.setPen(QColor(128, 128, 128))
+            painter.drawText(self.rect(), Qt.AlignCenter, "导入GeoTIFF后显示直方图")
+            return
+        painter.setRenderHint(QPainter.Antialiasing)
+        for polygon, color in self.polygons():
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QBrush(color))
+            painter.drawPolygon(polygon)
+
+        height = self.height()
+        low_x, high_x = self.value_to_x(self.window[0]), self.value_to_x(self.window[1])
+        # 窗口外的部分显示为纯黑或纯白，加灰色遮罩提示
+        painter.fillRect(QRectF(0, 0, max(0.0, low_x), height), QColor(0, 0, 0, 40))
+        painter.fillRect(QRectF(high_x, 0, max(0.0, self.width() - high_x), height), QColor(0, 0, 0, 40))
+
+        # 映射曲线：窗口下限映射为0，上限映射为255
+        painter.setPen(QPen(QColor(230, 120, 0), 1))
+        painter.setBrush(Qt.NoBrush)
+        curve = QPolygonF()
+        for i in range(33):
+            t = i / 32
+            curve.append(QPointF(low_x + (high_x - low_x) * t, height - 1 - t ** (1.0 / self.gamma) * (height - 4)))
+        painter.drawPolyline(curve)
+
+        for x, fill in ((low_x, QColor(0, 0, 0)), (high_x, QColor(255, 255, 255))):
+            painter.setPen(QPen(QColor(60, 60, 60), 1, Qt.DashLine))
+            painter.drawLine(QPointF(x, 0), QPointF(x, height))
+            painter.setPen(QPen(QColor(60, 60, 60), 1))
+            painter.setBrush(fill)
+            painter.drawPolygon(QPolygonF([QPointF(x, height - 10), QPointF(x - 5, height), QPointF(x + 5, height)]))
+
+    def resizeEvent(self, event):
+        self._polygons = None
+        super().resizeEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton or not self.histograms:
+            return
+        x = event.pos().x()
+        low_x, high_x = self.value_to_x(self.window[0]), self.value_to_x(self.window[1])
+        if abs(x - low_x) <= self.HANDLE_PICK and abs(x - low_x) <= abs(x - high_x):
+            self.dragging = 'low'
+        elif abs(x - high_x) <= self.HANDLE_PICK:
+            self.dragging = 'high'
+        elif low_x < x < high_x:
+            self.dragging = 'both'
+            self.drag_origin = (x, self.window)
+        else:
+            # 点击窗口外侧时最近的端点直接跳到该位置
+            self.dragging = 'low' if x < low_x else 'high'
+            self.move_handle(x)
+
+    def mouseMoveEvent(self, event):
+        if self.dragging:
+            self.move_handle(event.pos().x())
+
+    def mouseReleaseEvent(self, event):
+        if self.dragging:
+            self.dragging = None
+            self.windowCommitted.emit()
+
+    def move_handle(self, x):
+        """把正在拖动的端点(或整个窗口)移到横坐标 x 处并发出信号"""
+        range_low, range_high = self.value_range
+        # 两端至少相隔一个像素列对应的数值
+        gap = (range_high - range_low) / max(1, self.width() - 2 * self.MARGIN)
+        low, high = self.window
+        if self.dragging == 'low':
+            low = min(max(self.x_to_value(x), range_low), high - gap)
+        elif self.dragging == 'high':
+            high = max(min(self.x_to_value(x), range_high), low + gap)
+        else:
+            origin_x, (origin_low, origin_high) = self.drag_origin
+            shift = self.x_to_value(x) - self.x_to_value(origin_x)
+            shift = min(max(shift, range_low - origin_low), range_high - origin_high)
+            low, high = origin_low + shift, origin_high + shift
+        if (low, high) != self.window:
+            self.window = (low, high)
+            self.update()
+            self.windowChanged.emit(low, high)
@@ -0,0 +1,88 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget,
+                             QTableWidgetItem, QPushButton, QLabel, QHeaderView)
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt
+
+
+class LabelStatsPanel(QDialog):
+    """标注统计面板，从标签索引读取数据，不扫描标注文件"""
+
+    COLUMNS = ["标签", "图像数", "多边形数", "总面积(像素)", "平均覆盖率"]
+
+    def __init__(self, label_index, label_colors=None, parent=None):
+        """初始化统计面板
+
+        参数:
+            label_index: LabelIndex 实例
+            label_colors: 标签颜色字典 {label_name: color}
+            parent: 父窗口
+        """
+        super().__init__(parent)
+        self.label_index = label_index
+        self.label_colors = label_colors or {}
+        self.setWindowTitle("标注统计")
+        self.resize(560, 360)
+
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+
+        buttons_layout = QHBoxLayout()
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.refresh)
+        buttons_layout.addWidget(refresh_btn)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.close)
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+
+        self.populate()
+
+    def refresh(self):
+        """增量刷新索引并重新显示"""
+        self.label_index.refresh()
+        self.populate()
+
+    def populate(self):
+        """用索引中的统计数据填充表格"""
+        stats = self.label_index.label_stats()
+
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(stats))
+        for row, stat in enumerate(stats):
+            name_item = QTableWidgetItem(stat['label'])
+            color = self.label_colors.get(stat['label'])
+            if color:
+                name_item.setBackground(QColor(color))
+                if QColor(color).lightness() < 128:
+                    name_item.setForeground(Qt.white)
+            self.table.setItem(row, 0, name_item)
+
+            coverage = stat['mean_coverage']
+            values = [
+                stat['images'],
+                stat['polygons'],
+                round(stat['area'], 1),
+                f"{coverage * 100:.2f}%" if coverage is not None else "-",
+            ]
+            for col, value in enumerate(values, start=1):
+                item = QTableWidgetItem()
+                item.setData(Qt.DisplayRole, value)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+        self.table.setSortingEnabled(True)
+
+        total_polygons = sum(stat['polygons'] for stat in stats)
+        total_area = sum(stat['area'] for stat in stats)
+        self.summary.setText(
+            f"已索引 {len(self.label_index.files)} 个标注文件 | "
+            f"标签 {len(stats)} 个 | 多边形 {total_polygons} 个 | 总面积 {total_area:.0f} 像素"
+        )
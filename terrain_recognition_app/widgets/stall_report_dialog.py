@@ -0,0 +1,140 @@
+import time
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QPushButton, QLabel, QHeaderView, QPlainTextEdit, QSplitter, QFileDialog,
+                             QMessageBox)
+from PyQt5.QtCore import Qt
+
+
+class StallReportDialog(QDialog):
+    """界面卡顿报告：按处理函数汇总的卡顿时长、每次卡顿的记录和最耗时的调用栈"""
+
+    HANDLER_COLUMNS = ["处理函数", "卡顿次数", "总时长(ms)", "最长(ms)"]
+    EPISODE_COLUMNS = ["时间", "时长(ms)", "处理函数"]
+
+    def __init__(self, detector, parent=None):
+        """初始化报告窗口
+
+        参数:
+            detector: StallDetector 实例
+            parent: 父窗口
+        """
+        super().__init__(parent)
+        self.detector = detector
+        self.episodes = []
+        self.setWindowTitle("界面卡顿分析")
+        self.resize(820, 560)
+
+        layout = QVBoxLayout(self)
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.handler_table = self.create_table(self.HANDLER_COLUMNS)
+        splitter.addWidget(self.handler_table)
+        self.episode_table = self.create_table(self.EPISODE_COLUMNS)
+        self.episode_table.itemSelectionChanged.connect(self.show_episode_stacks)
+        splitter.addWidget(self.episode_table)
+        self.stack_view = QPlainTextEdit()
+        self.stack_view.setReadOnly(True)
+        self.stack_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.stack_view.setPlaceholderText("选择一次卡顿查看采样到的调用栈")
+        splitter.addWidget(self.stack_view)
+        layout.addWidget(splitter)
+
+        buttons_layout = QHBoxLayout()
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.populate)
+        buttons_layout.addWidget(refresh_btn)
+        export_btn = QPushButton("导出火焰图数据")
+        export_btn.setToolTip("导出折叠栈文件，可用 flamegraph.pl、speedscope 等工具查看")
+        export_btn.clicked.connect(self.export_collapsed)
+        buttons_layout.addWidget(export_btn)
+        clear_btn = QPushButton("清除")
+        clear_btn.clicked.connect(self.clear)
+        buttons_layout.addWidget(clear_btn)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.close)
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+
+        self.populate()
+
+    @staticmethod
+    def create_table(columns):
+        """创建只读表格"""
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    @staticmethod
+    def set_row(table, row, values):
+        """填充一行，数值右对齐"""
+        for col, value in enumerate(values):
+            item = QTableWidgetItem()
+            item.setData(Qt.DisplayRole, value)
+            if not isinstance(value, str):
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            table.setItem(row, col, item)
+
+    def populate(self):
+        """用检测器的统计数据填充表格"""
+        handlers = self.detector.handler_summary()
+        self.handler_table.setSortingEnabled(False)
+        self.handler_table.setRowCount(len(handlers))
+        for row, (name, count, total, longest) in enumerate(handlers):
+            self.set_row(self.handler_table, row, [name, count, round(total * 1000), round(longest * 1000)])
+        self.handler_table.setSortingEnabled(True)
+
+        # 最近的卡顿在最上面
+        self.episodes = list(self.detector.episodes)[::-1]
+        self.episode_table.setRowCount(len(self.episodes))
+        for row, episode in enumerate(self.episodes):
+            started = time.strftime('%H:%M:%S', time.localtime(episode.started))
+            self.set_row(self.episode_table, row, [started, round(episode.duration * 1000), episode.handler])
+
+        total = sum(episode.duration for episode in self.episodes)
+        self.summary.setText(
+            f"卡顿阈值 {self.detector.threshold * 1000:.0f}ms，共记录 {len(self.episodes)} 次卡顿，"
+            f"总计 {total:.2f} 秒"
+        )
+        self.stack_view.clear()
+
+    def show_episode_stacks(self):
+        """显示选中卡顿中各调用栈的耗时，从最内层的函数开始"""
+        rows = self.episode_table.selectionModel().selectedRows()
+        if not rows:
+            return
+        episode = self.episodes[rows[0].row()]
+        lines = []
+        for stack, seconds in sorted(episode.stacks.items(), key=lambda item: -item[1])[:20]:
+            frames = stack.split(";")
+            lines.append(f"{seconds * 1000:.0f} ms")
+            lines.extend(f"    {frame}" for frame in reversed(frames))
+            lines.append("")
+        self.stack_view.setPlainText("\n".join(lines))
+
+    def export_collapsed(self):
+        """导出整个会话的折叠栈"""
+        if not self.detector.stacks:
+            QMessageBox.information(self, "提示", "还没有记录到界面卡顿")
+            return
+        default_name = time.strftime("stalls_%Y%m%d_%H%M%S.folded")
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出火焰图数据", default_name,
+                                                   "折叠栈 (*.folded *.txt);;所有文件 (*)")
+        if not file_path:
+            return
+        try:
+            count = self.detector.export_collapsed(file_path)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"导出失败: {str(e)}")
+            return
+        QMessageBox.information(self, "提示", f"已导出 {count} 个调用栈")
+
+    def clear(self):
+        """清空会话统计"""
+        self.detector.clear()
+        self.populate()